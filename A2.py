@@ -1,15 +1,59 @@
 from connect import *
+import xUWRoiUtilities as ru
 from System.Drawing import Color
 from System.Windows.Forms import (
     Application, Form, Label, Button, CheckBox, ComboBox, DockStyle
 )
 
-# Load current case and patient
-case = get_current("Case")
-patient = get_current("Patient")
+CHUNK_SIZE = 20  # ROIs written per CompositeAction; the form is redrawn and the Cancel button handled between chunks
+
+
+def select_rois(rois, selected, classifier=None):
+    """Return the ROIs whose type class (see ru.roi_classifier) is selected, e.g. {'target': True, 'oar': False, 'support': False,
+    'other': False}. Independent of the form, so the selection can be tested and timed without it."""
+    classifier = classifier or ru.roi_classifier()
+    return [roi for roi in rois if selected.get(classifier.type_class(roi.Type))]
+
+
+def visualization_settings(is_visible, show_drr, mode_2d, mode_3d):
+    """The {property path: value} written to every selected ROI."""
+    return {'RoiVisualizationSettings.IsVisible': is_visible,
+            'RoiVisualizationSettings.ShowDRRContours': show_drr,
+            'RoiVisualizationSettings.VisualizationMode2D': mode_2d,
+            'RoiVisualizationSettings.VisualizationMode3D': mode_3d}
+
+
+def update_visualization(case, patient, rois, settings, chunk_size=CHUNK_SIZE, progress=None, cancelled=None):
+    """Write settings to rois in chunks of chunk_size ROIs, each chunk in one CompositeAction, and save the patient once at the end if
+    anything was written. progress(done, total) is called after each chunk and the update stops between chunks when cancelled()
+    returns True. Returns the ru.RoiWriter (written, skipped and failed counts) and the number of ROIs processed."""
+    writer = ru.RoiWriter(case)
+    done = 0
+    for start in range(0, len(rois), chunk_size):
+        if cancelled is not None and cancelled():
+            break
+        chunk = rois[start:start + chunk_size]
+        for roi in chunk:
+            writer.set_all(roi, settings)
+        writer.apply('Change ROI visualization (%i-%i)' % (start + 1, start + len(chunk)))
+        done += len(chunk)
+        if progress is not None:
+            progress(done, len(rois))
+    print(f"Change ROI visualization: {writer.written} writes, {writer.skipped} unchanged skipped, {len(writer.failed)} failed")
+    for roi_name, path, e in writer.failed:
+        print(f"Error applying settings to {roi_name}: {e}")
+    if writer.written:
+        patient.Save()
+    return writer, done
+
 
 class RoiViewerForm(Form):
-    def __init__(self):
+    def __init__(self, case, patient):
+        self.case = case
+        self.patient = patient
+        self.applying = False
+        self.cancel_requested = False
+        self.close_requested = False
         self.Text = "Change ROI Visualization"
         self.Width = 400
         self.Height = 350
@@ -35,75 +79,106 @@ class RoiViewerForm(Form):
         self.mode3d_combo.Items.AddRange(["Solid", "Wireframe", "None"])
         self.mode3d_combo.SelectedIndex = 0
 
-        # Apply button
-        self.apply_button = Button(Text="Apply", Left=150, Top=200, Width=100)
+        # Apply and cancel buttons
+        self.apply_button = Button(Text="Apply", Left=90, Top=200, Width=100)
         self.apply_button.Click += self.apply_settings
+        self.cancel_button = Button(Text="Cancel", Left=210, Top=200, Width=100, Enabled=False)
+        self.cancel_button.Click += self.cancel_apply
 
         # Status label
         self.status_label = Label(Text="", Left=20, Top=240, Width=340, Height=40)
 
+        self.FormClosing += self.form_closing
+
         # Add all controls to the form
         for control in [
             self.all_rois_check, self.target_check, self.oar_check,
             self.other_check, self.support_check, self.visibility_check,
             self.drr_check, self.mode2d_label, self.mode2d_combo,
             self.mode3d_label, self.mode3d_combo, self.apply_button,
-            self.status_label
+            self.cancel_button, self.status_label
         ]:
             self.Controls.Add(control)
 
     def apply_settings(self, sender, event):
+        if self.applying:
+            return
         try:
-            count = 0
-
             process_all = self.all_rois_check.Checked
-            process_targets = self.target_check.Checked or process_all
-            process_oars = self.oar_check.Checked or process_all
-            process_other = self.other_check.Checked or process_all
-            process_support = self.support_check.Checked or process_all
-
-            is_visible = self.visibility_check.Checked
-            show_drr = self.drr_check.Checked
-            mode_2d = self.mode2d_combo.SelectedItem
-            mode_3d = self.mode3d_combo.SelectedItem
-
-            target_keywords = ['target', 'ptv', 'ctv', 'gtv']
-            oar_keywords = ['organ', 'organ at risk', 'oar']
-            support_keywords = ['support']
-
-            for roi in case.PatientModel.RegionsOfInterest:
-                roi_name = roi.Name
-                roi_type = roi.Type.lower()
-
-                should_process = (
-                    process_all or
-                    (process_targets and any(k in roi_type for k in target_keywords)) or
-                    (process_oars and any(k in roi_type for k in oar_keywords)) or
-                    (process_support and any(k in roi_type for k in support_keywords)) or
-                    (process_other and not any(k in roi_type for k in target_keywords + oar_keywords + support_keywords))
-                )
-
-                if not should_process:
-                    continue
-
-                try:
-                    vis = roi.RoiVisualizationSettings
-                    vis.IsVisible = is_visible
-                    vis.ShowDRRContours = show_drr
-                    vis.VisualizationMode2D = mode_2d
-                    vis.VisualizationMode3D = mode_3d
-                    count += 1
-                except Exception as e:
-                    print(f"Error applying settings to {roi_name}: {e}")
-
-            patient.Save()
-            self.status_label.Text = f"Successfully updated {count} ROIs!"
-            self.status_label.ForeColor = Color.Green
-
+            selected = {'target': self.target_check.Checked or process_all,
+                        'oar': self.oar_check.Checked or process_all,
+                        'support': self.support_check.Checked or process_all,
+                        'other': self.other_check.Checked or process_all}
+            settings = visualization_settings(self.visibility_check.Checked, self.drr_check.Checked,
+                                              self.mode2d_combo.SelectedItem, self.mode3d_combo.SelectedItem)
+            rois = select_rois(self.case.PatientModel.RegionsOfInterest, selected)
         except Exception as e:
             self.status_label.Text = f"Error: {str(e)}"
             self.status_label.ForeColor = Color.Red
+            return
+
+        # The RayStation writes stay on this (the UI) thread. Messages are pumped between chunks, so the form is redrawn and the
+        # Cancel button and closing the form are handled; both stop the update after the current chunk.
+        self.applying = True
+        self.cancel_requested = False
+        self.apply_button.Enabled = False
+        self.cancel_button.Enabled = True
+        self.status_label.Text = f"Updating {len(rois)} ROIs..."
+        self.status_label.ForeColor = Color.Black
+        Application.DoEvents()
+        writer = None
+        try:
+            writer, done = update_visualization(self.case, self.patient, rois, settings, progress=self.apply_progress,
+                                                cancelled=lambda: self.cancel_requested)
+        except Exception as e:
+            self.status_label.Text = f"Error: {str(e)}"
+            self.status_label.ForeColor = Color.Red
+        finally:
+            self.applying = False
+            self.apply_button.Enabled = True
+            self.cancel_button.Enabled = False
+        if self.close_requested:
+            # The form was closed during the update; close it now that the chunks written so far are saved.
+            self.Close()
+            return
+        if writer is None:
+            return
+
+        changes = f"({writer.written} changes, {writer.skipped} unchanged)"
+        if done < len(rois):
+            self.status_label.Text = f"Cancelled after {done} ROIs {changes}"
+            self.status_label.ForeColor = Color.DarkOrange
+        else:
+            self.status_label.Text = f"Successfully updated {done} ROIs! {changes}"
+            self.status_label.ForeColor = Color.Green
 
-# Run the form
-form = RoiViewerForm()
-Application.Run(form)
+    def apply_progress(self, done, total):
+        self.status_label.Text = f"Updating ROIs... {done}/{total} ({100 * done // max(total, 1)}%)"
+        Application.DoEvents()
+
+    def cancel_apply(self, sender, event):
+        if self.applying:
+            self.cancel_requested = True
+            self.cancel_button.Enabled = False
+            self.status_label.Text = "Cancelling after the current ROIs..."
+
+    def form_closing(self, sender, event):
+        # Keep the form (and Application.Run) open until the update has stopped at the next chunk and saved the chunks already
+        # written. apply_settings() closes it.
+        if self.applying:
+            event.Cancel = True
+            self.close_requested = True
+            self.cancel_requested = True
+            self.apply_button.Enabled = False
+            self.cancel_button.Enabled = False
+            self.status_label.Text = "Closing after the current ROIs..."
+
+
+if __name__ == '__main__':
+    # Load current case and patient
+    case = get_current("Case")
+    patient = get_current("Patient")
+
+    # Run the form
+    form = RoiViewerForm(case, patient)
+    Application.Run(form)
@@ -23,89 +23,113 @@
 #              01 July 2019 (v1.02)     - Rewrote for Raystation 8.1.1.2. Output file only has patient name to avoid 'Delete' in plan document name if pdfs are brought in in wrong order.
 #              17 October 2019 (v1.03)  - Turns beam contours off so they are not included in the axial printout.
 #              11/22/23                 - Updated to run in RS2023B. Still needs to be clinically validated. -AJE
+#              10/19/2026               - Images are rendered offline from the plan total dose (xUWDoseRendering) when OFFLINE_RENDERING is True,
+#                                         so composite reports no longer need the dummy plan. Set to False to use GetDoseImages.
+#              10/19/2026               - Vectorized process_dose(). Long fields (e.g. CSI) are reported with sagittal and coronal sweeps, see SWEEPS.
+#              10/19/2026               - get_current is imported from xUWInterop so the report can be traced (set XUW_TRACE).
+#              10/19/2026               - OFFLINE_RENDERING is off by default. Offline reports require a 'Reference Value' colour map for every plan.
 # -------------------------------------------------------------------------------
 
-from connect import get_current
+from xUWInterop import get_current
 import xUWScriptingUtilities as su
 from System import Windows
+import numpy as np
 
+OFFLINE_RENDERING = False  # Render slice images locally instead of through BeamSet.GetDoseImages. Off until its interop cost has been measured in RayStation.
+SWEEPS = None  # Report orientations, e.g. ['Transversal', 'Sagittal', 'Coronal']. None selects automatically, see report_sweeps().
+LONG_FIELD_LENGTH = 40  # cm
 
-def process_dose(plan, dosearray, margin=1):
-    """Composite dose report specific function. It converts a dosearray into a python list, then finds the location of the maximum dose and it's value,
-    and determines all slices with dose > 15% of the maximum calculated dose."""
 
-    # Retrieve Dose Grid Paramaters
+def dose_volume(plan, dosearray):
+    """Reshape a flat dose array into a [z, y, x] numpy volume. Returns the volume and the dose grid corner and voxel size as (x, y, z) tuples."""
     dose_grid = plan.BeamSets[0].FractionDose.InDoseGrid
     corner, numvx, voxsz = dose_grid.Corner, dose_grid.NrVoxels, dose_grid.VoxelSize
-    x0, y0, z0 = corner.x, corner.y, corner.z
-    xn, yn, zn = numvx.x, numvx.y, numvx.z
-    xr, yr, zr = voxsz.x, voxsz.y, voxsz.z
+    dose = np.asarray(dosearray, dtype=float).reshape(numvx.z, numvx.y, numvx.x)
+    return dose, (corner.x, corner.y, corner.z), (voxsz.x, voxsz.y, voxsz.z)
 
-    # Convert Dose Array to Python Datatype
-    doseli = list(dosearray.flatten())
+
+def dose_ranges(profile, origin, spacing, margin=1, threshold=0.15, gap=3):
+    """Convert a profile of the maximum relative dose per slice into [(start, stop), ...] coordinates of the runs of slices above threshold.
+    A margin is added to each run and runs separated by less than gap (cm) are merged to provide continuity for nearby targets."""
+    above = np.concatenate(([False], profile > threshold, [False]))
+    edges = np.flatnonzero(above[1:] != above[:-1])
+    start = origin + spacing * edges[0::2] - margin
+    stop = origin + spacing * np.minimum(edges[1::2], len(profile) - 1) + margin
+    keep = np.flatnonzero(start[1:] - stop[:-1] >= gap)
+    start = start[np.concatenate(([0], keep + 1))] if len(start) else start
+    stop = stop[np.concatenate((keep, [len(stop) - 1]))] if len(stop) else stop
+    return list(zip(start.tolist(), stop.tolist()))
+
+
+def process_dose(plan, dosearray):
+    """Composite dose report specific function. It converts a dosearray into a numpy volume, then finds the location of the maximum dose and it's value.
+    The slices with dose above threshold are determined by report_sweeps()."""
+    dose, (x0, y0, z0), (xr, yr, zr) = dose_volume(plan, dosearray)
 
     # Find Magnitude and Location of Max Dose
-    max_dose = max(doseli)
-    max_dose_i = doseli.index(max_dose)
-    md_x, md_y, md_z = max_dose_i % (xn), int(max_dose_i % (xn * yn) / xn), int(
-        max_dose_i / (xn * yn))
+    md_z, md_y, md_x = np.unravel_index(np.argmax(dose), dose.shape)
+    max_dose = float(dose[md_z, md_y, md_x])
     md_x, md_y, md_z = x0 + (md_x + 0.5) * xr, y0 + (md_y + 0.5) * yr, z0 + (
             md_z + 0.5) * zr  # Convert indices to coordinates. Add half a voxel width to generate the center of the voxel and not the corner.
-
-    # Find maximum dose per slice and determine whether it is greater than 15% of the global maximum dose.
-    max_slice_dose = [max(doseli[i * xn * yn:i * xn * yn + xn * yn - 1]) for i in range(zn)]
-    max_slice_dose = [each / max_dose for each in max_slice_dose]
-    max_slice_dose = [float(each) > 0.15 for each in max_slice_dose]
-
-    # Find start/stop locations for report printout based on slices above threshold.
-    start, stop = [], []
-    trueflag = False
-    for i, v in enumerate(max_slice_dose):
-        if v is True and trueflag is False:
-            start.append(i)
-            trueflag = True
-        if v is False and trueflag is True:
-            stop.append(i)
-            trueflag = False
-    if trueflag is True:  # Make sure there is a final stop point.
-        stop.append(i)
-    start = [z0 + zr * each - 1 for each in
-             start]  # Convert indices into coordinates, add a margin.
-    stop = [z0 + zr * each + 1 for each in stop]
-    remove = []
-    ### Remove small gaps (<3cm) to provide continuity for nearby targets.
-    for i, v in enumerate(start):
-        if i == 0:
-            continue
-        distance = v - stop[i - 1]
-        if distance < 3:
-            remove.append(i)
-    remove.reverse()
-    for each in remove:
-        del start[i]
-        del stop[i - 1]
-    assert len(start) == len(
-        stop), "Start and stop lists are not the same length, probable bug in automatic start stop determination."
-    startstop = [(start[i], stop[i]) for i in range(len(start))]
-    return startstop, max_dose, md_x, md_y, md_z
+    return max_dose, md_x, md_y, md_z
+
+
+def dose_sweeps(plan, dosearray, margin=1):
+    """Determine the slice report ranges for every orientation using the maximum dose per transversal slice (z), per sagittal
+    column (x) and per coronal row (y). Returns a startstopfocus dict for generate_slice_report(), where the sagittal and
+    coronal images are centred on the dose above threshold."""
+    dose, (x0, y0, z0), (xr, yr, zr) = dose_volume(plan, dosearray)
+    max_dose = dose.max()
+    z_ranges = dose_ranges(dose.max(axis=(1, 2)) / max_dose, z0, zr, margin)
+    y_ranges = dose_ranges(dose.max(axis=(0, 2)) / max_dose, y0, yr, margin)
+    x_ranges = dose_ranges(dose.max(axis=(0, 1)) / max_dose, x0, xr, margin)
+    centre_x = (x_ranges[0][0] + x_ranges[-1][1]) / 2.
+    centre_y = (y_ranges[0][0] + y_ranges[-1][1]) / 2.
+    centre_z = (z_ranges[0][0] + z_ranges[-1][1]) / 2.
+    return {'Transversal': [[start, stop, 0, 0] for start, stop in z_ranges],
+            'Sagittal': [[start, stop, centre_y, centre_z] for start, stop in x_ranges],
+            'Coronal': [[start, stop, centre_x, centre_z] for start, stop in y_ranges]}
+
+
+def report_sweeps(plan, dosearray):
+    """Select the slice report orientations. Transversal images are used unless the dose extends over more than LONG_FIELD_LENGTH
+    cm (e.g. CSI), in which case sagittal and coronal sweeps are used instead."""
+    sweeps = dose_sweeps(plan, dosearray)
+    orientations = SWEEPS
+    if orientations is None:
+        length = sum(stop - start for start, stop, f1, f2 in sweeps['Transversal'])
+        orientations = ['Sagittal', 'Coronal'] if length > LONG_FIELD_LENGTH else ['Transversal']
+    return {each: sweeps[each] for each in orientations}
 
 
 def run_dose_report(patient, case, plan):
     exam = plan.BeamSets[0].PatientSetup.OfTreatmentSetup.GetPlanningExamination()
 
+    if OFFLINE_RENDERING:
+        # The offline levels are computed from the colour map ReferenceValue, so a relative colour map is refused for every plan.
+        dcm = case.CaseSettings.DoseColorMap
+        if dcm.ColorMapReferenceType != "ReferenceValue":
+            Windows.MessageBox.Show(
+                "The isodose display 100%s definition must be based on 'Reference Value' for offline dose reports but is currently '%s'.\nPlease set to 'Reference Value' and check that entered value is appropriate for the dose distribution. Exiting script." % (
+                    '%', dcm.ColorMapReferenceType))
+            return False
+        dose = plan.TreatmentCourse.TotalDose.DoseValues.DoseData
+        max_dose, md_x, md_y, md_z = process_dose(plan, dose)
+        su.generate_slice_report(startstopfocus=report_sweeps(plan, dose),
+                                 maxdose=[round(max_dose), md_x, md_y, md_z],
+                                 offline_dose=(dose, plan.GetTotalDoseGrid()))
+        return True
+
     if plan.BeamSets.Count == 1:
         dose = plan.TreatmentCourse.TotalDose.DoseValues.DoseData
-        startstop, max_dose, md_x, md_y, md_z = process_dose(plan, dose)
-        startstop = [[each[0], each[1], 0, 0] for each in startstop]
-        for i, v in enumerate(startstop):
-            if v[0] > v[1]:  # Start should be less than stop.
-                startstop[i][0], startstop[i][1] = startstop[i][1], startstop[i][0]
+        max_dose, md_x, md_y, md_z = process_dose(plan, dose)
         plan.BeamSets[0].EditShowBeamVisualization(ShowBeams=False, ShowContour=False,
                                                    ShowCenterLine=False,
                                                    ShowBeamsFromAllBeamSets=False,
                                                    ShowIsocenterNames=False)  # Turn off and result in no beams in plan document?
-        su.generate_slice_report(startstopfocus=startstop,
-                                 maxdose=[round(max_dose), md_x, md_y, md_z])
+        su.generate_slice_report(startstopfocus=report_sweeps(plan, dose),
+                                 maxdose=[round(max_dose), md_x, md_y, md_z],
+                                 hotspot_dose=(dose, plan.GetTotalDoseGrid()))
         plan.BeamSets[0].EditShowBeamVisualization(ShowBeams=True, ShowContour=False,
                                                    ShowCenterLine=False,
                                                    ShowBeamsFromAllBeamSets=False,
@@ -164,17 +188,14 @@ def run_dose_report(patient, case, plan):
             Dose=total_dose,
             CalculationInfo='Composite')
 
-        startstop, max_dose, md_x, md_y, md_z = process_dose(plan, total_dose)
-        startstop = [[each[0], each[1], 0, 0] for each in startstop]
-        for i, v in enumerate(startstop):
-            if v[0] > v[1]:  # Start should be less than stop
-                startstop[i][0], startstop[i][1] = startstop[i][1], startstop[i][0]
+        max_dose, md_x, md_y, md_z = process_dose(plan, total_dose)
 
         patient.Save()
         newplan.SetCurrent()
         su.generate_slice_report(
-            startstopfocus=startstop,
-            maxdose=[round(max_dose), md_x, md_y, md_z])
+            startstopfocus=report_sweeps(plan, total_dose),
+            maxdose=[round(max_dose), md_x, md_y, md_z],
+            hotspot_dose=(total_dose, dgparams))
         Windows.MessageBox.Show("Script complete. Please delete the automatically generated plan.")
 
     return True
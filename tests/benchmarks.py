@@ -0,0 +1,114 @@
+# Timings of the array kernels in xUWScriptingUtilities against the code they replaced, outside RayStation:
+#
+#     python tests/benchmarks.py geometry field_borders roi_classifier
+#
+# Scripting interface benchmarks (slice report, ROI setup, couch import, ...) are run with xUWStandIn.py.
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+import xUWStandIn
+
+xUWStandIn.install()
+
+import xUWScriptingUtilities as su
+
+
+def benchmark_geometry(n=1000000, orientation='HeadFirstSupine'):
+    """Time the batched geometry kernel against the list based functions for n random points. The list functions are timed on
+       10,000 points and scaled to n. Returns {name: (batched seconds, list seconds)}."""
+    rng = np.random.default_rng(0)
+    points = rng.uniform(-50, 50, (n, 3))
+    sample = points[:10000].tolist()
+    scale = n / float(len(sample))
+    cases = {'rot_vect': (lambda: su.rot_vects(points, 'y', 33.0), lambda: [su.rot_vect(each, 'y', 33.0) for each in sample]),
+             'cp': (lambda: su.cps(points, points[::-1]), lambda: [su.cp(a, b) for a, b in zip(sample, sample[::-1])]),
+             'dp': (lambda: su.dps(points, points[::-1]), lambda: [su.dp(a, b) for a, b in zip(sample, sample[::-1])]),
+             'cartesian_to_dicom': (lambda: su.cartesian_to_dicom_array(points, orientation),
+                                    lambda: su.cartesian_to_dicom(sample, orientation))}
+    result = {}
+    for name, (batched, listed) in cases.items():
+        t0 = time.perf_counter()
+        batched()
+        t1 = time.perf_counter()
+        listed()
+        t2 = time.perf_counter()
+        result[name] = (t1 - t0, (t2 - t1) * scale)
+    return result
+
+
+def report_geometry():
+    for name, (batched, listed) in benchmark_geometry().items():
+        print('%s: %.3f s batched, %.3f s list (1000000 points)' % (name, batched, listed))
+
+
+def benchmark_field_borders(beams=2, segments=180, numleaves=80):
+    """Time project_field_borders() for a synthetic VMAT beam set (beams arcs of segments control points). Returns seconds."""
+    rng = np.random.default_rng(0)
+    centres = su.leaf_centres(numleaves)
+    total = 0.0
+    for i in range(beams):
+        left = rng.uniform(-5, 0, (segments, numleaves))
+        right = left + rng.uniform(0, 5, (segments, numleaves))
+        jaws = np.tile([-5., 5., -10., 10.], (segments, 1))
+        t0 = time.perf_counter()
+        su.project_field_borders(left, right, jaws, centres, 30 * i, np.linspace(181, 179 + 360, segments) % 360, 0, 'HeadFirstSupine')
+        total += time.perf_counter() - t0
+    return total
+
+
+def report_field_borders(beams=2, segments=180, numleaves=80):
+    seconds = benchmark_field_borders(beams, segments, numleaves)
+    print('field borders, %i beams x %i segments x %i leaf pairs: %.4f s' % (beams, segments, numleaves, seconds))
+
+
+def benchmark_roi_classifier(n=10000, seed=0):
+    """Classify n synthetic ROI names and types with the RoiClassifier (first pass and memoized) and with the substring lists it
+       replaced. Returns {name: seconds}."""
+    rng = np.random.default_rng(seed)
+    stems = ['PTV', 'ptv', 'CTV', 'Ctv', 'GTV', 'iTV', 'Lung', 'Heart', 'Cord', 'Parotid', 'Couch', 'z_opt', 'Ring', 'Bowel']
+    types = ['Ptv', 'Ctv', 'Gtv', 'Organ', 'Support', 'External', 'Control', 'Avoidance']
+    rois = [('%s_%s%i' % (stems[a], stems[b].lower(), c), types[d]) for a, b, c, d in
+            zip(rng.integers(0, len(stems), n), rng.integers(0, len(stems), n), rng.integers(0, 80, n), rng.integers(0, len(types), n))]
+    name_check = [['PTV', 'ptv', 'Ptv'], ['CTV', 'ctv', 'Ctv'], ['GTV', 'gtv', 'Gtv', 'ITV', 'itv', 'Itv', 'iTV', 'GTV_ITV']]
+    keywords = [['target', 'ptv', 'ctv', 'gtv'], ['organ', 'organ at risk', 'oar'], ['support']]
+
+    def substrings():
+        for name, roi_type in rois:
+            [any(each in name for each in checks) for checks in name_check]
+            [any(k in roi_type.lower() for k in checks) for checks in keywords]
+
+    classifier = su.RoiClassifier(su.DEFAULT_ROI_CLASSES)
+    result = {}
+    for label, run in [('substring lists', substrings), ('classifier', lambda: classifier.classify(rois)),
+                       ('classifier, memoized', lambda: classifier.classify(rois))]:
+        t0 = time.perf_counter()
+        run()
+        result[label] = time.perf_counter() - t0
+    return result
+
+
+def report_roi_classifier(n=10000):
+    for label, seconds in benchmark_roi_classifier(n).items():
+        print('%s: %.4f s (%i ROIs)' % (label, seconds, n))
+
+
+BENCHMARKS = {'geometry': report_geometry, 'field_borders': report_field_borders, 'roi_classifier': report_roi_classifier}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Time the xUWScriptingUtilities array kernels.')
+    parser.add_argument('names', nargs='*', help='Benchmarks to run (default all): ' + ', '.join(sorted(BENCHMARKS)))
+    args = parser.parse_args(argv)
+    for name in args.names or sorted(BENCHMARKS):
+        BENCHMARKS[name]()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,11 @@
+# Runs the tests against the offline RayStation stand-in (xUWStandIn), which provides the 'connect' module and the .NET placeholders
+# xUWScriptingUtilities imports.
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import xUWStandIn
+
+xUWStandIn.install()
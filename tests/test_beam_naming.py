@@ -0,0 +1,48 @@
+# Beam names against the golden table beam_names.csv, which holds the names the original (v1.x) name_beam() gave on a 15 degree
+# gantry x couch grid plus float angles, for every patient orientation, with three corrections made on purpose: float angles are
+# named like ints (A30L, not A30.0L), FeetFirstDecubitusLeft axis names are used (the original tested FeetFirstDecubitusRight
+# twice) and translate_position() translates each letter (str.replace never matched). An empty name is an angle the original could
+# not name; name_beam() must raise for it.
+
+import csv
+import os
+
+import pytest
+
+import xUWScriptingUtilities as su
+
+GOLDEN = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'beam_names.csv')
+
+
+def golden_names():
+    """Return {orientation: [(gantry, couch, name or None)]} from beam_names.csv."""
+    with open(GOLDEN, newline='') as f:
+        rows = list(csv.DictReader(f))
+    return {orientation: [(float(row['gantry']), float(row['couch']), row[orientation] or None) for row in rows]
+            for orientation in su.PATIENT_ORIENTATIONS}
+
+
+GOLDEN_NAMES = golden_names()
+
+
+@pytest.mark.parametrize('orientation', su.PATIENT_ORIENTATIONS)
+def test_name_beam(orientation):
+    for gantry, couch, name in GOLDEN_NAMES[orientation]:
+        if name is None:
+            with pytest.raises(AssertionError):
+                su.name_beam(gantry, couch, orientation)
+        else:
+            assert su.name_beam(gantry, couch, orientation) == name, (gantry, couch)
+            if gantry == int(gantry) and couch == int(couch):
+                assert su.name_beam(int(gantry), int(couch), orientation) == name, (gantry, couch)
+
+
+@pytest.mark.parametrize('orientation', su.PATIENT_ORIENTATIONS)
+def test_name_beams(orientation):
+    named = [(gantry, couch, name) for gantry, couch, name in GOLDEN_NAMES[orientation] if name is not None]
+    names = su.name_beams([gantry for gantry, couch, name in named], [couch for gantry, couch, name in named], orientation)
+    assert names == [name for gantry, couch, name in named]
+
+
+def test_unique_beam_names():
+    assert su.unique_beam_names(['AP', 'AP', 'PA', 'AP']) == ['AP', 'AP_2', 'PA', 'AP_3']
@@ -0,0 +1,49 @@
+# Beam order optimization: exact and 2-opt orders on asymmetric transition times, and optimize_beam_order() on a stand-in beam set.
+
+import itertools
+
+import numpy as np
+import pytest
+
+import xUWScriptingUtilities as su
+import xUWStandIn
+
+
+def random_costs(n, seed):
+    costs = np.random.default_rng(seed).uniform(1, 60, (n, n))
+    np.fill_diagonal(costs, 0)
+    return costs
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_exact_order_is_optimal(seed):
+    costs = random_costs(6, seed)
+    best = min(su._order_time(list(each), costs) for each in itertools.permutations(range(6)))
+    order = su._exact_order(costs)
+    assert sorted(order) == list(range(6))
+    assert su._order_time(order, costs) == pytest.approx(best)
+
+
+@pytest.mark.parametrize('n, seed', [(7, 0), (7, 1), (12, 2), (20, 3)])
+def test_two_opt_order_is_a_local_optimum(n, seed):
+    costs = random_costs(n, seed)
+    order = su._two_opt_order(costs)
+    assert sorted(order) == list(range(n))
+    total = su._order_time(order, costs)
+    for i in range(n - 1):
+        for k in range(i + 1, n):
+            assert su._order_time(order[:i] + order[i:k + 1][::-1] + order[k + 1:], costs) >= total - 1e-9
+    if n <= 7:
+        assert total >= su._order_time(su._exact_order(costs), costs) - 1e-9
+
+
+def test_optimize_beam_order(capsys):
+    xUWStandIn.install(xUWStandIn.Session(rois=4, beams=6))
+    beam_set = xUWStandIn.get_current('BeamSet')
+    result = su.optimize_beam_order(beam_set)
+    assert sorted(result['order']) == sorted(each.Name for each in beam_set.Beams)
+    assert result['saved'] == pytest.approx(result['current'] - result['optimized']) and result['saved'] >= 0
+    assert [each.Number for each in beam_set.Beams] == list(range(1, 7))
+    large = su.optimize_beam_order(beam_set, exact_limit=3)
+    assert large['optimized'] <= large['current']
+    assert capsys.readouterr().out == ''
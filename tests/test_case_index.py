@@ -0,0 +1,46 @@
+# CaseIndex / CaseSnapshot and the couch model import checks built on them.
+
+import xUWScriptingUtilities as su
+import xUWStandIn
+from xUWStandIn import Record
+
+COUCH_ROIS = ['iBEAM evo Couch Core', 'iBEAM evo Couch Shell']
+
+
+def install(**options):
+    session, latency = xUWStandIn.install(xUWStandIn.Session(rois=12, **options))
+    return session
+
+
+def couch_contoured(session):
+    structure_set = session.current['Case'].PatientModel.StructureSets['CT 1']
+    return all(name in structure_set._geometries and structure_set._geometries[name].contours for name in COUCH_ROIS)
+
+
+def test_snapshot_reads_the_current_approvals():
+    session = install()
+    case, examination = xUWStandIn.get_current('Case'), xUWStandIn.get_current('Examination')
+    snapshot = su.CaseSnapshot(case, examination)
+    assert not snapshot['External'].approved
+    session.current['Case'].PatientModel.StructureSets['CT 1'].approve(['External'])
+    assert not snapshot['External'].approved
+    assert snapshot.refresh()['External'].approved_on_exam
+    assert su.CaseSnapshot(case, examination)['External'].approved
+
+
+def test_beam_sets_with_dose():
+    install()
+    index = su.CaseIndex(xUWStandIn.get_current('Case'))
+    assert index.beam_sets_with_dose('CT 1') == ['BS1']
+    assert index.beam_sets_with_dose('CT 2') == []
+    install(dose=False)
+    assert su.CaseIndex(xUWStandIn.get_current('Case')).beam_sets_with_dose('CT 1') == []
+
+
+def test_couch_import_with_an_approved_plan():
+    # As before, an approved plan does not stop the import (only approved couch ROIs and dose on the examination do).
+    session = install(dose=False)
+    session.current['Plan'].Review = Record(ApprovalStatus='Approved')
+    su.import_couch_model('iBEAM evo')
+    assert couch_contoured(session)
+
@@ -0,0 +1,92 @@
+# project_field_borders() and get_field_border_at_SAD(): leaf tips and jaw corners at SAD in patient DICOM coordinates.
+
+import numpy as np
+import pytest
+
+import xUWScriptingUtilities as su
+from xUWStandIn import Beam, Record, Vector, segments
+
+RNG = np.random.default_rng(0)
+
+
+def random_segments(count, numleaves=80):
+    left = RNG.uniform(-6, 0, (count, numleaves))
+    right = left + RNG.uniform(0, 6, (count, numleaves))
+    jaws = np.tile([-5., 5., -10., 10.], (count, 1))
+    return left, right, jaws
+
+
+def reference_points(points, coll, gantry, couch, orientation, isocenter=(0, 0, 0)):
+    """The same projection with the list geometry functions: collimator, gantry and couch rotations, then the DICOM transform."""
+    points = [su.rot_vect(su.rot_vect(su.rot_vect(each, 'z', coll), 'y', gantry), 'z', -1 * couch) for each in points]
+    return np.array(su.cartesian_to_dicom(points, orientation)) + isocenter
+
+
+@pytest.mark.parametrize('numleaves', [40, 60, 80])
+def test_leaf_centres(numleaves):
+    centres = su.leaf_centres(numleaves)
+    widths = np.array(su.MLC_LEAF_WIDTHS[numleaves])
+    assert len(centres) == numleaves
+    assert np.allclose(centres, -1 * centres[::-1])
+    assert np.allclose(np.diff(centres), (widths[:-1] + widths[1:]) / 2.)
+
+
+def test_beams_eye_view():
+    # No rotations, head first supine: beam limiting device x, y at SAD are DICOM x and z (left and superior).
+    left, right, jaws = random_segments(3)
+    centres = su.leaf_centres(80)
+    borders = su.project_field_borders(left, right, jaws, centres, 0, 0, 0, 'HeadFirstSupine')
+    assert borders['left'].shape == borders['right'].shape == (3, 80, 3)
+    assert np.allclose(borders['left'][..., 0], np.clip(left, -5, 5))
+    assert np.allclose(borders['right'][..., 0], np.clip(right, -5, 5))
+    assert np.allclose(borders['left'][..., 1], 0)
+    assert np.allclose(borders['left'][..., 2], np.broadcast_to(centres, (3, 80)))
+    assert np.allclose(borders['jaws'][0], [[-5, 0, -10], [5, 0, -10], [5, 0, 10], [-5, 0, 10]])
+
+
+def test_open_leaves():
+    left = np.array([[-1., -1., -1., 0.]])
+    right = np.array([[1., 1., -1., 0.]])
+    borders = su.project_field_borders(left, right, [[-5, 5, -1, 1]], np.array([-1.5, -0.5, 0.5, 1.5]), 0, 0, 0, 'HeadFirstSupine')
+    # Outside the Y jaws, open, closed, outside the Y jaws and closed.
+    assert borders['open'].tolist() == [[False, True, False, False]]
+
+
+@pytest.mark.parametrize('orientation', su.PATIENT_ORIENTATIONS)
+def test_matches_list_geometry(orientation):
+    left, right, jaws = random_segments(5)
+    centres = su.leaf_centres(80)
+    coll = np.array([0., 15., 90., 270., 345.])
+    gantry = np.array([181., 225., 0., 90., 300.])
+    borders = su.project_field_borders(left, right, jaws, centres, coll, gantry, 30., orientation, isocenter=(1, -2, 3))
+    for index in range(5):
+        tips = [[x, y, 0] for x, y in zip(np.clip(left[index], -5, 5), centres)]
+        assert np.allclose(borders['left'][index], reference_points(tips, coll[index], gantry[index], 30., orientation, (1, -2, 3)),
+                           atol=1e-3)
+        corners = [[-5, -10, 0], [5, -10, 0], [5, 10, 0], [-5, 10, 0]]
+        assert np.allclose(borders['jaws'][index], reference_points(corners, coll[index], gantry[index], 30., orientation, (1, -2, 3)),
+                           atol=1e-3)
+
+
+def test_arc_gantry_angles():
+    beam = Beam(GantryAngle=181., ArcRotationDirection='Clockwise', Segments=segments(60, 'DynamicArc', 4))
+    assert np.allclose(su.segment_gantry_angles(beam), [181, 185, 189, 193])
+    beam.ArcRotationDirection = 'CounterClockwise'
+    assert np.allclose(su.segment_gantry_angles(beam), [181, 177, 173, 169])
+    static = Beam(GantryAngle=90., Segments=[Record(LeafPositions=[[0.], [0.]])] * 2)
+    assert np.allclose(su.segment_gantry_angles(static), [90, 90])
+
+
+def test_get_field_border_at_SAD():
+    beam = Beam(Name='1', GantryAngle=181., ArcRotationDirection='Clockwise', CouchAngle=10., InitialCollimatorAngle=5.,
+                PatientPosition='FeetFirstSupine', Isocenter=Record(Position=Vector(x=1., y=2., z=3.)),
+                Segments=segments(60, 'DynamicArc', 6))
+    left = np.array([each.LeafPositions[0] for each in beam.Segments])
+    right = np.array([each.LeafPositions[1] for each in beam.Segments])
+    jaws = np.array([each.JawPositions for each in beam.Segments])
+    expected = su.project_field_borders(left, right, jaws, su.leaf_centres(60), np.zeros(6), su.segment_gantry_angles(beam), 10.,
+                                        'FeetFirstSupine', (1., 2., 3.))
+    borders = su.get_field_border_at_SAD(beam)
+    for key in ['left', 'right', 'jaws', 'open']:
+        assert np.allclose(borders[key], expected[key])
+    assert su.get_field_borders(Record(Beams=[beam], PatientPosition='FeetFirstSupine')).keys() == {'1'}
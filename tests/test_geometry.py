@@ -0,0 +1,90 @@
+# Geometry kernel: rotations, cross / dot products, Cartesian to DICOM coordinates and the 4x4 Transform.
+
+import numpy as np
+import pytest
+
+import xUWScriptingUtilities as su
+from xUWStandIn import Vector
+
+RNG = np.random.default_rng(0)
+POINTS = RNG.uniform(-50, 50, (200, 3))
+
+
+@pytest.mark.parametrize('axis', ['x', 'y', 'z'])
+def test_rotation_matrix_is_proper(axis):
+    r = su.rotation_matrix(axis, 33.0)
+    assert np.allclose(r @ r.T, np.eye(3))
+    assert np.isclose(np.linalg.det(r), 1)
+    with pytest.raises(ValueError):
+        r[0, 0] = 1
+
+
+def test_rotation_direction():
+    # Right hand rule: x to y about z, y to z about x, z to x about y.
+    assert su.rot_vect([1, 0, 0], 'z', 90) == [0, 1, 0]
+    assert su.rot_vect([0, 1, 0], 'x', 90) == [0, 0, 1]
+    assert su.rot_vect([0, 0, 1], 'y', 90) == [1, 0, 0]
+    assert su.rot_vect([1, 2, 3], None, 90) == [1, 2, 3]
+    with pytest.raises(ValueError):
+        su.rotation_matrix('w', 10.)
+
+
+@pytest.mark.parametrize('axis', ['x', 'y', 'z'])
+def test_rot_vects_matches_rot_vect(axis):
+    expected = [su.rot_vect(each, axis, 47.5) for each in POINTS.tolist()]
+    assert np.allclose(su.rot_vects(POINTS, axis, 47.5), expected, atol=1e-4)
+
+
+def test_cross_and_dot_products():
+    reverse = POINTS[::-1]
+    assert np.allclose(su.cps(POINTS, reverse), [su.cp(a, b) for a, b in zip(POINTS.tolist(), reverse.tolist())])
+    assert np.allclose(su.dps(POINTS, reverse), [su.dp(a, b) for a, b in zip(POINTS.tolist(), reverse.tolist())])
+    assert np.allclose(su.cps([1, 0, 0], POINTS), np.cross([1, 0, 0], POINTS))
+
+
+@pytest.mark.parametrize('orientation', su.PATIENT_ORIENTATIONS)
+def test_dicom_transforms_are_rotations(orientation):
+    r = su.DICOM_TRANSFORMS[orientation]
+    assert np.allclose(r @ r.T, np.eye(3))
+    assert np.isclose(np.linalg.det(r), 1)
+    assert np.allclose(su.cartesian_to_dicom(POINTS.tolist(), orientation), POINTS @ r.T)
+
+
+def test_cartesian_to_dicom_axes():
+    # Cartesian x, y, z are patient left, superior and anterior for a head first supine patient; DICOM is left, posterior, superior.
+    assert su.cartesian_to_dicom([[1, 2, 3]], 'HeadFirstSupine') == [[1, -3, 2]]
+    assert su.cartesian_to_dicom([[1, 2, 3]], 'FeetFirstDecubitusLeft') == [[-3, 1, -2]]
+    unknown = su.cartesian_to_dicom_array(POINTS, 'Sitting')
+    assert np.array_equal(unknown, POINTS) and unknown is not POINTS
+
+
+def test_transform_composition():
+    move = su.Transform.translation(1, 2, 3)
+    turn = su.Transform.rotation('z', 90)
+    assert np.allclose(move.then(turn).apply([[1, 0, 0]]), [[-2, 2, 3]])
+    assert np.allclose((turn @ move).matrix, move.then(turn).matrix)
+    assert np.allclose(move.then(turn).inverse().apply(move.then(turn).apply(POINTS)), POINTS)
+
+
+def test_transform_rotation_about_centre():
+    turn = su.Transform.rotation('y', 180, center=(1, 0, 0))
+    assert np.allclose(turn.apply([[1, 5, 0], [2, 0, 0]]), [[1, 5, 0], [0, 0, 0]])
+    assert np.allclose(turn.apply(POINTS), su.rot_vects(POINTS - [1, 0, 0], 'y', 180) + [1, 0, 0])
+
+
+def test_transform_rigidity_and_dict():
+    turn = su.Transform.rotation('x', 30).then(su.Transform.translation(0, 4, 0))
+    assert turn.is_rigid()
+    assert not su.Transform(np.diag([2., 1., 1., 1.])).is_rigid()
+    assert not su.Transform.orientation('HeadFirstSupine').then(su.Transform(np.diag([1., 1., -1., 1.]))).is_rigid()
+    matrix = turn.to_dict()
+    assert sorted(matrix) == sorted('M%i%i' % (i, j) for i in range(1, 5) for j in range(1, 5))
+    assert np.allclose(su.Transform.from_dict(matrix).matrix, turn.matrix)
+
+
+def test_apply_contours():
+    move = su.Transform.translation(0, 0, 1.5)
+    contours = [[Vector(x=1, y=2, z=0), Vector(x=3, y=4, z=0)], np.array([[0, 0, 1.]])]
+    moved = move.apply_contours(contours)
+    assert np.allclose(moved[0], [[1, 2, 1.5], [3, 4, 1.5]])
+    assert np.allclose(moved[1], [[0, 0, 2.5]])
@@ -0,0 +1,57 @@
+# xUWInterop.prefetch(): parallel reads only when enabled and neither tracing nor recording is on.
+
+import threading
+
+import pytest
+
+import xUWInterop as interop
+from xUWStandIn import Record
+
+
+@pytest.fixture
+def parallel(monkeypatch):
+    monkeypatch.setattr(interop, 'PARALLEL_READS', True)
+    monkeypatch.setattr(interop, '_tracer', None)
+    monkeypatch.setattr(interop, '_recorder', None)
+
+
+def read_threads(workers=4):
+    reads = {name: (lambda: threading.current_thread().name) for name in 'abcd'}
+    return set(interop.prefetch(reads, workers).wait().futures[name].result() for name in reads)
+
+
+def test_parallel_reads(parallel):
+    assert all(name.startswith('xUWRead') for name in read_threads())
+
+
+def test_serial_reads(parallel, monkeypatch):
+    assert read_threads(workers=1) == {threading.current_thread().name}
+    monkeypatch.setattr(interop, 'PARALLEL_READS', False)
+    assert read_threads() == {threading.current_thread().name}
+
+
+@pytest.mark.parametrize('active', ['_tracer', '_recorder'])
+def test_serial_while_tracing_or_recording(parallel, monkeypatch, active):
+    monkeypatch.setattr(interop, active, object())
+    assert read_threads() == {threading.current_thread().name}
+
+
+def test_prefetch_results(parallel):
+    examination = Record(Series=[Record(ImageStack=Record(SlicePositions=[0., 0.3]))])
+    prefetched = interop.prefetch({'slices': (examination, 'Series.0.ImageStack.SlicePositions'), 'missing': (examination, 'Name'),
+                                   'value': lambda: 3})
+    assert prefetched['slices'] == [0., 0.3] and prefetched['value'] == 3 and 'missing' in prefetched
+    assert prefetched.get('missing', 'none') == 'none'
+    assert isinstance(prefetched.error('missing'), AttributeError)
+
+
+def test_enable_recording_once(monkeypatch, tmp_path):
+    finish = []
+    monkeypatch.setattr(interop.atexit, 'register', finish.append)
+    monkeypatch.setattr(interop, 'get_current', interop.get_current)
+    monkeypatch.setattr(interop, '_recorder', None)
+    recorder = interop.enable_recording(str(tmp_path / 'first.npz'))
+    get_current = interop.get_current
+    assert interop.enable_recording(str(tmp_path / 'second.npz')) is recorder
+    assert interop.recorder() is recorder and interop.get_current is get_current
+    assert len(finish) == 1 and recorder.filename.endswith('first.npz')
@@ -0,0 +1,59 @@
+# Beam renumbering: the planned writes of renumber_beams(dry_run=True) on a stand-in beam set, and applying them.
+
+import pytest
+
+import xUWScriptingUtilities as su
+import xUWStandIn
+
+
+@pytest.fixture
+def beam_set():
+    session, latency = xUWStandIn.install(xUWStandIn.Session(rois=4, beams=5))
+    return xUWStandIn.get_current('BeamSet'), latency
+
+
+def numbers(beam_set):
+    return {each.Name: each.Number for each in beam_set.Beams}
+
+
+def replay(current, writes):
+    """Apply the writes to {name: number}, checking that no two beams ever share a number."""
+    current = dict(current)
+    for name, number in writes:
+        assert number not in current.values(), (name, number)
+        current[name] = number
+    return current
+
+
+def test_dry_run_swaps(beam_set):
+    beam_set, latency = beam_set
+    before = numbers(beam_set)
+    # Beams 1 and 2 swap and beams 4 and 5 swap: two cycles, each through the temporary number 6.
+    writes = su.renumber_beams(beam_set, ['2', '1', '3', '5', '4'], dry_run=True)
+    assert writes == [('2', 6), ('1', 2), ('2', 1), ('5', 6), ('4', 5), ('5', 4)]
+    assert numbers(beam_set) == before
+    assert latency.calls['CompositeAction()'] == 0
+    assert replay(before, writes) == {'2': 1, '1': 2, '3': 3, '5': 4, '4': 5}
+
+
+def test_dry_run_with_free_numbers(beam_set):
+    beam_set, latency = beam_set
+    for beam, number in zip(beam_set.Beams, [3, 7, 1, 9, 2]):
+        beam.Number = number
+    before = numbers(beam_set)
+    # Beams 3 and 5 already have their numbers. Number 5 is free, so beam 1 moves 3 -> 5, freeing 3 for beam 2 (7 -> 3); beam 4 moves
+    # straight to the free number 4. No temporary number is needed.
+    writes = su.renumber_beams(beam_set, ['3', '5', '2', '4', '1'], dry_run=True)
+    assert writes == [('1', 5), ('2', 3), ('4', 4)]
+    assert replay(before, writes) == {'3': 1, '5': 2, '2': 3, '4': 4, '1': 5}
+    assert numbers(beam_set) == before
+
+
+def test_apply(beam_set):
+    beam_set, latency = beam_set
+    writes = su.renumber_beams(beam_set, ['5', '4', '3', '2', '1'])
+    assert numbers(beam_set) == {'5': 1, '4': 2, '3': 3, '2': 4, '1': 5}
+    assert latency.calls['CompositeAction()'] == 1 and len(writes) == 6
+    assert su.renumber_beams(beam_set, ['5', '4', '3', '2', '1']) == []
+    with pytest.raises(AssertionError):
+        su.renumber_beams(beam_set, ['1', '2'], dry_run=True)
@@ -0,0 +1,57 @@
+# RoiClassifier: ROI name and type classes from the site rules, and the ROI_setup() type rules built on them.
+
+import json
+
+import pytest
+
+import xUWScriptingUtilities as su
+
+
+@pytest.fixture
+def classifier():
+    return su.RoiClassifier(su.DEFAULT_ROI_CLASSES)
+
+
+@pytest.mark.parametrize('name, expected', [('PTV_60', 'Ptv'), ('Ptv_boost', 'Ptv'), ('zPTV_opt', 'Ptv'), ('CTV', 'Ctv'),
+                                            ('gTV', 'Gtv'), ('GTV_ITV', 'Gtv'), ('iTV', 'Gtv'), ('PTV_CTV', 'Ptv'),
+                                            ('Lung_L', None), ('Couch', None), ('', None)])
+def test_name_class(classifier, name, expected):
+    assert classifier.name_class(name) == expected
+
+
+@pytest.mark.parametrize('roi_type, expected', [('Ptv', 'target'), ('Gtv', 'target'), ('TreatedVolume', 'other'), ('Organ', 'oar'),
+                                                ('Support', 'support'), ('External', 'other'), ('Control', 'other')])
+def test_type_class(classifier, roi_type, expected):
+    assert classifier.type_class(roi_type) == expected
+
+
+def test_classify(classifier):
+    assert classifier.classify([('PTV', 'Ptv'), ('Heart', 'Organ'), ('Couch', 'Support')]) == \
+        {'PTV': ('Ptv', 'target'), 'Heart': (None, 'oar'), 'Couch': (None, 'support')}
+    assert classifier.name_class('PTV') == 'Ptv' and 'PTV' in classifier._names
+
+
+def test_site_rules_file(tmp_path):
+    # The shipped rules match the defaults; a site file can add patterns and classes.
+    assert su.RoiClassifier.from_file().classify([('Ptv_1', 'Ptv'), ('gtv', 'Avoidance')]) == \
+        su.RoiClassifier().classify([('Ptv_1', 'Ptv'), ('gtv', 'Avoidance')])
+    rules = dict(su.DEFAULT_ROI_CLASSES, name_classes=[{'class': 'Ptv', 'patterns': ['PTV', '^planning target']}],
+                 default_type_class='unknown')
+    filename = tmp_path / 'rules.json'
+    filename.write_text(json.dumps(rules))
+    classifier = su.RoiClassifier.from_file(str(filename))
+    assert classifier.name_class('Planning target 2') == 'Ptv'
+    assert classifier.name_class('CTV') is None
+    assert classifier.type_class('Control') == 'unknown'
+
+
+@pytest.mark.parametrize('arguments, expected', [(('PTV_60', 'Organ', 'OrganAtRisk', False, False), ('Ptv', 'Target')),
+                                                 (('gtv', 'Organ', 'OrganAtRisk', False, False), ('Gtv', 'Target')),
+                                                 (('Couch', 'Support', 'Other', True, False), ('Support', 'Other')),
+                                                 (('Bolus', 'Organ', 'Unknown', True, False), ('Organ', 'Other')),
+                                                 (('Heart', 'Undefined', 'Unknown', False, False), ('Organ', 'OrganAtRisk')),
+                                                 (('External', 'External', 'Unknown', False, False), ('External', 'Unknown')),
+                                                 (('PTV_60', 'Organ', 'OrganAtRisk', False, True), ('Organ', 'OrganAtRisk')),
+                                                 (('Liver-GTV', 'Gtv', 'Target', False, True), ('Organ', 'OrganAtRisk'))])
+def test_roi_setup_types(arguments, expected):
+    assert su.roi_setup_types(*arguments) == expected
@@ -0,0 +1,50 @@
+# A2.py (Change ROI Visualization): ROI selection and the chunked, cancellable update, without the form.
+
+import pytest
+
+import A2
+import xUWStandIn
+
+
+@pytest.fixture
+def stand_in():
+    session, latency = xUWStandIn.install(xUWStandIn.Session(rois=12))
+    return xUWStandIn.get_current('Case'), xUWStandIn.get_current('Patient'), latency
+
+
+def test_select_rois(stand_in):
+    case, patient, latency = stand_in
+    rois = list(case.PatientModel.RegionsOfInterest)
+    everything = A2.select_rois(rois, {'target': True, 'oar': True, 'support': True, 'other': True})
+    targets = A2.select_rois(rois, {'target': True})
+    assert len(everything) == len(rois)
+    assert targets and all(roi.Type in ('Ptv', 'Ctv', 'Gtv') for roi in targets)
+
+
+def test_update_in_chunks(stand_in):
+    case, patient, latency = stand_in
+    rois = list(case.PatientModel.RegionsOfInterest)
+    settings = A2.visualization_settings(False, False, 'Outline', 'Wireframe')
+    progress = []
+    writer, done = A2.update_visualization(case, patient, rois, settings, chunk_size=5, progress=lambda *x: progress.append(x))
+    assert done == len(rois) and writer.written and not writer.failed
+    assert progress == [(min(end, len(rois)), len(rois)) for end in range(5, len(rois) + 5, 5)]
+    assert latency.calls['CompositeAction()'] == len(progress)
+    assert all(not roi.RoiVisualizationSettings.IsVisible for roi in case.PatientModel.RegionsOfInterest)
+    assert patient.saves == 1
+
+    # Unchanged settings are skipped, and nothing is saved.
+    writer, done = A2.update_visualization(case, patient, rois, settings, chunk_size=5)
+    assert writer.written == 0 and writer.skipped == 4 * len(rois) and patient.saves == 1
+
+
+def test_cancel_between_chunks(stand_in):
+    case, patient, latency = stand_in
+    rois = list(case.PatientModel.RegionsOfInterest)
+    settings = A2.visualization_settings(False, True, 'Outline', 'Wireframe')
+    progress = []
+    writer, done = A2.update_visualization(case, patient, rois, settings, chunk_size=5, progress=lambda *x: progress.append(x),
+                                           cancelled=lambda: len(progress) == 1)
+    assert done == 5 and progress == [(5, len(rois))]
+    assert [roi.RoiVisualizationSettings.IsVisible for roi in case.PatientModel.RegionsOfInterest][5:] == [True] * (len(rois) - 5)
+    assert patient.saves == 1
@@ -0,0 +1,63 @@
+# CT volume cache: pyramid levels, slice-by-slice downsampling, LRU eviction and the per-user cache directory.
+
+import os
+
+import numpy as np
+import pytest
+
+import xUWDoseRendering as dr
+import xUWStandIn
+import xUWVolumeCache as vc
+
+VOLUME = np.random.default_rng(0).integers(-1000, 2000, (6, 21, 34)).astype(np.int16)
+
+
+def test_downsample():
+    image = np.arange(16, dtype=np.int16).reshape(4, 4)
+    assert np.array_equal(vc.downsample(image, 2), np.round([[2.5, 4.5], [10.5, 12.5]]))
+    assert vc.downsample(VOLUME[0], 4).shape == (5, 8)
+    assert np.array_equal(vc.downsample(VOLUME, 2), np.stack([vc.downsample(each, 2) for each in VOLUME]))
+
+
+def test_put_and_load(tmp_path):
+    cache = vc.CTVolumeCache(str(tmp_path))
+    cache.put('series', VOLUME)
+    assert cache.contains('series')
+    assert np.array_equal(cache.load('series', 0), VOLUME)
+    for level, factor in enumerate(vc.LEVELS[1:], 1):
+        loaded = cache.load('series', level)
+        assert loaded.dtype == np.int16 and isinstance(loaded, np.memmap)
+        assert np.array_equal(loaded, vc.downsample(VOLUME, factor))
+    assert not [name for name in os.listdir(str(tmp_path)) if name.endswith('.tmp')]
+
+
+def test_eviction(tmp_path):
+    cache = vc.CTVolumeCache(str(tmp_path), max_bytes=VOLUME.nbytes * 2)
+    for key in ['a', 'b', 'c']:
+        cache.put(key, VOLUME)
+        os.utime(cache._filename(key, 0), (0, {'a': 1, 'b': 2, 'c': 3}[key]))
+    cache.evict()
+    assert [cache.contains(key) for key in 'abc'] == [False, False, True]
+
+
+def test_user_cache_directory(tmp_path, monkeypatch):
+    monkeypatch.setenv('LOCALAPPDATA', str(tmp_path))
+    assert vc.CTVolumeCache().directory == str(tmp_path / vc.CACHE_NAME)
+    monkeypatch.delenv('LOCALAPPDATA')
+    monkeypatch.setattr(dr.tempfile, 'gettempdir', lambda: str(tmp_path))
+    directory = vc.CTVolumeCache().directory
+    assert directory.startswith(str(tmp_path / 'xUW_')) and directory.endswith(vc.CACHE_NAME)
+    if hasattr(os, 'getuid'):
+        assert os.stat(os.path.dirname(directory)).st_mode & 0o777 == 0o700
+
+
+def test_get_examination(tmp_path):
+    xUWStandIn.install(xUWStandIn.Session(rois=4))
+    examination = xUWStandIn.get_current('Examination')
+    cache = vc.CTVolumeCache(str(tmp_path))
+    volume, geometry = cache.get(examination)
+    half, half_geometry = cache.get(examination, 1)
+    assert volume.shape == (len(geometry.z), geometry.ny, geometry.nx)
+    assert half.shape == (len(geometry.z), geometry.ny // 2, geometry.nx // 2)
+    assert half_geometry.dx == pytest.approx(2 * geometry.dx)
+    assert np.array_equal(half, vc.downsample(np.asarray(volume), 2))
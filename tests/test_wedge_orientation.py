@@ -0,0 +1,27 @@
+# get_wedge_orientations() (batched) against get_wedge_orientation() over a grid of collimator, gantry and couch angles.
+
+import numpy as np
+import pytest
+
+import xUWScriptingUtilities as su
+
+ANGLES = np.arange(0, 360, 15, dtype=float)
+COLL, GANTRY, COUCH = [each.ravel() for each in np.meshgrid(ANGLES, ANGLES, ANGLES, indexing='ij')]
+
+
+@pytest.mark.parametrize('orientation', su.PATIENT_ORIENTATIONS)
+def test_batched_matches_scalar(orientation):
+    batched = su.get_wedge_orientations(COLL, GANTRY, COUCH, orientation)
+    scalar = [su.get_wedge_orientation(c, g, t, orientation) for c, g, t in zip(COLL.tolist(), GANTRY.tolist(), COUCH.tolist())]
+    assert batched == scalar
+
+
+def test_orientation_per_beam():
+    orientations = su.PATIENT_ORIENTATIONS * 3
+    coll, gantry, couch = COLL[:len(orientations)], GANTRY[:len(orientations)], COUCH[:len(orientations)]
+    assert su.get_wedge_orientations(coll, gantry, couch, orientations) == \
+        [su.get_wedge_orientation(c, g, t, o) for c, g, t, o in zip(coll, gantry, couch, orientations)]
+
+
+def test_heel_directions():
+    assert su.get_wedge_orientations([0, 90, 0], [0, 0, 90], [0, 0, 0], 'HeadFirstSupine') == ['HI', 'HL', 'HI']
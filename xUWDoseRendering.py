@@ -0,0 +1,840 @@
+# -------------------------------------------------------------------------------
+# Name:        DoseRendering (v1.05)
+#
+# Written for RS Version: 2023B
+#
+# Purpose:     Offline renderer for dose slice images. Produces colourwash/isodose transversal, sagittal and coronal images from a CT volume array,
+#              a dose array, the case DoseColorMap levels and ROI contours without a round trip through BeamSet.GetDoseImages.
+#
+# Note:        Only numpy and the standard library are imported here so that the module can be loaded by the worker processes
+#              used by render_slices() and outside of RayStation. Functions taking RayStation objects (read_image_stack,
+#              colormap_levels, roi_contours, ...) only access them through attributes and never import connect.
+#
+#              Volumes are indexed [z, y, x], matching DoseValues.DoseData.reshape(nz, ny, nx). Coordinates are patient
+#              coordinates in cm. Image rows run along +y and columns along +x, as in the RayStation transversal view.
+#
+# Created:     19 October 2026 (v1.00)
+#
+# Updated:     19 October 2026 (v1.01) - Added marching squares isodose lines with a per-slice contour cache and the 'lines' style.
+#              19 October 2026 (v1.02) - Added sagittal and coronal orientations.
+#              19 October 2026 (v1.03) - Added hotspot field of view and dose profile functions, per-point field of view in render_slices().
+#              19 October 2026 (v1.04) - roi_contours() reads only visible ROIs and the contours on the imaged slices (image_z_ranges()).
+#              19 October 2026 (v1.05) - The 'lines' style writes pdf images with vector isodose lines and ROI outlines (write_pdf()).
+#                                        The isodose cache stores npz arrays in a per-user directory with a size limit.
+# -------------------------------------------------------------------------------
+
+import getpass
+import os
+import struct
+import tempfile
+import zlib
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+# Default on-disk location and size limit of the isodose line cache, so that reprints of an unchanged dose skip the contour extraction.
+ISODOSE_CACHE_NAME = 'dose_rendering_isodose_cache'
+ISODOSE_CACHE_BYTES = 256 * 1024 ** 2
+
+# Geometry of a volume. x0/y0 are the centres of the first column/row, z is an array of slice centre positions (CT slices may
+# not be equally spaced).
+VolumeGeometry = namedtuple('VolumeGeometry', ['x0', 'y0', 'dx', 'dy', 'nx', 'ny', 'z'])
+
+
+def user_cache_directory(name):
+    """Return a cache directory only the current user can write: under LOCALAPPDATA on Windows, otherwise a per-user directory in
+       the temporary directory (created with mode 0700, and refused if another user owns it)."""
+    base = os.environ.get('LOCALAPPDATA')
+    if not base:
+        base = os.path.join(tempfile.gettempdir(), 'xUW_%s' % getpass.getuser())
+        os.makedirs(base, mode=0o700, exist_ok=True)
+        if hasattr(os, 'getuid') and os.stat(base).st_uid != os.getuid():
+            raise OSError('The cache directory %s belongs to another user.' % base)
+    directory = os.path.join(base, name)
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    return directory
+
+
+#########################
+#                       #
+#  Geometry / Loading   #
+#                       #
+#########################
+
+def dose_grid_geometry(dose_grid):
+    """Return the VolumeGeometry of a RayStation dose grid (e.g. FractionDose.InDoseGrid or plan.GetTotalDoseGrid()).
+       The dose grid corner is the outer corner of the first voxel, so half a voxel is added to get voxel centres."""
+    corner, numvx, voxsz = dose_grid.Corner, dose_grid.NrVoxels, dose_grid.VoxelSize
+    z = corner.z + (np.arange(numvx.z) + 0.5) * voxsz.z
+    return VolumeGeometry(corner.x + 0.5 * voxsz.x, corner.y + 0.5 * voxsz.y, voxsz.x, voxsz.y,
+                          int(numvx.x), int(numvx.y), z)
+
+
+def dose_volume(dosearray, geometry):
+    """Reshape a flat dose array (DoseValues.DoseData) into a [z, y, x] float32 volume for the given geometry."""
+    return np.asarray(dosearray, dtype=np.float32).reshape(len(geometry.z), geometry.ny, geometry.nx)
+
+
+def image_stack_geometry(image_stack):
+    """Return the VolumeGeometry of a RayStation ImageStack. Slice positions are relative to the stack corner."""
+    corner = image_stack.Corner
+    z = corner.z + np.array([float(each) for each in image_stack.SlicePositions])
+    return VolumeGeometry(corner.x, corner.y, image_stack.PixelSize.x, image_stack.PixelSize.y,
+                          int(image_stack.NrPixels.x), int(image_stack.NrPixels.y), z)
+
+
+def read_image_stack(image_stack):
+    """Pull the pixel data of a RayStation ImageStack into a [z, y, x] int16 volume of Hounsfield units.
+       Returns (volume, geometry)."""
+    geometry = image_stack_geometry(image_stack)
+    raw = np.frombuffer(bytes(image_stack.PixelData), dtype='<u2')
+    raw = raw.reshape(len(geometry.z), geometry.ny, geometry.nx)
+    conversion = image_stack.ConversionParameters
+    slope, intercept = float(conversion.RescaleSlope), float(conversion.RescaleIntercept)
+    volume = np.clip(raw * slope + intercept, -32768, 32767).astype(np.int16)
+    return volume, geometry
+
+
+def _rgb(color):
+    """Convert a System.Drawing.Color or an (r, g, b) sequence to an (r, g, b) tuple."""
+    if hasattr(color, 'R'):
+        return int(color.R), int(color.G), int(color.B)
+    return tuple(int(each) for each in color[:3])
+
+
+def colormap_levels(dose_color_map, reference_dose=None):
+    """Convert a case DoseColorMap (case.CaseSettings.DoseColorMap) into a list of (dose [cGy], (r, g, b)) sorted by dose.
+       The colour table is keyed by relative level in percent. If reference_dose is not supplied the colour map ReferenceValue is used."""
+    if reference_dose is None:
+        reference_dose = float(dose_color_map.ReferenceValue)
+    table = dose_color_map.ColorTable
+    try:
+        items = list(table.items())
+    except AttributeError:  # .NET dictionary
+        items = [(each.Key, each.Value) for each in table]
+    levels = [(float(level) / 100. * reference_dose, _rgb(color)) for level, color in items]
+    return sorted(levels, key=lambda x: x[0])
+
+
+def roi_contours(case, examination, roi_names=None, z_ranges=None, visible_only=True):
+    """Return a list of (name, (r, g, b), [contour arrays]) for the contoured ROIs on the examination. Each contour is an (N, 3)
+       array of x, y, z points. Voxel-based geometries without contours are skipped.
+
+       Contours are planar (transversal), so z is read once per contour. Only the contours that can be drawn are read, as every
+       point costs scripting calls:
+       roi_names: Optional names of the ROIs to read.
+       z_ranges: Optional list of (low, high) z ranges shown by the images (see image_z_ranges()). Contours on slices outside every
+                 range are skipped after reading their first point.
+       visible_only: Skip ROIs that are hidden (RoiVisualizationSettings.IsVisible), as GetDoseImages does not draw them."""
+    result = []
+    for geometry in case.PatientModel.StructureSets[examination.Name].RoiGeometries:
+        roi = geometry.OfRoi
+        name = roi.Name
+        if roi_names is not None and name not in roi_names:
+            continue
+        try:
+            if visible_only and not roi.RoiVisualizationSettings.IsVisible:
+                continue
+            if not geometry.HasContours():
+                continue
+            contours = []
+            for contour in geometry.PrimaryShape.Contours:
+                z = contour[0].z  # Contours lie on a transversal slice, so z is read once per contour.
+                if z_ranges is not None and not any(low <= z <= high for low, high in z_ranges):
+                    continue
+                points = np.full((len(contour), 3), z, dtype=np.float32)
+                points[:, :2] = [[pt.x, pt.y] for pt in contour]
+                contours.append(points)
+        except Exception as e:
+            print(f'Could not read contours for {name}: {e}')
+            continue
+        if contours:
+            result.append((name, _rgb(roi.Color), contours))
+    return result
+
+
+def image_z_ranges(points, orientations, fov, ct_geometry):
+    """Return the (low, high) z ranges covered by the images of render_slices(), for roi_contours(). Transversal images cover half a
+       CT slice around their z, sagittal and coronal images their field of view. Returns None (everything) if an image shows the
+       whole CT."""
+    ct_z = axis_positions(ct_geometry, 0)
+    half_slice = (abs(ct_z[1] - ct_z[0]) if len(ct_z) > 1 else 0.2) / 2.
+    ranges = []
+    for point, orientation, point_fov in zip(points, orientations, fov):
+        if orientation == 'Transversal':
+            ranges.append((point['z'] - half_slice, point['z'] + half_slice))
+        elif point_fov is None:
+            return None
+        else:
+            ranges.append((point['z'] - point_fov / 2., point['z'] + point_fov / 2.))
+    return ranges
+
+
+#########################
+#                       #
+#  Lookup Tables        #
+#                       #
+#########################
+
+def window_lut(level=40, width=400, hu_min=-1024, hu_max=3071):
+    """Build a uint8 greyscale lookup table over [hu_min, hu_max] for the given window level and width.
+       Index the table with (hu - hu_min)."""
+    hu = np.arange(hu_min, hu_max + 1, dtype=np.float32)
+    grey = (hu - (level - width / 2.)) / width * 255.
+    return np.clip(grey, 0, 255).astype(np.uint8)
+
+
+def dose_lut(levels, alpha=0.5):
+    """Build the dose level table used by the colourwash. Returns (thresholds, colours, alphas) where colours/alphas are indexed
+       by np.searchsorted(thresholds, dose, 'right'); index 0 is below the lowest level and is transparent."""
+    thresholds = np.array([each[0] for each in levels], dtype=np.float32)
+    colours = np.zeros((len(levels) + 1, 3), dtype=np.float32)
+    colours[1:] = [each[1] for each in levels]
+    alphas = np.full(len(levels) + 1, alpha, dtype=np.float32)
+    alphas[0] = 0.
+    return thresholds, colours, alphas
+
+
+#########################
+#                       #
+#  Slice Rendering      #
+#                       #
+#########################
+
+# For each orientation: the volume axis (0: z, 1: y, 2: x) held fixed, the axes shown along the image rows and columns, and
+# whether the rows run against their axis (superior at the top of sagittal and coronal images).
+ORIENTATIONS = {'Transversal': (0, 1, 2, False), 'Sagittal': (2, 0, 1, True), 'Coronal': (1, 0, 2, True)}
+_AXIS_KEYS = ['z', 'y', 'x']
+
+
+def axis_positions(geometry, axis):
+    """Return the voxel centre positions of a VolumeGeometry along volume axis 0 (z), 1 (y) or 2 (x)."""
+    if axis == 0:
+        return np.asarray(geometry.z, dtype=np.float64)
+    if axis == 1:
+        return geometry.y0 + np.arange(geometry.ny) * geometry.dy
+    return geometry.x0 + np.arange(geometry.nx) * geometry.dx
+
+
+def _pixel_positions(centre, fov, size, reverse=False):
+    """Return the patient coordinate of each output pixel centre along one image axis."""
+    offsets = (np.arange(size) + 0.5) * fov / size - fov / 2.
+    return centre - offsets if reverse else centre + offsets
+
+
+def _to_pixels(coords, centre, fov, size, reverse=False):
+    """Convert patient coordinates along one image axis to fractional pixel indices (inverse of _pixel_positions)."""
+    offsets = (centre - coords) if reverse else (coords - centre)
+    return (offsets + fov / 2.) / fov * size - 0.5
+
+
+def _nearest(positions, coords):
+    """Return the index of the nearest voxel for each coordinate on an ascending axis, and a mask of coordinates inside the
+       volume (within half a voxel of the first/last voxel centre)."""
+    if len(positions) == 1:
+        return np.zeros(len(coords), dtype=np.intp), np.abs(coords - positions[0]) <= 0.05
+    i = np.clip(np.searchsorted(positions, coords), 1, len(positions) - 1)
+    i = np.where(np.abs(coords - positions[i - 1]) <= np.abs(positions[i] - coords), i - 1, i)
+    half = (positions[1] - positions[0]) / 2.
+    return i, (coords >= positions[0] - half) & (coords <= positions[-1] + half)
+
+
+def _fractional(positions, coords):
+    """Return fractional voxel indices of coords on an equally spaced axis."""
+    if len(positions) == 1:
+        return np.where(np.abs(coords - positions[0]) <= 0.05, 0., -1.)
+    return (coords - positions[0]) / (positions[1] - positions[0])
+
+
+def _dose_plane(dose, geometry, axis, position):
+    """Linearly interpolate the dose plane perpendicular to axis at position. The plane keeps the remaining volume axes in
+       order. Returns None outside the dose grid."""
+    n = dose.shape[axis]
+    f = float(_fractional(axis_positions(geometry, axis), np.array(position)))
+    if f < -0.5 or f > n - 0.5:
+        return None
+    if n == 1:
+        return np.take(dose, 0, axis=axis)
+    f = min(max(f, 0.), n - 1.)
+    k = min(int(f), n - 2)
+    w = f - k
+    return np.take(dose, k, axis=axis) * (1 - w) + np.take(dose, k + 1, axis=axis) * w
+
+
+def _bilinear(plane, fy, fx):
+    """Bilinear sample of a 2D plane at the outer product of fractional row indices fy and column indices fx. Samples outside
+       the plane are zero."""
+    ny, nx = plane.shape
+    inside = np.outer((fy >= -0.5) & (fy <= ny - 0.5), (fx >= -0.5) & (fx <= nx - 0.5))
+    fy = np.clip(fy, 0, ny - 1)
+    fx = np.clip(fx, 0, nx - 1)
+    y0 = np.minimum(fy.astype(np.intp), max(ny - 2, 0))
+    x0 = np.minimum(fx.astype(np.intp), max(nx - 2, 0))
+    y1 = np.minimum(y0 + 1, ny - 1)
+    x1 = np.minimum(x0 + 1, nx - 1)
+    wy = (fy - y0)[:, None]
+    wx = (fx - x0)[None, :]
+    top = plane[np.ix_(y0, x0)] * (1 - wx) + plane[np.ix_(y0, x1)] * wx
+    bottom = plane[np.ix_(y1, x0)] * (1 - wx) + plane[np.ix_(y1, x1)] * wx
+    return np.where(inside, top * (1 - wy) + bottom * wy, 0.)
+
+
+def _level_edges(index):
+    """Return a boolean mask of pixels on the boundary between two dose levels, and the level index drawn there (the higher
+       of the two neighbouring levels)."""
+    edge = np.zeros(index.shape, dtype=bool)
+    edge[:, 1:] |= index[:, 1:] != index[:, :-1]
+    edge[1:, :] |= index[1:, :] != index[:-1, :]
+    level = index.copy()
+    level[:, 1:] = np.maximum(level[:, 1:], index[:, :-1])
+    level[1:, :] = np.maximum(level[1:, :], index[:-1, :])
+    return edge & (level > 0), level
+
+
+def _polyline_pixels(cols, rows, size, closed=True):
+    """Rasterize a polyline given as fractional pixel column/row arrays into output image row/column index arrays."""
+    start = np.stack([cols, rows], axis=1)
+    end = np.roll(start, -1, axis=0)
+    if not closed:
+        start, end = start[:-1], end[:-1]
+    steps = np.maximum(np.ceil(np.abs(end - start).max(axis=1)), 1).astype(np.intp)
+    seg = np.repeat(np.arange(len(start)), steps)
+    t = (np.arange(steps.sum()) - np.repeat(np.cumsum(steps) - steps, steps)) / np.repeat(steps, steps)
+    pts = start[seg] + (end[seg] - start[seg]) * t[:, None]
+    cols, rows = np.rint(pts[:, 0]).astype(np.intp), np.rint(pts[:, 1]).astype(np.intp)
+    keep = (rows >= 0) & (rows < size) & (cols >= 0) & (cols < size)
+    return rows[keep], cols[keep]
+
+
+def _plane_crossings(contour, column, position):
+    """Return the points (N, 3) where the edges of a closed contour cross the plane contour[:, column] == position."""
+    start, end = contour, np.roll(contour, -1, axis=0)
+    a, b = start[:, column] - position, end[:, column] - position
+    crossing = (a * b < 0) | ((a == 0) & (b != 0))
+    t = (a[crossing] / (a[crossing] - b[crossing]))[:, None]
+    return start[crossing] + (end[crossing] - start[crossing]) * t
+
+
+def _frame(ct_geometry, point, orientation, fov):
+    """Return the image frame (fixed axis, row axis, column axis, reverse, position, row centre, column centre, fov) of a slice."""
+    fixed, row_axis, col_axis, reverse = ORIENTATIONS[orientation]
+    ct_rows, ct_cols = axis_positions(ct_geometry, row_axis), axis_positions(ct_geometry, col_axis)
+    if fov is None:
+        fov = max(ct_rows[-1] - ct_rows[0] + ct_rows[1] - ct_rows[0], ct_cols[-1] - ct_cols[0] + ct_cols[1] - ct_cols[0])
+    return (fixed, row_axis, col_axis, reverse, point[_AXIS_KEYS[fixed]], point[_AXIS_KEYS[row_axis]], point[_AXIS_KEYS[col_axis]],
+            fov)
+
+
+def _ct_background(ct, ct_geometry, frame, lut, size):
+    """Nearest neighbour sample of the CT slice of frame as a (size, size) uint8 greyscale image."""
+    fixed, row_axis, col_axis, reverse, position, row_centre, col_centre, fov = frame
+    k, k_inside = _nearest(axis_positions(ct_geometry, fixed), np.array([position]))
+    iy, y_inside = _nearest(axis_positions(ct_geometry, row_axis), _pixel_positions(row_centre, fov, size, reverse))
+    ix, x_inside = _nearest(axis_positions(ct_geometry, col_axis), _pixel_positions(col_centre, fov, size))
+    hu = np.take(ct, k[0], axis=fixed)[np.ix_(iy, ix)]
+    hu_min = -1024
+    grey = lut[np.clip(hu.astype(np.intp) - hu_min, 0, len(lut) - 1)]
+    return np.where(np.outer(y_inside, x_inside) & k_inside[0], grey, 0).astype(np.uint8)
+
+
+def _roi_outlines(rois, ct_geometry, frame, size):
+    """Return the ROI outlines of frame as [((r, g, b), closed, [(N, 2) arrays of fractional (column, row) pixel indices])].
+       Transversal images show the contours on the slice (closed polylines), sagittal and coronal images show where the contours
+       cross the image plane (points). Contour columns are x, y, z, i.e. column 2 - axis for volume axis."""
+    fixed, row_axis, col_axis, reverse, position, row_centre, col_centre, fov = frame
+    ct_z = axis_positions(ct_geometry, 0)
+    half_slice = (abs(ct_z[1] - ct_z[0]) if len(ct_z) > 1 else 0.2) / 2.
+    result = []
+    for name, colour, contours in rois:
+        lines = []
+        for contour in contours:
+            if len(contour) < 2:
+                continue
+            if fixed == 0:
+                if abs(contour[0, 2] - position) >= half_slice:
+                    continue
+                lines.append(np.stack([_to_pixels(contour[:, 0], col_centre, fov, size),
+                                       _to_pixels(contour[:, 1], row_centre, fov, size, reverse)], axis=1))
+            else:
+                crossings = _plane_crossings(contour, 2 - fixed, position)
+                lines.extend(np.stack([_to_pixels(crossings[:, 2 - col_axis], col_centre, fov, size),
+                                       _to_pixels(crossings[:, 2 - row_axis], row_centre, fov, size, reverse)], axis=1)[:, None, :])
+        if lines:
+            result.append((colour, fixed == 0, lines))
+    return result
+
+
+def render_slice(ct, ct_geometry, dose, dose_geometry, point, lut, levels, orientation='Transversal', fov=None, size=800,
+                 style='colorwash', rois=(), alpha=0.5, ct_downsample=1):
+    """Render a single dose image and return it as a (size, size, 3) uint8 array. For vector isodose lines see
+       render_slice_vectors().
+
+       ct, ct_geometry: CT volume [z, y, x] in HU and its VolumeGeometry.
+       dose, dose_geometry: Dose volume [z, y, x] in cGy and its VolumeGeometry.
+       point: {'x', 'y', 'z'} dict. The coordinate perpendicular to the image selects the slice (nearest CT slice, dose
+              interpolated to the position) and the in-plane coordinates are the image centre.
+       lut: Greyscale lookup table from window_lut().
+       levels: List of (dose [cGy], (r, g, b)) as returned by colormap_levels().
+       orientation: 'Transversal', 'Sagittal' or 'Coronal'.
+       fov: Square field of view in cm. Defaults to the larger CT extent in the image plane.
+       style: 'colorwash', 'isodose' or 'both'.
+       rois: List of (name, (r, g, b), [contour arrays]) as returned by roi_contours(). Transversal images show the contours
+             on the slice, sagittal and coronal images show where the contours cross the image plane.
+       ct_downsample: Integer factor by which the CT background is sampled more coarsely than the output image."""
+    frame = _frame(ct_geometry, point, orientation, fov)
+    fixed, row_axis, col_axis, reverse, position, row_centre, col_centre, fov = frame
+
+    # CT background.
+    grey = _ct_background(ct, ct_geometry, frame, lut, -(-size // ct_downsample))
+    if ct_downsample > 1:
+        grey = np.repeat(np.repeat(grey, ct_downsample, axis=0), ct_downsample, axis=1)[:size, :size]
+    image = np.repeat(grey[:, :, None], 3, axis=2).astype(np.float32)
+
+    # Dose overlay.
+    plane = _dose_plane(dose, dose_geometry, fixed, position)
+    if plane is not None and len(levels) > 0:
+        thresholds, colours, alphas = dose_lut(levels, alpha)
+        dose_img = _bilinear(plane,
+                             _fractional(axis_positions(dose_geometry, row_axis), _pixel_positions(row_centre, fov, size, reverse)),
+                             _fractional(axis_positions(dose_geometry, col_axis), _pixel_positions(col_centre, fov, size)))
+        index = np.searchsorted(thresholds, dose_img, side='right')
+        if style in ['colorwash', 'both']:
+            a = alphas[index][:, :, None]
+            image = image * (1 - a) + colours[index] * a
+        if style in ['isodose', 'both']:
+            edge, level = _level_edges(index)
+            image[edge] = colours[level[edge]]
+
+    # ROI outlines.
+    for colour, closed, lines in _roi_outlines(rois, ct_geometry, frame, size):
+        for line in lines:
+            if closed:
+                rows, cols = _polyline_pixels(line[:, 0], line[:, 1], size)
+            else:
+                rows, cols = np.rint(line[:, 1]).astype(np.intp), np.rint(line[:, 0]).astype(np.intp)
+                keep = (rows >= 0) & (rows < size) & (cols >= 0) & (cols < size)
+                rows, cols = rows[keep], cols[keep]
+            image[rows, cols] = colour
+
+    return np.clip(image, 0, 255).astype(np.uint8)
+
+
+def render_slice_vectors(ct, ct_geometry, dose, dose_geometry, point, lut, levels, orientation='Transversal', fov=None, size=800,
+                         rois=(), ct_downsample=2, isodose_cache=None):
+    """Render a dose image with vector isodose lines (isodose_lines() on the nearest dose grid slice) and ROI outlines over a
+       downsampled CT, for write_pdf(). Arguments are as for render_slice().
+
+       Returns (background, layers): background is the (size / ct_downsample) square uint8 greyscale CT, and layers is a list of
+       ((r, g, b), closed, [(N, 2) arrays]) polylines in fractional (column, row) pixel indices of a size x size image. Open
+       polylines of a single point are drawn as dots."""
+    frame = _frame(ct_geometry, point, orientation, fov)
+    fixed, row_axis, col_axis, reverse, position, row_centre, col_centre, fov = frame
+    background = _ct_background(ct, ct_geometry, frame, lut, -(-size // ct_downsample))
+
+    layers = []
+    kd, kd_inside = _nearest(axis_positions(dose_geometry, fixed), np.array([position]))
+    if kd_inside[0]:
+        for level, colour, polylines in isodose_lines(dose, dose_geometry, kd[0], levels, isodose_cache, axis=fixed):
+            lines = [np.stack([_to_pixels(line[:, 0], col_centre, fov, size), _to_pixels(line[:, 1], row_centre, fov, size, reverse)],
+                              axis=1) for line in polylines]
+            if lines:
+                layers.append((colour, False, lines))
+    return background, layers + _roi_outlines(rois, ct_geometry, frame, size)
+
+
+def write_pdf(filename, background, layers, size, line_width=1.5):
+    """Write a single page pdf of size x size points: the greyscale background image scaled to the page, with the layers of
+       render_slice_vectors() drawn as vector paths. The report backend (MigraDoc) places pdf files like images, so the lines stay
+       sharp at any zoom and the file holds only the downsampled CT."""
+    h, w = background.shape
+    content = ['q %g 0 0 %g 0 0 cm /Im0 Do Q' % (size, size), '%g w 1 J 1 j' % line_width]
+    for colour, closed, lines in layers:
+        content.append('%.3f %.3f %.3f RG' % tuple(each / 255. for each in colour))
+        for line in lines:
+            x, y = line[:, 0] + 0.5, size - (line[:, 1] + 0.5)  # Pixel centres, pdf y axis points up.
+            path = ['%.2f %.2f m' % (x[0], y[0])] + ['%.2f %.2f l' % each for each in zip(x[1:].tolist(), y[1:].tolist())]
+            if len(line) == 1:
+                path.append('%.2f %.2f l' % (x[0], y[0]))
+            content.append(' '.join(path) + (' s' if closed else ' S'))
+    stream = zlib.compress('\n'.join(content).encode('ascii'), 6)
+    pixels = zlib.compress(np.ascontiguousarray(background, dtype=np.uint8).tobytes(), 6)
+
+    objects = [b'<< /Type /Catalog /Pages 2 0 R >>',
+               b'<< /Type /Pages /Kids [3 0 R] /Count 1 >>',
+               ('<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %i %i] /Resources << /XObject << /Im0 4 0 R >> >> /Contents 5 0 R >>'
+                % (size, size)).encode('ascii'),
+               ('<< /Type /XObject /Subtype /Image /Width %i /Height %i /ColorSpace /DeviceGray /BitsPerComponent 8 '
+                '/Filter /FlateDecode /Length %i >>\nstream\n' % (w, h, len(pixels))).encode('ascii') + pixels + b'\nendstream',
+               ('<< /Filter /FlateDecode /Length %i >>\nstream\n' % len(stream)).encode('ascii') + stream + b'\nendstream']
+    data = bytearray(b'%PDF-1.4\n')
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(data))
+        data += b'%i 0 obj\n' % number + body + b'\nendobj\n'
+    xref = len(data)
+    data += b'xref\n0 %i\n0000000000 65535 f \n' % (len(objects) + 1)
+    data += b''.join(b'%010i 00000 n \n' % each for each in offsets)
+    data += b'trailer\n<< /Size %i /Root 1 0 R >>\nstartxref\n%i\n%%%%EOF\n' % (len(objects) + 1, xref)
+    with open(filename, 'wb') as f:
+        f.write(bytes(data))
+
+
+def write_png(filename, image):
+    """Write an (h, w, 3) uint8 array to an RGB png file."""
+    h, w = image.shape[:2]
+    raw = np.zeros((h, w * 3 + 1), dtype=np.uint8)  # Leading zero on each row is the 'None' filter type.
+    raw[:, 1:] = np.ascontiguousarray(image, dtype=np.uint8).reshape(h, w * 3)
+
+    def chunk(tag, data):
+        return struct.pack('>I', len(data)) + tag + data + struct.pack('>I', zlib.crc32(tag + data) & 0xffffffff)
+
+    with open(filename, 'wb') as f:
+        f.write(b'\x89PNG\r\n\x1a\n')
+        f.write(chunk(b'IHDR', struct.pack('>IIBBBBB', w, h, 8, 2, 0, 0, 0)))
+        f.write(chunk(b'IDAT', zlib.compress(raw.tobytes(), 6)))
+        f.write(chunk(b'IEND', b''))
+
+
+#########################
+#                       #
+#  Isodose Lines        #
+#                       #
+#########################
+
+# Marching squares segments for each cell case. Corners a, b, c, d are (row, col), (row, col + 1), (row + 1, col + 1),
+# (row + 1, col) and case = a + 2b + 4c + 8d for corners at or above the level. Edges are 0: a-b, 1: b-c, 2: d-c, 3: a-d.
+# Cases 16 and 17 are the saddles 5 and 10 with the cell centre at or above the level.
+_MS_SEGMENTS = np.array([
+    [[-1, -1], [-1, -1]], [[3, 0], [-1, -1]], [[0, 1], [-1, -1]], [[3, 1], [-1, -1]],
+    [[1, 2], [-1, -1]], [[3, 0], [1, 2]], [[0, 2], [-1, -1]], [[3, 2], [-1, -1]],
+    [[2, 3], [-1, -1]], [[0, 2], [-1, -1]], [[0, 1], [2, 3]], [[1, 2], [-1, -1]],
+    [[1, 3], [-1, -1]], [[0, 1], [-1, -1]], [[3, 0], [-1, -1]], [[-1, -1], [-1, -1]],
+    [[0, 1], [2, 3]], [[3, 0], [1, 2]]], dtype=np.intp)
+
+
+def isodose_segments(plane, level):
+    """Vectorized marching squares. Returns (points, edge_ids) where points is an (M, 2, 2) array of segment end points as
+       fractional (row, col) indices of plane and edge_ids is an (M, 2) array identifying the grid edge of each end point, so that
+       segments sharing an end point share an edge id."""
+    plane = np.asarray(plane, dtype=np.float32)
+    ny, nx = plane.shape
+    a, b, c, d = plane[:-1, :-1], plane[:-1, 1:], plane[1:, 1:], plane[1:, :-1]
+    case = (a >= level) * 1 + (b >= level) * 2 + (c >= level) * 4 + (d >= level) * 8
+    saddle = ((case == 5) | (case == 10)) & ((a + b + c + d) / 4. >= level)
+    case = np.where(saddle, np.where(case == 5, 16, 17), case)
+
+    rows, cols = np.nonzero((case != 0) & (case != 15))
+    if len(rows) == 0:
+        return np.zeros((0, 2, 2), dtype=np.float32), np.zeros((0, 2), dtype=np.intp)
+    a, b, c, d = a[rows, cols], b[rows, cols], c[rows, cols], d[rows, cols]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = np.stack([(level - a) / (b - a), (level - b) / (c - b), (level - d) / (c - d), (level - a) / (d - a)])
+    r, q = rows.astype(np.float32), cols.astype(np.float32)
+    # Edge crossing points (row, col) and edge ids for each of the four edges of each cell. Horizontal edges are numbered
+    # row * nx + col and vertical edges ny * nx + row * nx + col.
+    edge_points = np.stack([np.stack([r, q + t[0]]), np.stack([r + t[1], q + 1]),
+                            np.stack([r + 1, q + t[2]]), np.stack([r + t[3], q])])
+    edge_ids = np.stack([rows * nx + cols, ny * nx + rows * nx + cols + 1,
+                         (rows + 1) * nx + cols, ny * nx + rows * nx + cols])
+
+    table = _MS_SEGMENTS[case[rows, cols]]  # (K, 2 segments, 2 edges)
+    cell, slot = np.nonzero(table[:, :, 0] >= 0)
+    edges = table[cell, slot]  # (M, 2)
+    points = edge_points[edges, :, cell[:, None]]  # (M, 2, 2)
+    ids = edge_ids[edges, cell[:, None]]
+    return points.astype(np.float32), ids
+
+
+def _join_segments(points, ids):
+    """Chain marching squares segments that share an edge into polylines. Returns a list of (N, 2) arrays of (row, col)."""
+    ends = {}
+    for i, (e0, e1) in enumerate(ids.tolist()):
+        ends.setdefault(e0, []).append(i)
+        ends.setdefault(e1, []).append(i)
+    used = np.zeros(len(ids), dtype=bool)
+    id_list = ids.tolist()
+    result = []
+
+    def walk(seg, edge):
+        chain = []
+        while True:
+            nxt = [each for each in ends[edge] if not used[each]]
+            if not nxt:
+                return chain
+            seg = nxt[0]
+            used[seg] = True
+            e0, e1 = id_list[seg]
+            if e0 == edge:
+                chain.append(points[seg, 1])
+                edge = e1
+            else:
+                chain.append(points[seg, 0])
+                edge = e0
+
+    for i in range(len(ids)):
+        if used[i]:
+            continue
+        used[i] = True
+        forward = walk(i, id_list[i][1])
+        backward = walk(i, id_list[i][0])
+        line = backward[::-1] + [points[i, 0], points[i, 1]] + forward
+        result.append(np.array(line, dtype=np.float32))
+    return result
+
+
+class IsodoseCache(object):
+    """Per-slice cache of isodose polylines. Entries are keyed by a checksum of the dose plane, the dose grid geometry and the
+       levels, so a reprint of the same dose is instant and a changed dose is never served stale. If a cache_directory is
+       supplied entries are also written to disk as npz arrays (loaded without pickle), which lets worker processes and later
+       sessions share them. The least recently used files are removed once the directory exceeds max_bytes."""
+
+    def __init__(self, cache_directory=None, max_bytes=ISODOSE_CACHE_BYTES):
+        self.cache_directory = cache_directory
+        self.max_bytes = max_bytes
+        self.entries = {}
+        if cache_directory is not None and not os.path.exists(cache_directory):
+            os.makedirs(cache_directory, mode=0o700)
+
+    @staticmethod
+    def key(plane, geometry, position, thresholds):
+        checksum = zlib.crc32(np.ascontiguousarray(plane, dtype=np.float32).tobytes())
+        params = (geometry.x0, geometry.y0, geometry.dx, geometry.dy, position[0], round(float(position[1]), 4),
+                  tuple(thresholds))
+        return '%08x_%08x' % (checksum, zlib.crc32(repr(params).encode()))
+
+    def _filename(self, key):
+        return os.path.join(self.cache_directory, key + '.npz')
+
+    @staticmethod
+    def _arrays(value):
+        """Flatten isodose_lines() output into plain arrays."""
+        polylines = [line for level, colour, lines in value for line in lines]
+        return {'levels': np.array([level for level, colour, lines in value], dtype=np.float64),
+                'colours': np.array([colour for level, colour, lines in value], dtype=np.int64).reshape(-1, 3),
+                'counts': np.array([len(lines) for level, colour, lines in value], dtype=np.int64),
+                'lengths': np.array([len(line) for line in polylines], dtype=np.int64),
+                'points': np.concatenate(polylines).astype(np.float32) if polylines else np.zeros((0, 2), dtype=np.float32)}
+
+    @staticmethod
+    def _value(arrays):
+        """Inverse of _arrays()."""
+        lines = np.split(arrays['points'], np.cumsum(arrays['lengths'])[:-1]) if len(arrays['lengths']) else []
+        bounds = np.concatenate([[0], np.cumsum(arrays['counts'])]).tolist()
+        return [(float(level), tuple(colour), lines[bounds[i]:bounds[i + 1]])
+                for i, (level, colour) in enumerate(zip(arrays['levels'].tolist(), arrays['colours'].tolist()))]
+
+    def get(self, key):
+        if key in self.entries:
+            return self.entries[key]
+        if self.cache_directory is not None:
+            filename = self._filename(key)
+            if os.path.exists(filename):
+                try:
+                    with np.load(filename, allow_pickle=False) as arrays:
+                        self.entries[key] = self._value(arrays)
+                    os.utime(filename)
+                except (OSError, ValueError, KeyError) as e:
+                    print(f'Could not read cached isodose lines {filename}. Error: {e}')
+                    return None
+                return self.entries[key]
+        return None
+
+    def put(self, key, value):
+        self.entries[key] = value
+        if self.cache_directory is not None:
+            temporary = self._filename(key) + '.tmp.npz'
+            np.savez(temporary, **self._arrays(value))
+            os.replace(temporary, self._filename(key))
+            self.evict(keep=key)
+
+    def evict(self, keep=None):
+        """Remove least recently used files until the cache directory is below max_bytes. The entry keep is never removed."""
+        files = []
+        for name in os.listdir(self.cache_directory):
+            if name.endswith('.npz') and not name.endswith('.tmp.npz'):
+                stat = os.stat(os.path.join(self.cache_directory, name))
+                files.append((stat.st_mtime, stat.st_size, name))
+        total = sum(size for access, size, name in files)
+        for access, size, name in sorted(files):
+            if total <= self.max_bytes:
+                break
+            if name == keep + '.npz':
+                continue
+            try:
+                os.remove(os.path.join(self.cache_directory, name))
+            except OSError as e:
+                print(f'Could not remove cached isodose lines {name}. Error: {e}')
+            total -= size
+
+
+def isodose_lines(dose, geometry, k, levels, cache=None, axis=0):
+    """Extract the isodose lines of dose grid slice k along axis (0: transversal, 1: coronal, 2: sagittal) for each colour map
+       level. Returns a list of (dose [cGy], (r, g, b), [polylines]) where each polyline is an (N, 2) float32 array of patient
+       coordinates in cm along the (column, row) axes of ORIENTATIONS, i.e. (x, y) for transversal slices.
+
+       dose, geometry: Dose volume [z, y, x] and its VolumeGeometry.
+       levels: List of (dose [cGy], (r, g, b)) as returned by colormap_levels().
+       cache: Optional IsodoseCache."""
+    plane = np.take(dose, k, axis=axis)
+    row_axis, col_axis = [each for each in range(3) if each != axis]
+    rows, cols = axis_positions(geometry, row_axis), axis_positions(geometry, col_axis)
+    thresholds = [float(each[0]) for each in levels]
+    if cache is not None:
+        key = cache.key(plane, geometry, (axis, axis_positions(geometry, axis)[k]), thresholds)
+        result = cache.get(key)
+        if result is not None:
+            return result
+
+    result = []
+    for level, colour in levels:
+        points, ids = isodose_segments(plane, level)
+        polylines = []
+        for line in _join_segments(points, ids):
+            xy = np.empty_like(line)
+            xy[:, 0] = cols[0] + line[:, 1] * (cols[1] - cols[0] if len(cols) > 1 else 0.)
+            xy[:, 1] = rows[0] + line[:, 0] * (rows[1] - rows[0] if len(rows) > 1 else 0.)
+            polylines.append(xy)
+        result.append((level, colour, polylines))
+
+    if cache is not None:
+        cache.put(key, result)
+    return result
+
+
+#########################
+#                       #
+#  Hotspot              #
+#                       #
+#########################
+
+def sample_dose(dose, geometry, points):
+    """Trilinear interpolation of the dose at an (N, 3) array of x, y, z points. Points outside the dose grid are zero."""
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+    f = [_fractional(axis_positions(geometry, axis), points[:, 2 - axis]) for axis in range(3)]  # z, y, x
+    inside = np.all([(f[axis] >= -0.5) & (f[axis] <= dose.shape[axis] - 0.5) for axis in range(3)], axis=0)
+    i0, w = [], []
+    for axis in range(3):
+        fa = np.clip(f[axis], 0, dose.shape[axis] - 1)
+        ia = np.minimum(fa.astype(np.intp), max(dose.shape[axis] - 2, 0))
+        i0.append(ia)
+        w.append(fa - ia)
+    result = np.zeros(len(points))
+    for dz in (0, 1):
+        for dy in (0, 1):
+            for dx in (0, 1):
+                iz = np.minimum(i0[0] + dz, dose.shape[0] - 1)
+                iy = np.minimum(i0[1] + dy, dose.shape[1] - 1)
+                ix = np.minimum(i0[2] + dx, dose.shape[2] - 1)
+                weight = (w[0] if dz else 1 - w[0]) * (w[1] if dy else 1 - w[1]) * (w[2] if dx else 1 - w[2])
+                result += dose[iz, iy, ix] * weight
+    return np.where(inside, result, 0.)
+
+
+def dose_profile(dose, geometry, centre, offsets):
+    """Return a (3, len(offsets)) array of the dose along x, y and z through centre (x, y, z) at the given offsets in cm."""
+    offsets = np.asarray(offsets, dtype=np.float64)
+    points = np.repeat(np.asarray(centre, dtype=np.float64)[None, :], 3 * len(offsets), axis=0).reshape(3, len(offsets), 3)
+    for axis in range(3):
+        points[axis, :, axis] += offsets
+    return sample_dose(dose, geometry, points.reshape(-1, 3)).reshape(3, len(offsets))
+
+
+def hotspot_fov(dose, geometry, fraction=0.9, margin=1.0, minimum=3.0):
+    """Return the centre (x, y, z) of the maximum dose voxel and the side of a square transversal field of view (cm) that tightly
+       encloses the connected region above fraction of the maximum dose on that slice, plus margin."""
+    k, j, i = np.unravel_index(np.argmax(dose), dose.shape)
+    plane = dose[k]
+    mask = plane >= fraction * plane[j, i]
+    region = np.zeros(mask.shape, dtype=bool)
+    region[j, i] = True
+    while True:  # Grow the region from the hotspot through the mask (4-connectivity).
+        grown = region.copy()
+        grown[1:, :] |= region[:-1, :]
+        grown[:-1, :] |= region[1:, :]
+        grown[:, 1:] |= region[:, :-1]
+        grown[:, :-1] |= region[:, 1:]
+        grown &= mask
+        if (grown == region).all():
+            break
+        region = grown
+    rows, cols = np.nonzero(region)
+    width = (cols.max() - cols.min() + 1) * geometry.dx
+    height = (rows.max() - rows.min() + 1) * geometry.dy
+    centre = (float(geometry.x0 + i * geometry.dx), float(geometry.y0 + j * geometry.dy), float(axis_positions(geometry, 0)[k]))
+    return centre, float(max(width + 2 * margin, height + 2 * margin, minimum))
+
+
+#########################
+#                       #
+#  Parallel Rendering   #
+#                       #
+#########################
+
+_worker_state = {}
+
+
+def _init_worker(state):
+    """Process pool initializer. The volumes are sent once per worker rather than once per slice."""
+    _worker_state.clear()
+    _worker_state.update(state)
+
+
+def _render_task(task):
+    """Render and save one slice using the volumes stored by _init_worker()."""
+    orientation, point, fov, filename = task
+    s = _worker_state
+    if s['style'] == 'lines':
+        background, layers = render_slice_vectors(s['ct'], s['ct_geometry'], s['dose'], s['dose_geometry'], point, s['lut'],
+                                                  s['levels'], orientation=orientation, fov=fov, size=s['size'], rois=s['rois'],
+                                                  ct_downsample=s['ct_downsample'], isodose_cache=s['isodose_cache'])
+        write_pdf(filename, background, layers, s['size'])
+        return filename
+    image = render_slice(s['ct'], s['ct_geometry'], s['dose'], s['dose_geometry'], point, s['lut'], s['levels'],
+                         orientation=orientation, fov=fov, size=s['size'], style=s['style'], rois=s['rois'], alpha=s['alpha'],
+                         ct_downsample=s['ct_downsample'])
+    write_png(filename, image)
+    return filename
+
+
+def render_slices(ct, ct_geometry, dose, dose_geometry, levels, points, output_directory=None, fov=None, size=800,
+                  style='colorwash', rois=(), window=(40, 400), alpha=0.5, processes=None, ct_downsample=1,
+                  isodose_cache_directory=None, orientations=None):
+    """Render a png for each of the supplied points and return the list of file names in the same order, i.e. a drop-in
+       replacement for BeamSet.GetDoseImages(Orientations=orientations, Points=points, ...). With style='lines' a pdf with vector
+       isodose lines and ROI outlines over the downsampled CT is written instead (render_slice_vectors(), write_pdf()).
+
+       points: List of {'x': x, 'y': y, 'z': z} dicts, see render_slice().
+       orientations: List with the orientation of each point. Defaults to all 'Transversal'.
+       fov: Field of view in cm (see render_slice()), or a list with the field of view of each point.
+       output_directory: Directory for the images. A new temporary directory is created if not supplied.
+       style: 'colorwash', 'isodose' or 'both' (see render_slice()), or 'lines'.
+       ct_downsample: See render_slice(). Combined with style='lines' this gives small, sharp images.
+       isodose_cache_directory: Directory for the IsodoseCache used by style='lines', shared between the worker processes.
+       processes: Number of worker processes. None uses os.cpu_count(), 1 renders in the current process. Rendering falls back
+                  to the current process if a pool cannot be started (e.g. from an embedded interpreter)."""
+    if output_directory is None:
+        output_directory = tempfile.mkdtemp(prefix='dose_slices_')
+    state = {'ct': ct, 'ct_geometry': ct_geometry, 'dose': dose, 'dose_geometry': dose_geometry, 'levels': levels,
+             'lut': window_lut(*window), 'size': size, 'style': style, 'rois': list(rois), 'alpha': alpha,
+             'ct_downsample': ct_downsample, 'isodose_cache': IsodoseCache(isodose_cache_directory)}
+    if orientations is None:
+        orientations = ['Transversal'] * len(points)
+    if not isinstance(fov, (list, tuple)):
+        fov = [fov] * len(points)
+    extension = 'pdf' if style == 'lines' else 'png'
+    tasks = [(orientation, point, point_fov, os.path.join(output_directory, 'slice_%04i.%s' % (i, extension)))
+             for i, (orientation, point, point_fov) in enumerate(zip(orientations, points, fov))]
+
+    if processes is None:
+        processes = os.cpu_count() or 1
+    processes = min(processes, len(tasks))
+    if processes > 1:
+        try:
+            with ProcessPoolExecutor(max_workers=processes, initializer=_init_worker, initargs=(state,)) as pool:
+                return list(pool.map(_render_task, tasks, chunksize=max(1, len(tasks) // (4 * processes))))
+        except Exception as e:
+            print(f'Could not render slices in parallel, rendering serially. Error: {e}')
+
+    _init_worker(state)
+    return [_render_task(task) for task in tasks]
@@ -0,0 +1,363 @@
+# -------------------------------------------------------------------------------
+# Name:        Interop (v1.00)
+#
+# Written for RS Version: 2023B
+#
+# Purpose:     Opt-in tracing of the RayStation scripting interface. When tracing is enabled, get_current() returns proxies that record
+#              every attribute read, attribute write and method call on the scripting objects (and the objects reached from them) with
+#              the calling line of script code, the number of calls and the wall time spent in the scripting interface. An aggregated
+#              profile is written when the script exits.
+#
+# Note:        Tracing is enabled by setting the environment variable XUW_TRACE (to 1, or to the profile filename) before RayStation
+#              starts, or by calling enable_tracing() before importing the modules that use get_current (xUWScriptingUtilities). When
+#              disabled, get_current is connect.get_current itself, so there is no overhead.
+#
+#              The profile is a json file (one entry per API path and call site, sorted by total time) and a .folded file next to it in
+#              the collapsed stack format read by flamegraph.pl and speedscope ("call site;API path <microseconds>").
+#
+#              prefetch() reads independent properties behind one interface. Reads are serial by default; with PARALLEL_READS True
+#              (XUW_PARALLEL_READS=1) they run together through a small thread pool, so their round trips to the scripting service
+#              overlap. Only enable this once concurrent calls have been verified and measured against the RayStation version in use.
+#              Reads are always serial while tracing or recording, so traces and recordings stay deterministic.
+#
+#              enable_recording() (or the XUW_RECORD environment variable) records the accesses and their results for replay, see
+#              xUWReplay.
+#
+#              Values of basic python types are returned unwrapped. Arguments of traced method calls are unwrapped before the call, so
+#              proxies can be passed back into the scripting interface.
+#
+# Created:     19 October 2026 (v1.00)
+# -------------------------------------------------------------------------------
+
+import atexit
+import json
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import connect
+
+TRACE_VARIABLE = 'XUW_TRACE'
+RECORD_VARIABLE = 'XUW_RECORD'
+PARALLEL_READS = os.environ.get('XUW_PARALLEL_READS', '0') == '1'  # Opt-in, only where the scripting service allows concurrent calls.
+READ_WORKERS = 4
+PLAIN_TYPES = (bool, int, float, complex, str, bytes, type(None))
+
+
+class Tracer(object):
+    """Aggregates traced scripting interface accesses as {(API path, call site): [count, total seconds, max seconds]}."""
+
+    def __init__(self, filename=None):
+        self.filename = filename or os.path.join(tempfile.gettempdir(), 'xUW_trace_%s.json' % time.strftime('%Y%m%d_%H%M%S'))
+        self.entries = {}
+        self.started = time.perf_counter()
+
+    def record(self, path, seconds):
+        site = call_site()
+        entry = self.entries.get((path, site))
+        if entry is None:
+            self.entries[(path, site)] = [1, seconds, seconds]
+        else:
+            entry[0] += 1
+            entry[1] += seconds
+            entry[2] = max(entry[2], seconds)
+
+    def profile(self):
+        """Return the aggregated entries sorted by total time, and totals."""
+        entries = [{'path': path, 'site': site, 'count': count, 'total': total, 'max': longest}
+                   for (path, site), (count, total, longest) in self.entries.items()]
+        entries.sort(key=lambda x: -x['total'])
+        return {'wall_time': time.perf_counter() - self.started,
+                'api_time': sum(each['total'] for each in entries),
+                'api_calls': sum(each['count'] for each in entries),
+                'entries': entries}
+
+    def write(self):
+        """Write the json profile and the .folded flamegraph file. Returns the profile."""
+        profile = self.profile()
+        with open(self.filename, 'w') as f:
+            json.dump(profile, f, indent=1)
+        with open(os.path.splitext(self.filename)[0] + '.folded', 'w') as f:
+            for each in profile['entries']:
+                f.write('%s;%s %i\n' % (each['site'].replace(';', ','), each['path'].replace(';', ','),
+                                        max(1, round(each['total'] * 1e6))))
+        return profile
+
+    def report(self, top=20):
+        """Print the API paths with the largest total time."""
+        profile = self.profile()
+        print('Scripting interface: %i calls, %.2f s of %.2f s wall time' % (profile['api_calls'], profile['api_time'], profile['wall_time']))
+        for each in profile['entries'][:top]:
+            print('%9.3f s %7i x  %-60s %s' % (each['total'], each['count'], each['path'], each['site']))
+
+
+def call_site():
+    """Return 'file:line (function)' of the first frame outside this module."""
+    frame = sys._getframe(1)
+    while frame is not None and frame.f_code.co_filename == __file__:
+        frame = frame.f_back
+    if frame is None:
+        return '?'
+    return '%s:%i (%s)' % (os.path.basename(frame.f_code.co_filename), frame.f_lineno, frame.f_code.co_name)
+
+
+def unwrap(value):
+    """Return the scripting object behind a proxy (also inside lists, tuples and dicts)."""
+    if isinstance(value, Traced):
+        return object.__getattribute__(value, '_obj')
+    if isinstance(value, (list, tuple)):
+        return type(value)(unwrap(each) for each in value)
+    if isinstance(value, dict):
+        return {key: unwrap(each) for key, each in value.items()}
+    return value
+
+
+def wrap(value, path, tracer):
+    if isinstance(value, PLAIN_TYPES) or isinstance(value, Traced):
+        return value
+    return Traced(value, path, tracer)
+
+
+class Traced(object):
+    """Proxy of a scripting object. path is the API path it was reached by, e.g. 'Case.PatientModel.RegionsOfInterest[]'."""
+    __slots__ = ('_obj', '_path', '_tracer')
+
+    def __init__(self, obj, path, tracer):
+        object.__setattr__(self, '_obj', obj)
+        object.__setattr__(self, '_path', path)
+        object.__setattr__(self, '_tracer', tracer)
+
+    def __getattr__(self, name):
+        if name.startswith('__'):  # Protocol lookups (e.g. numpy __array_interface__) use the methods below.
+            raise AttributeError(name)
+        obj, tracer = object.__getattribute__(self, '_obj'), object.__getattribute__(self, '_tracer')
+        path = '%s.%s' % (object.__getattribute__(self, '_path'), name)
+        start = time.perf_counter()
+        value = getattr(obj, name)
+        tracer.record(path, time.perf_counter() - start)
+        if callable(value) and not isinstance(value, type):
+            return TracedMethod(value, path, tracer)
+        return wrap(value, path, tracer)
+
+    def __setattr__(self, name, value):
+        tracer = object.__getattribute__(self, '_tracer')
+        start = time.perf_counter()
+        setattr(object.__getattribute__(self, '_obj'), name, unwrap(value))
+        tracer.record('%s.%s=' % (object.__getattribute__(self, '_path'), name), time.perf_counter() - start)
+
+    def _traced(self, label, function, *args):
+        tracer = object.__getattribute__(self, '_tracer')
+        path = object.__getattribute__(self, '_path') + label
+        start = time.perf_counter()
+        value = function(object.__getattribute__(self, '_obj'), *args)
+        tracer.record(path, time.perf_counter() - start)
+        return wrap(value, path, tracer)
+
+    def __getitem__(self, key):
+        return Traced._traced(self, '[]', lambda obj, key: obj[key], unwrap(key))
+
+    def __setitem__(self, key, value):
+        Traced._traced(self, '[]=', lambda obj, key, value: obj.__setitem__(key, value), unwrap(key), unwrap(value))
+
+    def __iter__(self):
+        tracer = object.__getattribute__(self, '_tracer')
+        path = object.__getattribute__(self, '_path') + '[]'
+        iterator = iter(object.__getattribute__(self, '_obj'))
+        while True:
+            start = time.perf_counter()
+            try:
+                value = next(iterator)
+            except StopIteration:
+                return
+            tracer.record(path, time.perf_counter() - start)
+            yield wrap(value, path, tracer)
+
+    def __len__(self):
+        return len(object.__getattribute__(self, '_obj'))
+
+    def __contains__(self, item):
+        return unwrap(item) in object.__getattribute__(self, '_obj')
+
+    def __bool__(self):
+        return bool(object.__getattribute__(self, '_obj'))
+
+    def __eq__(self, other):
+        return object.__getattribute__(self, '_obj') == unwrap(other)
+
+    def __ne__(self, other):
+        return object.__getattribute__(self, '_obj') != unwrap(other)
+
+    def __hash__(self):
+        return hash(object.__getattribute__(self, '_obj'))
+
+    def __str__(self):
+        return str(object.__getattribute__(self, '_obj'))
+
+    def __repr__(self):
+        return 'Traced(%r)' % (object.__getattribute__(self, '_obj'),)
+
+    def __array__(self, dtype=None, copy=None):
+        import numpy as np
+        tracer = object.__getattribute__(self, '_tracer')
+        start = time.perf_counter()
+        value = np.asarray(object.__getattribute__(self, '_obj'), dtype=dtype)
+        tracer.record(object.__getattribute__(self, '_path') + '.__array__', time.perf_counter() - start)
+        return value
+
+    def __enter__(self):
+        return object.__getattribute__(self, '_obj').__enter__()
+
+    def __exit__(self, *args):
+        return object.__getattribute__(self, '_obj').__exit__(*args)
+
+
+class TracedMethod(Traced):
+    """Proxy of a callable attribute (a scripting object method); records the call as 'path()'. Other accesses are traced as for Traced."""
+    __slots__ = ()
+
+    def __call__(self, *args, **kwargs):
+        method, path, tracer = (object.__getattribute__(self, each) for each in ('_obj', '_path', '_tracer'))
+        start = time.perf_counter()
+        value = method(*unwrap(args), **unwrap(kwargs))
+        tracer.record(path + '()', time.perf_counter() - start)
+        return wrap(value, path + '()', tracer)
+
+
+_tracer = None
+
+
+def enable_tracing(filename=None, report=True):
+    """Trace the objects returned by get_current() from now on and write the profile at exit. Returns the Tracer."""
+    global _tracer, get_current
+    if _tracer is None:
+        _tracer = Tracer(filename)
+        get_current = traced_get_current
+
+        def finish():
+            _tracer.write()
+            if report:
+                _tracer.report()
+            print('Scripting interface trace written to ' + _tracer.filename)
+
+        atexit.register(finish)
+    return _tracer
+
+
+_recorder = None
+
+
+def enable_recording(filename):
+    """Record the objects returned by get_current() from now on (see xUWReplay) and save the recording to filename at exit.
+       Returns the xUWReplay.Recorder. If recording is already enabled the active Recorder is returned and filename is ignored."""
+    global _recorder, get_current
+    if _recorder is not None:
+        return _recorder
+    import xUWReplay
+    _recorder = xUWReplay.Recorder(get_current, filename)
+    get_current = _recorder.get_current
+
+    def finish():
+        print('Scripting interface recording written to ' + _recorder.save())
+
+    atexit.register(finish)
+    return _recorder
+
+
+def tracer():
+    """Return the active Tracer, or None if tracing is disabled."""
+    return _tracer
+
+
+def recorder():
+    """Return the active xUWReplay.Recorder, or None if recording is disabled."""
+    return _recorder
+
+
+def traced_get_current(name):
+    start = time.perf_counter()
+    value = connect.get_current(name)
+    _tracer.record('get_current(%s)' % name, time.perf_counter() - start)
+    return wrap(value, name, _tracer)
+
+
+#########################
+#                       #
+#  Prefetching Reads    #
+#                       #
+#########################
+
+
+def read_path(obj, path):
+    """Return the value of a dotted attribute path of obj, e.g. read_path(examination, 'Series.0.ImageStack.SlicePositions'). Parts that
+       are integers index into collections. Unlike _attribute() in xUWScriptingUtilities, errors are raised."""
+    for each in path.split('.'):
+        obj = obj[int(each)] if each.isdigit() else getattr(obj, each)
+    return obj
+
+
+class Prefetch(object):
+    """Results of prefetch(): prefetched[name] waits for and returns a read (raising its error), get(name, default) returns default if
+       the read failed."""
+
+    def __init__(self, futures):
+        self.futures = futures
+
+    def __getitem__(self, name):
+        return self.futures[name].result()
+
+    def __contains__(self, name):
+        return name in self.futures
+
+    def get(self, name, default=None):
+        try:
+            return self[name]
+        except Exception:
+            return default
+
+    def error(self, name):
+        """The exception raised by a read, or None."""
+        return self.futures[name].exception()
+
+    def wait(self):
+        """Wait for all reads. Returns self."""
+        for future in self.futures.values():
+            future.exception()
+        return self
+
+
+_executor = None
+
+
+def prefetch(reads, workers=None):
+    """Start independent reads of the scripting interface and return a Prefetch of their results.
+
+       reads: {name: read}, where a read is a callable without arguments or an (object, dotted path) tuple, see read_path().
+       workers: Size of the thread pool, READ_WORKERS by default. With workers <= 1, PARALLEL_READS False or tracing/recording
+                enabled the reads are done serially before prefetch() returns."""
+    global _executor
+    workers = READ_WORKERS if workers is None else workers
+    calls = {name: read if callable(read) else (lambda read=read: read_path(*read)) for name, read in reads.items()}
+    futures = {}
+    if PARALLEL_READS and workers > 1 and _tracer is None and _recorder is None:
+        if _executor is None or _executor._max_workers != workers:
+            _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='xUWRead')
+        for name, call in calls.items():
+            futures[name] = _executor.submit(call)
+    else:
+        for name, call in calls.items():
+            futures[name] = Future()
+            try:
+                futures[name].set_result(call())
+            except Exception as e:
+                futures[name].set_exception(e)
+    return Prefetch(futures)
+
+
+get_current = connect.get_current
+
+if os.environ.get(TRACE_VARIABLE):
+    enable_tracing(None if os.environ[TRACE_VARIABLE] in ('1', 'true', 'True') else os.environ[TRACE_VARIABLE])
+if os.environ.get(RECORD_VARIABLE):
+    enable_recording(os.environ[RECORD_VARIABLE])
@@ -0,0 +1,447 @@
+# -------------------------------------------------------------------------------
+# Name:        Replay (v1.00)
+#
+# Written for RS Version: 2023B
+#
+# Purpose:     Records the scripting interface accesses of a real run (every attribute read and write, item access, iteration step and
+#              method call on the objects returned by get_current, with their results and durations) into one compressed file, and
+#              replays the recording without RayStation with the recorded per-call latencies, scaled latencies or none.
+#
+# Note:        Recording is enabled with xUWInterop.enable_recording() or the XUW_RECORD environment variable (the recording filename).
+#              Arrays (e.g. DoseData) and large byte strings (PixelData) are stored as numpy arrays; all other results are stored
+#              as json. String values of the ANONYMIZE attributes of the Patient are stored as pseudonyms (the recorded run itself
+#              sees the real values).
+#
+#              Objects are identified by the access that reached them, e.g. the first item of Case.PatientModel.RegionsOfInterest;
+#              repeating an access reaches the same object.
+#              The replay looks accesses up by object and access rather than by order, so changed code (e.g. an optimization that
+#              reads fewer properties) can be replayed as long as every access it makes was recorded; an access that was not
+#              recorded raises ReplayMiss. Repeated accesses return the recorded results in order, the last one once exhausted.
+#              Attribute writes are kept by the replay objects and returned by later reads.
+#
+#              python xUWReplay.py recording.npz roi_setup --latency recorded    replays one of the xUWStandIn BENCHMARKS or a script.
+#
+# Created:     19 October 2026 (v1.00)
+# -------------------------------------------------------------------------------
+
+import argparse
+import builtins
+import collections
+import contextlib
+import hashlib
+import json
+import os
+import runpy
+import sys
+import time
+import types
+
+import numpy as np
+
+ANONYMIZE = {'Name', 'PatientName', 'PatientID', 'DateOfBirth', 'OtherPatientIDs', 'PatientAddress'}  # Attributes of the Patient.
+ARRAY_BYTES = 1024  # Byte strings at least this long are stored as arrays.
+PLAIN_TYPES = (bool, int, float, str, type(None))
+
+
+class ReplayMiss(LookupError):
+    """An access that is not in the recording."""
+
+
+def _is_array(value):
+    return isinstance(value, np.ndarray) or type(value).__name__.endswith('[]')
+
+
+class Recording(object):
+    """Accesses keyed by (object id, access), each with the list of [result, seconds] in the order they happened. Results are
+       {'v': json value}, {'o': object id}, {'a': array index}, {'b': array index} (bytes) or {'e': [exception type, message]}."""
+
+    def __init__(self):
+        self.events = collections.defaultdict(list)
+        self.objects = 1  # Object 0 is the connect module.
+        self.arrays = []
+        self.pseudonyms = {}
+        self.patients = set()  # Ids of the objects returned by get_current('Patient').
+
+    @staticmethod
+    def key(obj, access, argument=''):
+        return '%i|%s|%s' % (obj, access, argument)
+
+    def new_object(self):
+        self.objects += 1
+        return self.objects - 1
+
+    def add(self, key, result, seconds):
+        self.events[key].append([result, seconds])
+
+    def add_array(self, value):
+        self.arrays.append(np.array(value))
+        return len(self.arrays) - 1
+
+    def pseudonym(self, value):
+        if value not in self.pseudonyms:
+            self.pseudonyms[value] = 'Anonymous_%s' % hashlib.sha1(value.encode('utf-8')).hexdigest()[:8]
+        return self.pseudonyms[value]
+
+    def save(self, filename):
+        index = {'objects': self.objects, 'events': self.events}
+        arrays = {'array_%i' % i: each for i, each in enumerate(self.arrays)}
+        np.savez_compressed(filename, index=np.array(json.dumps(index)), **arrays)
+
+    @classmethod
+    def load(cls, filename):
+        recording = cls()
+        with np.load(filename) as data:
+            index = json.loads(str(data['index']))
+            recording.arrays = [data['array_%i' % i] for i in range(len(data.files) - 1)]
+        recording.objects = index['objects']
+        recording.events.update(index['events'])
+        return recording
+
+
+def argument_key(args, kwargs):
+    """Key of the arguments of a call. Proxies are identified by object id and arrays by a hash of their float64 values."""
+
+    def encode(value):
+        if isinstance(value, (Recorded, Replayed)):
+            return {'o': object.__getattribute__(value, '_id')}
+        if isinstance(value, (list, tuple)):
+            return [encode(each) for each in value]
+        if isinstance(value, dict):
+            return {str(key): encode(each) for key, each in value.items()}
+        if _is_array(value):
+            data = np.asarray(list(value) if not isinstance(value, np.ndarray) else value, dtype=np.float64)
+            return 'array:' + hashlib.sha1(data.tobytes()).hexdigest()[:16]
+        if isinstance(value, PLAIN_TYPES):
+            return value
+        return repr(value)
+
+    return json.dumps([encode(list(args)), encode(kwargs)], sort_keys=True)
+
+
+#########################
+#                       #
+#  Recording            #
+#                       #
+#########################
+
+
+def _unwrap(value):
+    if isinstance(value, Recorded):
+        return object.__getattribute__(value, '_obj')
+    if isinstance(value, (list, tuple)):
+        return type(value)(_unwrap(each) for each in value)
+    if isinstance(value, dict):
+        return {key: _unwrap(each) for key, each in value.items()}
+    return value
+
+
+class Recorded(object):
+    """Recording proxy of a scripting object."""
+    __slots__ = ('_obj', '_id', '_recording')
+
+    def __init__(self, obj, object_id, recording):
+        object.__setattr__(self, '_obj', obj)
+        object.__setattr__(self, '_id', object_id)
+        object.__setattr__(self, '_recording', recording)
+
+    def _access(self, access, argument, function, name=None):
+        """Perform function(), record its result under (this object, access, argument) and return the result (proxied)."""
+        recording = object.__getattribute__(self, '_recording')
+        key = Recording.key(object.__getattribute__(self, '_id'), access, argument)
+        start = time.perf_counter()
+        try:
+            value = function()
+        except StopIteration:
+            recording.add(key, {'s': 1}, time.perf_counter() - start)
+            raise
+        except Exception as e:
+            recording.add(key, {'e': [type(e).__name__, str(e)]}, time.perf_counter() - start)
+            raise
+        seconds = time.perf_counter() - start
+        if isinstance(value, PLAIN_TYPES):
+            anonymize = name in ANONYMIZE and isinstance(value, str) and object.__getattribute__(self, '_id') in recording.patients
+            recording.add(key, {'v': recording.pseudonym(value) if anonymize else value}, seconds)
+            return value
+        if isinstance(value, bytes) and len(value) < ARRAY_BYTES:
+            recording.add(key, {'v': value.decode('latin-1'), 'bytes': 1}, seconds)
+            return value
+        if isinstance(value, bytes):
+            recording.add(key, {'b': recording.add_array(np.frombuffer(value, dtype=np.uint8))}, seconds)
+            return value
+        if _is_array(value):
+            recording.add(key, {'a': recording.add_array(value if isinstance(value, np.ndarray) else list(value))}, seconds)
+            return value
+        previous = [each[0]['o'] for each in recording.events.get(key, []) if 'o' in each[0]]
+        object_id = previous[-1] if previous else recording.new_object()  # The same access reaches the same object.
+        recording.add(key, {'o': object_id}, seconds)
+        return Recorded(value, object_id, recording)
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        obj = object.__getattribute__(self, '_obj')
+        return Recorded._access(self, 'getattr', name, lambda: getattr(obj, name), name)
+
+    def __setattr__(self, name, value):
+        obj = object.__getattribute__(self, '_obj')
+        Recorded._access(self, 'setattr', name + '=' + argument_key([value], {}), lambda: setattr(obj, name, _unwrap(value)))
+
+    def __call__(self, *args, **kwargs):
+        obj = object.__getattribute__(self, '_obj')
+        return Recorded._access(self, 'call', argument_key(args, kwargs), lambda: obj(*_unwrap(args), **_unwrap(kwargs)))
+
+    def __getitem__(self, key):
+        obj = object.__getattribute__(self, '_obj')
+        return Recorded._access(self, 'item', argument_key([key], {}), lambda: obj[_unwrap(key)])
+
+    def __setitem__(self, key, value):
+        obj = object.__getattribute__(self, '_obj')
+        Recorded._access(self, 'setitem', argument_key([key, value], {}), lambda: obj.__setitem__(_unwrap(key), _unwrap(value)))
+
+    def __iter__(self):
+        iterator = iter(object.__getattribute__(self, '_obj'))
+        index = 0
+        while True:
+            try:
+                value = Recorded._access(self, 'iter', str(index), lambda: next(iterator))
+            except StopIteration:
+                return
+            yield value
+            index += 1
+
+    def __len__(self):
+        obj = object.__getattribute__(self, '_obj')
+        return Recorded._access(self, 'len', '', lambda: len(obj))
+
+    def __contains__(self, item):
+        obj = object.__getattribute__(self, '_obj')
+        return Recorded._access(self, 'contains', argument_key([item], {}), lambda: _unwrap(item) in obj)
+
+    def __bool__(self):
+        obj = object.__getattribute__(self, '_obj')
+        return Recorded._access(self, 'bool', '', lambda: bool(obj))
+
+    def __eq__(self, other):
+        obj = object.__getattribute__(self, '_obj')
+        return Recorded._access(self, 'eq', argument_key([other], {}), lambda: obj == _unwrap(other))
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return object.__getattribute__(self, '_id')
+
+    def __str__(self):
+        obj = object.__getattribute__(self, '_obj')
+        return Recorded._access(self, 'str', '', lambda: str(obj))
+
+    def __array__(self, dtype=None, copy=None):
+        obj = object.__getattribute__(self, '_obj')
+        return np.asarray(Recorded._access(self, 'array', '', lambda: np.asarray(obj)), dtype=dtype)
+
+    def __enter__(self):
+        return object.__getattribute__(self, '_obj').__enter__()
+
+    def __exit__(self, *args):
+        return object.__getattribute__(self, '_obj').__exit__(*args)
+
+
+class Recorder(object):
+    """Records the objects returned by get_current (a connect.get_current) and saves the recording to filename."""
+
+    def __init__(self, get_current, filename):
+        self.recording = Recording()
+        self.filename = filename
+        self._get_current = get_current
+        self._root = Recorded(types.SimpleNamespace(get_current=get_current), 0, self.recording)
+
+    def get_current(self, name):
+        value = self._root.get_current(name)
+        if name == 'Patient' and isinstance(value, Recorded):
+            self.recording.patients.add(object.__getattribute__(value, '_id'))
+        return value
+
+    def save(self):
+        self.recording.save(self.filename)
+        return self.filename
+
+
+#########################
+#                       #
+#  Replay               #
+#                       #
+#########################
+
+
+class Replay(object):
+    """Serves the accesses of a Recording. latency: 'recorded' sleeps the recorded duration of each access, a number scales it,
+       0 replays without delay."""
+
+    def __init__(self, recording, latency='recorded'):
+        self.recording = Recording.load(recording) if isinstance(recording, str) else recording
+        self.scale = 1.0 if latency == 'recorded' else float(latency)
+        self.position = collections.Counter()
+        self.writes = {}
+        self.calls = 0
+        self.delay = 0.0
+        self.debt = 0.0
+
+    def result(self, key):
+        events = self.recording.events.get(key)
+        if not events:
+            raise ReplayMiss('Not in the recording: %s' % key)
+        index = min(self.position[key], len(events) - 1)
+        self.position[key] += 1
+        result, seconds = events[index]
+        self.calls += 1
+        if self.scale and seconds:
+            self.delay += seconds * self.scale
+            self.debt += seconds * self.scale
+            if self.debt >= 0.001:  # Short delays are accumulated, as time.sleep() has a resolution of about a millisecond.
+                time.sleep(self.debt)
+                self.debt = 0.
+        return self.decode(result)
+
+    def decode(self, result):
+        if 'v' in result:
+            return result['v'].encode('latin-1') if result.get('bytes') else result['v']
+        if 'o' in result:
+            return Replayed(result['o'], self)
+        if 'a' in result:
+            return self.recording.arrays[result['a']].copy()
+        if 'b' in result:
+            return self.recording.arrays[result['b']].tobytes()
+        if 's' in result:
+            raise StopIteration
+        name, message = result['e']
+        error = getattr(builtins, name, Exception)
+        if not (isinstance(error, type) and issubclass(error, Exception)):
+            error = Exception
+        raise error(message)
+
+    def get_current(self, name):
+        return Replayed(0, self).get_current(name)
+
+    def reset(self):
+        self.position.clear()
+        self.writes.clear()
+        self.calls = 0
+        self.delay = 0.0
+        self.debt = 0.0
+
+
+class Replayed(object):
+    """Replay proxy of a recorded scripting object."""
+    __slots__ = ('_id', '_replay')
+
+    def __init__(self, object_id, replay):
+        object.__setattr__(self, '_id', object_id)
+        object.__setattr__(self, '_replay', replay)
+
+    def _result(self, access, argument=''):
+        replay = object.__getattribute__(self, '_replay')
+        return replay.result(Recording.key(object.__getattribute__(self, '_id'), access, argument))
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        writes = object.__getattribute__(self, '_replay').writes
+        key = (object.__getattribute__(self, '_id'), name)
+        if key in writes:
+            return writes[key]
+        return Replayed._result(self, 'getattr', name)
+
+    def __setattr__(self, name, value):
+        object.__getattribute__(self, '_replay').writes[(object.__getattribute__(self, '_id'), name)] = value
+        try:
+            Replayed._result(self, 'setattr', name + '=' + argument_key([value], {}))
+        except ReplayMiss:
+            pass  # A write with a value that was not recorded (e.g. from changed code) is kept by the replay only.
+
+    def __call__(self, *args, **kwargs):
+        return Replayed._result(self, 'call', argument_key(args, kwargs))
+
+    def __getitem__(self, key):
+        return Replayed._result(self, 'item', argument_key([key], {}))
+
+    def __setitem__(self, key, value):
+        Replayed._result(self, 'setitem', argument_key([key, value], {}))
+
+    def __iter__(self):
+        index = 0
+        while True:
+            try:
+                value = Replayed._result(self, 'iter', str(index))
+            except StopIteration:
+                return
+            yield value
+            index += 1
+
+    def __len__(self):
+        return Replayed._result(self, 'len')
+
+    def __contains__(self, item):
+        return Replayed._result(self, 'contains', argument_key([item], {}))
+
+    def __bool__(self):
+        return Replayed._result(self, 'bool')
+
+    def __eq__(self, other):
+        return Replayed._result(self, 'eq', argument_key([other], {}))
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return object.__getattribute__(self, '_id')
+
+    def __str__(self):
+        return Replayed._result(self, 'str')
+
+    def __array__(self, dtype=None, copy=None):
+        return np.asarray(Replayed._result(self, 'array'), dtype=dtype)
+
+
+_replay = None
+
+
+@contextlib.contextmanager
+def CompositeAction(description=''):
+    yield
+
+
+def install(recording, latency='recorded', dotnet=True):
+    """Register a 'connect' module that replays recording (a Recording or filename), and the .NET placeholders of xUWStandIn if
+       dotnet is True. Must be called before the scripts are imported. Returns the Replay."""
+    global _replay
+    _replay = Replay(recording, latency)
+    connect = types.ModuleType('connect')
+    connect.get_current, connect.CompositeAction = _replay.get_current, CompositeAction
+    connect.__all__ = ['get_current', 'CompositeAction']
+    sys.modules['connect'] = connect
+    if dotnet:
+        import xUWStandIn
+        xUWStandIn.install_dotnet()
+    return _replay
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Replay a scripting interface recording.')
+    parser.add_argument('recording')
+    parser.add_argument('target', help='Script filename or one of the xUWStandIn BENCHMARKS.')
+    parser.add_argument('--latency', default='recorded', help="'recorded', 0, or a factor applied to the recorded latencies.")
+    parser.add_argument('--verbose', action='store_true', help='Show the script output.')
+    args = parser.parse_args(argv)
+    replay = install(args.recording, args.latency)
+    import xUWStandIn
+    run = xUWStandIn.BENCHMARKS[args.target][0] if args.target in xUWStandIn.BENCHMARKS else \
+        (lambda: runpy.run_path(args.target, run_name='__main__'))
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(open(os.devnull, 'w')) if not args.verbose else contextlib.nullcontext():
+        run()
+    print('%s: %.3f s, %i recorded accesses, %.2f s replayed latency' % (args.target, time.perf_counter() - start, replay.calls,
+                                                                        replay.delay))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,185 @@
+# -------------------------------------------------------------------------------
+# Name:        RoiUtilities (v1.00)
+#
+# Written for RS Version: 2023B
+#
+# Purpose:     ROI helpers shared by the ROI scripts: RoiWriter (batched ROI property writes) and RoiClassifier (ROI name and type
+#              classes from the site rules in xUWRoiClasses.json).
+#
+# Note:        This module only imports the connect module and the standard library, so form scripts such as A2.py (Change ROI
+#              Visualization) can use it without loading the report (MigraDoc) and .NET dependencies of xUWScriptingUtilities, which
+#              imports these helpers from here.
+#
+# Created:     19 October 2026 (v1.00)
+# -------------------------------------------------------------------------------
+
+import json
+import os
+import re
+
+from connect import CompositeAction
+
+
+def _attribute(obj, path):
+    """Return the value of a dotted attribute path of obj, or None if any part of it is missing."""
+    try:
+        for each in path.split('.'):
+            obj = getattr(obj, each)
+        return obj
+    except Exception:
+        return None
+
+
+#########################
+#                       #
+#  ROI Writes           #
+#                       #
+#########################
+
+
+_UNKNOWN = object()
+
+
+class RoiWriter(object):
+    """Batched writer of ROI properties. set() records the desired value of a dotted property path of an ROI (e.g. 'Type',
+       'OrganData.OrganType', 'RoiVisualizationSettings.IsVisible'), apply() writes only the values that differ from the current ones in a
+       single CompositeAction and reports how many writes were skipped. Current values are read when set() is called unless given, e.g.
+       from a CaseSnapshot record. Visibility is written with patient.SetRoiVisibility when a patient is given."""
+    VISIBILITY = 'RoiVisualizationSettings.IsVisible'
+
+    def __init__(self, case, patient=None):
+        self.case = case
+        self.patient = patient
+        self.rois = {}
+        self.changes = []  # [(roi name, path, value), ...] in the order set
+        self.skipped = 0
+        self.written = 0
+        self.failed = []
+
+    def _roi(self, name):
+        if name not in self.rois:
+            self.rois[name] = self.case.PatientModel.RegionsOfInterest[name]
+        return self.rois[name]
+
+    def set(self, roi, path, value, current=_UNKNOWN):
+        """Request path of roi (an ROI object or name) to be value. Returns True if a write is needed."""
+        if isinstance(roi, str):
+            roi = self._roi(roi)
+        else:
+            self.rois[roi.Name] = roi
+        if current is _UNKNOWN:
+            current = _attribute(roi, path)
+        if current == value:
+            self.skipped += 1
+            return False
+        self.changes.append((roi.Name, path, value))
+        return True
+
+    def set_all(self, roi, values, current=None):
+        """set() each {path: value} of values. current optionally gives {path: current value}."""
+        current = current or {}
+        return [self.set(roi, path, value, current.get(path, _UNKNOWN)) for path, value in values.items()]
+
+    def _write(self, name, path, value):
+        if path == self.VISIBILITY and self.patient is not None:
+            self.patient.SetRoiVisibility(RoiName=name, IsVisible=value)
+            return
+        obj = self.rois[name]
+        parents, attribute = path.split('.')[:-1], path.split('.')[-1]
+        for each in parents:
+            obj = getattr(obj, each)
+        setattr(obj, attribute, value)
+
+    def apply(self, description='Update ROIs'):
+        """Write the pending changes in one CompositeAction. Returns (written, skipped); failed writes are listed in failed as
+           (roi name, path, error)."""
+        if self.changes:
+            with CompositeAction(description):
+                for name, path, value in self.changes:
+                    try:
+                        self._write(name, path, value)
+                        self.written += 1
+                    except Exception as e:
+                        self.failed.append((name, path, e))
+        self.changes = []
+        return self.written, self.skipped
+
+    def updated_rois(self):
+        """Names of the ROIs with at least one change pending."""
+        return sorted({name for name, path, value in self.changes})
+
+
+#########################
+#                       #
+#  ROI Classes          #
+#                       #
+#########################
+
+
+ROI_CLASSES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'xUWRoiClasses.json')
+
+# Used when ROI_CLASSES_FILE is missing. Patterns are case-insensitive regular expressions, classes are checked in order and the
+# first class with a matching pattern is returned.
+DEFAULT_ROI_CLASSES = {
+    'name_classes': [{'class': 'Ptv', 'patterns': ['PTV']},
+                     {'class': 'Ctv', 'patterns': ['CTV']},
+                     {'class': 'Gtv', 'patterns': ['GTV', 'ITV']}],
+    'type_classes': [{'class': 'target', 'patterns': ['target', 'ptv', 'ctv', 'gtv']},
+                     {'class': 'oar', 'patterns': ['organ', 'oar']},
+                     {'class': 'support', 'patterns': ['support']}],
+    'default_type_class': 'other'}
+
+
+class RoiClassifier(object):
+    """ROI name and type classifier compiled from site rules (see DEFAULT_ROI_CLASSES), one case-insensitive regular expression per
+       class. name_class() returns the target class of an ROI name ('Ptv', 'Ctv', 'Gtv' or None) as used by ROI_setup(), and type_class()
+       the category of an ROI type ('target', 'oar', 'support' or 'other') as used by the ROI visualization form. Results are memoized."""
+
+    def __init__(self, config=DEFAULT_ROI_CLASSES):
+        compile_classes = lambda classes: [(each['class'], re.compile('|'.join('(?:%s)' % x for x in each['patterns']), re.IGNORECASE))
+                                           for each in classes]
+        self.name_classes = compile_classes(config.get('name_classes', []))
+        self.type_classes = compile_classes(config.get('type_classes', []))
+        self.default_type_class = config.get('default_type_class', 'other')
+        self._names = {}
+        self._types = {}
+
+    @classmethod
+    def from_file(cls, filename=ROI_CLASSES_FILE):
+        with open(filename) as f:
+            return cls(json.load(f))
+
+    @staticmethod
+    def _match(classes, text, default):
+        for name, pattern in classes:
+            if pattern.search(text):
+                return name
+        return default
+
+    def name_class(self, name):
+        if name not in self._names:
+            self._names[name] = self._match(self.name_classes, name, None)
+        return self._names[name]
+
+    def type_class(self, roi_type):
+        if roi_type not in self._types:
+            self._types[roi_type] = self._match(self.type_classes, roi_type, self.default_type_class)
+        return self._types[roi_type]
+
+    def classify(self, rois):
+        """Classify (name, type) pairs in one pass. Returns {name: (name class, type class)}."""
+        return {name: (self.name_class(name), self.type_class(roi_type)) for name, roi_type in rois}
+
+
+_roi_classifier = None
+
+
+def roi_classifier():
+    """Return the site RoiClassifier, read from ROI_CLASSES_FILE (DEFAULT_ROI_CLASSES if it does not exist)."""
+    global _roi_classifier
+    if _roi_classifier is None:
+        try:
+            _roi_classifier = RoiClassifier.from_file()
+        except IOError:
+            _roi_classifier = RoiClassifier()
+    return _roi_classifier
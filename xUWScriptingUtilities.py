@@ -45,13 +45,66 @@
 #              11/22/2023               - Updated create_doc(), define_styles(), generate_slice_report() to work with DoseSliceReport. -AJE
 #              1/23/2024                - Updated - SC
 #              4/12/2024                - Updated generate_slice_report(), add_section_with_image and added find_closest_z() to work with DoseSliceReport -SC. 
+#              10/19/2026               - Added render_dose_images(), an offline replacement for GetDoseImages using xUWDoseRendering.
+#              10/19/2026               - Added the 'lines' (vector isodose) style to render_dose_images() and generate_slice_report().
+#              10/19/2026               - generate_slice_report() supports sagittal and coronal sweeps (sweep_points()), one image request per orientation.
+#              10/19/2026               - Max dose page is centred on the hotspot, zoomed when rendered offline, and lists the dose profile (hotspot_summary()).
+#              10/19/2026               - render_dose_images() reads the CT through the local volume cache (xUWVolumeCache), so repeat reports on an
+#                                         examination skip the pixel data transfer. The 'lines' style uses the 2x downsampled level.
+#              10/19/2026               - Added batched (N, 3) array versions of the geometry functions (rot_vects, cps, dps, cartesian_to_dicom_array)
+#                                         with cached rotation matrices; the list functions wrap them. Timed by tests/benchmarks.py.
+#                                         cartesian_to_dicom() handled FeetFirstDecubitusLeft as a second FeetFirstDecubitusRight case; fixed.
+#              10/19/2026               - Added the Transform (4x4 homogeneous) class and transform_rois(). import_couch_model() moves all couch ROIs
+#                                         with one checked transform in a single undo step.
+#              10/19/2026               - Beam names are looked up in precomputed tables (beam_name_table()), name_beams() / name_beam_set() name a whole
+#                                         beam set at once with unique names. translate_position() now translates each letter (str.replace never
+#                                         matched), FeetFirstDecubitusLeft axis names are used, and float angles are named like ints. The original
+#                                         names are kept as a golden table in tests/beam_names.csv (tests/test_beam_naming.py).
+#              10/19/2026               - Added get_wedge_orientations(), a batched get_wedge_orientation() for all wedged beams, tested against it in
+#                                         tests/test_wedge_orientation.py.
+#              10/19/2026               - Implemented get_field_border_at_SAD(): leaf tips and jaw corners of every segment projected into DICOM coordinates
+#                                         in one numpy pass (project_field_borders()). Timed by tests/benchmarks.py.
+#              10/19/2026               - Added BeamSegments, an array copy of the segments of a beam. max_leaf_travel_li(), calc_time() and segment_area()
+#                                         read each segment once and use array operations; segment_area() no longer prints every leaf.
+#              10/19/2026               - Added delivery_time_model(), a control point delivery time simulation (dose rate / gantry / leaf speed limited)
+#                                         for SMLC, DMLC and arc beam sets with configurable DELIVERY_LIMITS.
+#              10/19/2026               - Added complexity_metrics(): MCS, aperture area / perimeter / irregularity, small aperture fraction and leaf travel
+#                                         per MU for all beams and beam sets of a plan, using the machine model leaf widths.
+#              10/19/2026               - Added optimize_beam_order(): beam order minimizing gantry / collimator / couch / leaf time between beams (exact for
+#                                         small beam sets, 2-opt for large ones). Returns the order and the time saved without changing the beam set.
+#              10/19/2026               - Added renumber_beams() / plan_renumbering(): beams are renumbered with the fewest writes (permutation cycles with one
+#                                         temporary number) in a single undo step, with a dry run. Used by reorder_beamset().
+#              10/19/2026               - Machine model parameters are cached in a local file (MachineCache), reloaded when a machine is recommissioned.
+#                                         get_wedged_MU() no longer loads the machine for every beam; added get_wedged_MUs() for a whole beam set.
+#              10/19/2026               - Added CaseSnapshot, the ROIs of a case read in one traversal. ROI_setup(), create_external() and import_couch_model()
+#                                         read from it; the ROI_setup() type rules moved to roi_setup_types().
+#              10/19/2026               - Added CaseIndex: approved ROIs and beam sets with dose per exam, read once per call of CaseSnapshot,
+#                                         create_external() and import_couch_model().
+#              10/19/2026               - Added RoiWriter: ROI property writes are compared to the current values and only changes are written, in
+#                                         one CompositeAction. ROI_setup() writes types and visibility through it.
+#              10/19/2026               - get_current is imported from xUWInterop, so scripting interface accesses can be traced (set XUW_TRACE).
+#              10/19/2026               - import_couch_model() and generate_slice_report() read independent properties together with
+#                                         xUWInterop.prefetch().
+#              10/19/2026               - ROI names and types are classified by RoiClassifier, compiled from the site rules in xUWRoiClasses.json.
+#                                         Target names are now matched case-insensitively (e.g. 'Ptv_boost', 'gTV'), see tests/test_roi_classifier.py.
+#              10/19/2026               - render_dose_images() reads only the contours of visible ROIs on the imaged slices. The offline render
+#                                         directory is removed after the report is built. generate_slice_report() only requests the printed
+#                                         images (every printevery-th).
+#              10/19/2026               - RoiWriter and RoiClassifier moved to xUWRoiUtilities (imported here as before), so the ROI
+#                                         visualization form does not load the report and .NET dependencies of this module.
 # -------------------------------------------------------------------------------
 
 import string
+import re
 from math import sin, cos, pi, tan, e
 import sys
 import clr
 import subprocess
+import json
+import shutil
+import tempfile
+from functools import lru_cache
+from collections import namedtuple
 # import wpf
 import os
 from System import IO, Windows, DateTime
@@ -75,25 +128,85 @@ from MigraDoc.DocumentObjectModel.Tables import Table
 from MigraDoc.DocumentObjectModel.Shapes import ShapePosition
 from MigraDoc.Rendering import PdfDocumentRenderer
 from PdfSharp import Pdf
-from connect import get_current, CompositeAction
+from connect import CompositeAction
+import xUWInterop as interop
+from xUWInterop import get_current
+import numpy as np
+import xUWDoseRendering as dr
+import xUWVolumeCache as vc
+from xUWRoiUtilities import _attribute, RoiWriter, ROI_CLASSES_FILE, DEFAULT_ROI_CLASSES, RoiClassifier, roi_classifier
+
+
+class BeamSegments(object):
+    """Segments of one beam extracted once into contiguous arrays, so MLC metrics are array operations without further interop.
+
+       leaves: (S, 2, N) leaf positions of both banks. jaws: (S, 4) [x1, x2, y1, y2]. weights, dose_rates, mu: (S,) relative weight,
+       segment dose rate (MU/min, 1 for static fields) and segment MU. gantry_angles, delta_gantry, collimator_angles: (S,) in degrees.
+       gantry_angle and stop_angle are the start and stop gantry angles of the beam (equal for static beams).
+       widths: (N,) leaf widths in cm, see MLC_LEAF_WIDTHS."""
+    __slots__ = ('name', 'number', 'technique', 'beam_mu', 'gantry_angle', 'stop_angle', 'couch_angle', 'leaves', 'jaws', 'weights', 'dose_rates', 'mu',
+                 'gantry_angles', 'delta_gantry', 'collimator_angles', 'widths')
+
+    def __init__(self, beam, widths=None):
+        segments = list(beam.Segments)
+        self.name = beam.Name
+        self.number = beam.Number
+        self.technique = beam.DeliveryTechnique
+        self.beam_mu = float(beam.BeamMU)
+        self.gantry_angle = float(beam.GantryAngle)
+        stop = getattr(beam, 'ArcStopGantryAngle', None)
+        self.stop_angle = self.gantry_angle if stop is None else float(stop)
+        self.couch_angle = float(beam.CouchAngle)
+        self.leaves = np.array([[list(each.LeafPositions[0]), list(each.LeafPositions[1])] for each in segments], dtype=float)
+        self.jaws = np.array([list(each.JawPositions) for each in segments], dtype=float).reshape(-1, 4)
+        self.weights = np.array([float(each.RelativeWeight) for each in segments])
+        self.dose_rates = np.array([float(each.DoseRate) for each in segments])
+        self.mu = self.beam_mu * self.weights
+        self.delta_gantry = np.array([float(getattr(each, 'DeltaGantryAngle', 0) or 0) for each in segments])
+        self.gantry_angles = segment_gantry_angles(beam) if len(segments) else np.zeros(0)
+        self.collimator_angles = np.array([float(getattr(each, 'CollimatorAngle', beam.InitialCollimatorAngle)) for each in segments])
+        numleaves = self.leaves.shape[2] if len(segments) else 0
+        self.widths = np.asarray(MLC_LEAF_WIDTHS.get(numleaves, [1.0] * numleaves) if widths is None else widths, dtype=float)
+
+    def __len__(self):
+        return len(self.weights)
+
+    def leaf_travel(self):
+        """(S-1,) maximum distance travelled by any one leaf between consecutive segments."""
+        if len(self) < 2:
+            return np.zeros(0)
+        return np.abs(np.diff(self.leaves, axis=0)).max(axis=(1, 2))
+
+    def open_leaves(self):
+        """(S, N) True for leaf pairs with their centre between the y jaws and a gap between the banks."""
+        edges = np.concatenate(([0], np.cumsum(self.widths))) - self.widths.sum() / 2.
+        centres = (edges[:-1] + edges[1:]) / 2.
+        y1, y2 = np.minimum(self.jaws[:, 2], self.jaws[:, 3]), np.maximum(self.jaws[:, 2], self.jaws[:, 3])
+        return (centres > y1[:, None]) & (centres < y2[:, None]) & (self.leaves[:, 1] > self.leaves[:, 0])
+
+    def gaps(self):
+        """(S, N) leaf pair openings in cm, clipped to the x jaws and zero for closed or jaw-shielded leaf pairs."""
+        x1, x2 = np.minimum(self.jaws[:, 0], self.jaws[:, 1]), np.maximum(self.jaws[:, 0], self.jaws[:, 1])
+        left = np.clip(self.leaves[:, 0], x1[:, None], x2[:, None])
+        right = np.clip(self.leaves[:, 1], x1[:, None], x2[:, None])
+        return np.where(self.open_leaves(), right - left, 0.)
+
+    def areas(self):
+        """(S,) aperture areas in cm^2 using the leaf widths."""
+        return self.gaps() @ self.widths
+
+
+def beam_set_segments(beam_set, widths=None):
+    """Return a BeamSegments for every beam in a beam set, in beam order."""
+    return [BeamSegments(beam, widths) for beam in beam_set.Beams]
 
 
 def max_leaf_travel_li(segments):
     """Determine the maximum distance traveled by any one MLC between each of the supplied segments, and return a list of these distances for each pair of consecutive segments."""
-    #   print("pass1 in max_leaf")
-
-    result = []
-    for i in range(segments.Count - 1):
-        max_difference = 0.0
-        seg1 = segments[i]
-        seg2 = segments[i + 1]
-        for j in range(len(seg1.LeafPositions[0])):
-            left_difference = abs(seg1.LeafPositions[0][j] - seg2.LeafPositions[0][j])
-            right_difference = abs(seg1.LeafPositions[1][j] - seg2.LeafPositions[1][j])
-            max_difference = max(max_difference, left_difference, right_difference)
-        result.append(max_difference)
-    #  print("pass in max_leaf 2")
-    return result
+    leaves = np.array([[list(each.LeafPositions[0]), list(each.LeafPositions[1])] for each in segments], dtype=float)
+    if len(leaves) < 2:
+        return []
+    return np.abs(np.diff(leaves, axis=0)).max(axis=(1, 2)).tolist()
 
 
 def calc_time(beam_set):
@@ -102,53 +215,185 @@ def calc_time(beam_set):
     gantry_rpm = 1
     leaf_speed = 2.2  # cm/s
 
-    beams = beam_set.Beams
+    beams = beam_set_segments(beam_set)
     delivery_time = 0.0
-    if beams.Count > 0:
-        if beams[0].DeliveryTechnique in ['Arc', 'StaticArc', 'DynamicArc']:
+    if len(beams) > 0:
+        if beams[0].technique in ['Arc', 'StaticArc', 'DynamicArc']:
             for beam in beams:
                 delivery_time += beam_on
-                segments = beam.Segments
-                beamMU = float(beam.BeamMU)
-                for segment in segments:
-                    if segment.RelativeWeight == 0:
-                        continue
-                    if float(segment.DoseRate) >= 1.1:  # Static field dose rates are equal to '1'.
-                        doserate = float(segment.DoseRate / 60)  # MU/second
-                    else:
-                        doserate = 10  # Nominal 600 MU per minute.
-                    MU = beamMU * float(segment.RelativeWeight)
-                    delivery_time += MU / doserate
-
-        elif beams[0].DeliveryTechnique == 'DMLC':
+                doserate = np.where(beam.dose_rates >= 1.1, beam.dose_rates / 60,
+                                    10)  # MU/second. Static field dose rates are equal to '1', nominal 600 MU per minute.
+                delivery_time += float(np.sum(np.where(beam.weights != 0, beam.mu / doserate, 0)))
+
+        elif beams[0].technique == 'DMLC':
             return None  # No DMLC capable machines currently.
 
-        elif beams[0].DeliveryTechnique == 'SMLC':
-            for beam_index in range(beams.Count):
+        elif beams[0].technique == 'SMLC':
+            for beam_index, beam in enumerate(beams):
                 if not beam_index == 0:
-                    gantry_angle_difference = beams[beam_index].GantryAngle - beams[
-                        beam_index - 1].GantryAngle
+                    gantry_angle_difference = beam.gantry_angle - beams[beam_index - 1].gantry_angle
                     delivery_time += (gantry_angle_difference / 360.0) / (gantry_rpm * 60.0)
 
-                segments = beams[beam_index].Segments
-                for segment in segments:
-                    delivery_time += beam_on
-                    if float(segment.DoseRate) >= 1.1:  # Static field dose rates are equal to '1'.
-                        doserate = float(segment.DoseRate / 60)  # MU/second
-                    else:
-                        doserate = 10  # Nominal 600 MU per minute.
-                    delivery_time += beams[beam_index].BeamMU * float(
-                        segment.RelativeWeight) / doserate
-                if segments.Count > 1:
-                    delivery_time += sum(max_leaf_travel_li(segments)) / leaf_speed
+                doserate = np.where(beam.dose_rates >= 1.1, beam.dose_rates / 60, 10)
+                delivery_time += beam_on * len(beam) + float(np.sum(beam.mu / doserate))
+                if len(beam) > 1:
+                    delivery_time += float(beam.leaf_travel().sum()) / leaf_speed
         else:
-            raise ValueError('Unknown delivery technique: %s' % (beams[0].DeliveryTechnique))
+            raise ValueError('Unknown delivery technique: %s' % (beams[0].technique))
     return delivery_time
 
 
+# Machine limits for delivery_time_model() and optimize_beam_order(). Dose rate in MU/min, gantry, collimator and couch speeds in degrees/s,
+# leaf speed in cm/s, beam on in s.
+DELIVERY_LIMITS = {'dose_rate': 600., 'gantry_speed': 6., 'collimator_speed': 6., 'couch_speed': 3., 'leaf_speed': 2.2,
+                   'beam_on': 0.3}
+DELIVERY_AXES = ['dose_rate', 'gantry', 'leaf', 'beam_on']
+
+
+def gantry_travel(start, stop):
+    """Gantry rotation in degrees between two angles for a gantry that cannot rotate through 180 degrees (range 180.1 to 180.0)."""
+    return np.abs((np.asarray(stop) - 180.) % 360 - (np.asarray(start) - 180.) % 360)
+
+
+def beam_delivery_time(beam, limits=DELIVERY_LIMITS):
+    """Control point delivery time of one BeamSegments. Returns (seconds, (4,) seconds spent limited by each of DELIVERY_AXES).
+
+       Arcs and DMLC: each segment takes the longest of its MU at the maximum dose rate, its gantry rotation and the largest leaf move to
+       the next control point, which is then the limiting axis of that segment.
+       SMLC: beam on (beam_on overhead plus MU at the maximum dose rate) for each segment, with the leaves moving between segments beam off."""
+    limited = np.zeros(len(DELIVERY_AXES))
+    if len(beam) == 0:
+        return 0., limited
+    mu_time = beam.mu / (limits['dose_rate'] / 60.)
+    leaf_time = np.append(np.abs(np.diff(beam.leaves, axis=0)).max(axis=(1, 2)), 0) / limits['leaf_speed']
+    if beam.technique in ['Arc', 'StaticArc', 'DynamicArc', 'DMLC']:
+        gantry_time = np.abs(beam.delta_gantry) / limits['gantry_speed']
+        times = np.stack([mu_time, gantry_time, leaf_time])
+        limited[:3] = np.bincount(times.argmax(axis=0), weights=times.max(axis=0), minlength=3)
+        limited[3] = limits['beam_on']
+    elif beam.technique == 'SMLC':
+        limited[0] = mu_time.sum()
+        limited[2] = leaf_time.sum()
+        limited[3] = limits['beam_on'] * len(beam)
+    else:
+        raise ValueError('Unknown delivery technique: %s' % (beam.technique))
+    return float(limited.sum()), limited
+
+
+def delivery_time_model(beam_set, limits=None, beams=None):
+    """Simulate the delivery of a beam set at the control point level for SMLC, DMLC and arc (VMAT) beams, including gantry rotation
+       between beams. limits overrides entries of DELIVERY_LIMITS. beams may be supplied as a list of BeamSegments to avoid reading the
+       beam set again.
+
+       Returns {'total': seconds, 'beams': [(beam name, seconds), ...], 'limiting': {axis: fraction of the total time}}."""
+    limits = dict(DELIVERY_LIMITS, **(limits or {}))
+    beams = beam_set_segments(beam_set) if beams is None else beams
+    limited = np.zeros(len(DELIVERY_AXES))
+    result = []
+    stop = None
+    for beam in beams:
+        if stop is not None:
+            limited[1] += float(gantry_travel(stop, beam.gantry_angle)) / limits['gantry_speed']
+        stop = beam.stop_angle
+        seconds, beam_limited = beam_delivery_time(beam, limits)
+        limited += beam_limited
+        result.append((beam.name, seconds))
+    total = float(limited.sum())
+    return {'total': total, 'beams': result,
+            'limiting': {axis: (float(each) / total if total else 0.) for axis, each in zip(DELIVERY_AXES, limited)}}
+
+
+def machine_leaf_widths(machine_name):
+    """Return the MLC leaf widths (cm, tuple) of a machine from the machine model cache, or None if they cannot be read."""
+    widths = machine_parameters(machine_name).get('leaf_widths')
+    return None if widths is None else tuple(widths)
+
+
+def _bank_variability(positions, open_leaves):
+    """(S,) leaf sequence variability of one bank: the mean of (pos_max - |pos_n - pos_n+1|) / pos_max over adjacent open leaf pairs."""
+    masked = np.where(open_leaves, positions, np.nan)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        pos_max = np.nanmax(masked, axis=1) - np.nanmin(masked, axis=1)
+        pairs = open_leaves[:, 1:] & open_leaves[:, :-1]
+        terms = np.where(pairs, pos_max[:, None] - np.abs(np.diff(positions, axis=1)), 0.).sum(axis=1)
+        result = terms / (pairs.sum(axis=1) * pos_max)
+    return np.where(np.isfinite(result), result, 1.)
+
+
+def beam_complexity(beam, small_aperture=1.0):
+    """Complexity metrics of one BeamSegments, MU weighted over the segments:
+       mcs: Modulation complexity score (McNiven et al. 2010, leaf sequence x aperture area variability).
+       mean_area, mean_perimeter: Aperture area (cm^2) and perimeter (cm).
+       irregularity: Aperture irregularity, perimeter^2 / (4 pi area), 1 for a circle.
+       small_aperture_fraction: Fraction of open leaf pairs with a gap below small_aperture cm.
+       leaf_travel_per_mu: Total leaf travel of both banks (cm) per MU.
+       mu: Beam MU."""
+    if len(beam) == 0 or beam.beam_mu == 0:
+        return {'mcs': None, 'mean_area': 0., 'mean_perimeter': 0., 'irregularity': None, 'small_aperture_fraction': 0.,
+                'leaf_travel_per_mu': 0., 'mu': beam.beam_mu}
+    open_leaves = beam.open_leaves()
+    gaps = beam.gaps()
+    areas = gaps @ beam.widths
+    mu_weights = beam.mu / beam.mu.sum() if beam.mu.sum() else np.full(len(beam), 1. / len(beam))
+
+    x1, x2 = np.minimum(beam.jaws[:, 0], beam.jaws[:, 1]), np.maximum(beam.jaws[:, 0], beam.jaws[:, 1])
+    left = np.where(open_leaves, np.clip(beam.leaves[:, 0], x1[:, None], x2[:, None]), 0.)
+    right = np.where(open_leaves, np.clip(beam.leaves[:, 1], x1[:, None], x2[:, None]), 0.)
+    lsv = _bank_variability(left, open_leaves) * _bank_variability(right, open_leaves)
+    max_gaps = gaps.max(axis=0).sum()
+    aav = gaps.sum(axis=1) / max_gaps if max_gaps else np.zeros(len(beam))
+
+    # Perimeter: leaf tips (two per open leaf pair) plus the parts of neighbouring leaf pair openings that do not overlap.
+    padded_left = np.pad(left, ((0, 0), (1, 1)))
+    padded_right = np.pad(right, ((0, 0), (1, 1)))
+    padded_gaps = np.pad(gaps, ((0, 0), (1, 1)))
+    overlap = np.clip(np.minimum(padded_right[:, 1:], padded_right[:, :-1]) - np.maximum(padded_left[:, 1:], padded_left[:, :-1]), 0, None)
+    overlap = np.where((padded_gaps[:, 1:] > 0) & (padded_gaps[:, :-1] > 0), overlap, 0.)
+    perimeters = (padded_gaps[:, 1:] + padded_gaps[:, :-1] - 2 * overlap).sum(axis=1) + 2 * open_leaves @ beam.widths
+    with np.errstate(invalid='ignore', divide='ignore'):
+        irregularity = np.where(areas > 0, perimeters ** 2 / (4 * pi * areas), np.nan)
+
+    open_count = open_leaves.sum(axis=1)
+    small = ((gaps < small_aperture) & open_leaves).sum(axis=1) / np.maximum(open_count, 1)
+    travel = np.abs(np.diff(beam.leaves, axis=0)).sum() if len(beam) > 1 else 0.
+    valid = np.isfinite(irregularity)
+    return {'mcs': float(mu_weights @ (lsv * aav)), 'mean_area': float(mu_weights @ areas),
+            'mean_perimeter': float(mu_weights @ perimeters),
+            'irregularity': float(mu_weights[valid] @ irregularity[valid] / mu_weights[valid].sum()) if valid.any() else None,
+            'small_aperture_fraction': float(mu_weights @ small), 'leaf_travel_per_mu': float(travel) / beam.beam_mu,
+            'mu': beam.beam_mu}
+
+
+def _combine_complexity(metrics):
+    """MU weighted combination of beam_complexity() results; leaf_travel_per_mu is the total travel over the total MU."""
+    mu = [float(each['mu']) for each in metrics]
+    result = {'mu': sum(mu)}
+    for key in ['mcs', 'mean_area', 'mean_perimeter', 'irregularity', 'small_aperture_fraction', 'leaf_travel_per_mu']:
+        pairs = [(each[key], m) for each, m in zip(metrics, mu) if each[key] is not None and m > 0]
+        weight = sum(m for value, m in pairs)
+        result[key] = sum(value * m for value, m in pairs) / weight if weight else None
+    return result
+
+
+def complexity_metrics(plan, small_aperture=1.0):
+    """Complexity metrics (see beam_complexity()) for every beam and beam set of a plan, using the leaf widths of each machine model.
+       Returns {beam set name: {'beams': {beam name: metrics}, 'beam_set': metrics}} plus 'plan': metrics over all beam sets."""
+    result = {}
+    every_beam = []
+    for beam_set in plan.BeamSets:
+        widths = machine_leaf_widths(beam_set.MachineReference.MachineName)
+        beams = {each.name: beam_complexity(each, small_aperture) for each in beam_set_segments(beam_set, widths)}
+        result[beam_set.DicomPlanLabel] = {'beams': beams, 'beam_set': _combine_complexity(list(beams.values()))}
+        every_beam += list(beams.values())
+    result['plan'] = _combine_complexity(every_beam)
+    return result
+
+
 def segment_area(segment):
     """Returns an approximate segment area."""
-    numleaves = segment.LeafPositions[0].Count
+    left = np.array(list(segment.LeafPositions[0]), dtype=float)
+    right = np.array(list(segment.LeafPositions[1]), dtype=float)
+    numleaves = len(left)
     leafwidth = 1 * (numleaves == 40) + 0.5 * (numleaves == 80)
     bottomjaw = segment.JawPositions[3]
     topjaw = segment.JawPositions[2]
@@ -156,40 +401,131 @@ def segment_area(segment):
     end = int((topjaw + 20) / leafwidth)
     if start > end:  # Some confusion regarding Raystation jaw labeling.
         start, end = end, start
-    area = 0
-    for i in range(start, end):
-        print(i)
-        area += segment.LeafPositions[1][i] - segment.LeafPositions[0][i]
-    print(area)
-    return area
+    return float(np.sum(right[start:end] - left[start:end]))
 
 
-def get_wedged_MU(beam):
-    """
-    Calculate the wedged MU for a Raystation beam object and return it.
-    """
-    machine = beam.MachineReference.MachineName
-    energy = beam.MachineReference.Energy
-    MU = beam.BeamMU
-    wedge_angle = beam.Wedge.Angle
-    to_rad = pi / 180
+MACHINE_CACHE_FILE = os.path.join(os.environ.get('LOCALAPPDATA', tempfile.gettempdir()), 'xUWMachineCache.json')
+
+
+class MachineCache(object):
+    """Machine model parameters (wedge modulation parameters and dose rates per energy, leaf widths and speed limits) cached in a local
+       json file, so the machine model is only loaded from the machine database once per commissioning. An entry is reloaded when the
+       commission time reported by the machine database changes, or when it was written in an older FORMAT; the commission time is checked
+       once per machine per session."""
+    FORMAT = 2  # Version of the entry layout. 2: the first beam quality of each energy is kept.
+
+    def __init__(self, filename=MACHINE_CACHE_FILE):
+        self.filename = filename
+        self.checked = {}
+        try:
+            with open(filename) as f:
+                self.entries = json.load(f)
+        except (IOError, ValueError):
+            self.entries = {}
+
+    def save(self):
+        try:
+            with open(self.filename, 'w') as f:
+                json.dump(self.entries, f, indent=1)
+        except IOError as e:
+            print(f'Could not save the machine cache {self.filename}. Error: {e}')
+
+    @staticmethod
+    def commission_time(machine_db, machine_name):
+        try:
+            info = machine_db.QueryCommissionedMachineInfo(Filter={'Name': machine_name})
+            return str(info[0]['CommissionTime'])
+        except Exception:
+            return None
+
+    @staticmethod
+    def read_machine(machine):
+        """Extract the cached parameters from a Raystation treatment machine."""
+        energies = {}
+        for quality in _attribute(machine, 'PhotonBeamQualities') or []:
+            energy = '%g' % quality.NominalEnergy
+            if energy in energies:
+                continue  # Keep the first quality of an energy (e.g. 6 MV rather than 6 MV FFF, which has no wedge parameters).
+            wedge = _attribute(quality, 'BeamModels')
+            wedge = _attribute(wedge[0], 'BeamModel.MotorizedWedgeParameters') if wedge else None
+            dose_rates = _attribute(quality, 'DoseRates')
+            energies[energy] = {
+                'wedge_q0': None if wedge is None else float(wedge.WedgeModulationParametersX[-1]),
+                'wedge_p0': None if wedge is None else float(wedge.WedgeModulationParametersY[-1]),
+                'dose_rates': None if dose_rates is None else [float(each) for each in dose_rates]}
+        widths = _attribute(machine, 'Physics.MlcPhysics.UpperLayer.LeafWidths')
+        limits = {'leaf_speed': _attribute(machine, 'Physics.MlcPhysics.MaxLeafSpeed'),
+                  'gantry_speed': _attribute(machine, 'Physics.GantryPhysics.MaxGantryAngleSpeed'),
+                  'collimator_speed': _attribute(machine, 'Physics.CollimatorPhysics.MaxCollimatorAngleSpeed')}
+        return {'energies': energies, 'leaf_widths': None if widths is None else [float(each) for each in widths],
+                'limits': {key: float(value) for key, value in limits.items() if value is not None}}
+
+    def get(self, machine_name):
+        """Return the cached parameters of a machine, loading the machine model if it is not cached or has been recommissioned."""
+        if machine_name in self.checked:
+            return self.checked[machine_name]
+        machine_db = get_current('MachineDB')
+        commissioned = self.commission_time(machine_db, machine_name)
+        entry = self.entries.get(machine_name)
+        if entry is None or commissioned is None or entry['commission_time'] != commissioned or entry.get('format') != self.FORMAT:
+            try:
+                entry = self.read_machine(machine_db.GetTreatmentMachine(machineName=machine_name))
+            except Exception as e:
+                print(f'Could not load the machine model {machine_name}. Error: {e}')
+                return {'energies': {}, 'leaf_widths': None, 'limits': {}}
+            entry['commission_time'] = commissioned
+            entry['format'] = self.FORMAT
+            if commissioned is not None:
+                self.entries[machine_name] = entry
+                self.save()
+        self.checked[machine_name] = entry
+        return entry
+
 
-    mdb = get_current('MachineDB')
-    machine = mdb.GetTreatmentMachine(machineName=machine)  # , lockMode = 'Read')
-    beam_quality = [each for each in machine.PhotonBeamQualities if each.NominalEnergy == energy][0]
-    q0 = beam_quality.BeamModels[0].BeamModel.MotorizedWedgeParameters.WedgeModulationParametersX[
-        -1]
-    p0 = beam_quality.BeamModels[0].BeamModel.MotorizedWedgeParameters.WedgeModulationParametersY[
-        -1]
+_machine_cache = None
 
+
+def machine_parameters(machine_name):
+    """Return the parameters of a machine from the default MachineCache."""
+    global _machine_cache
+    if _machine_cache is None:
+        _machine_cache = MachineCache()
+    return _machine_cache.get(machine_name)
+
+
+def wedged_MU(MU, wedge_angle, q0, p0):
+    """Wedged MU for the open field MU, wedge angle (degrees) and the motorized wedge modulation parameters of the beam quality."""
+    to_rad = pi / 180
     tcax = e ** (tan(q0) * p0)
     v = wedge_angle * to_rad
     phi = 60 * to_rad
     ratio = tan(v) / (tan(phi) * tcax + tan(v) * (1 - tcax))
-
     return MU * ratio
 
 
+def get_wedged_MU(beam):
+    """
+    Calculate the wedged MU for a Raystation beam object and return it.
+    """
+    machine_name, energy = beam.MachineReference.MachineName, '%g' % beam.MachineReference.Energy
+    parameters = machine_parameters(machine_name)['energies'].get(energy)
+    if parameters is None or parameters['wedge_q0'] is None or parameters['wedge_p0'] is None:
+        raise ValueError('No motorized wedge parameters for %s MV on machine %s (machine model not loaded or energy not commissioned).'
+                         % (energy, machine_name))
+    return wedged_MU(beam.BeamMU, beam.Wedge.Angle, parameters['wedge_q0'], parameters['wedge_p0'])
+
+
+def get_wedged_MUs(beam_set):
+    """Return {beam name: wedged MU} for all wedged beams of a beam set. The machine model is read once for the whole beam set."""
+    result = {}
+    for beam in beam_set.Beams:
+        wedge = _attribute(beam, 'Wedge')
+        if wedge is None or not _attribute(wedge, 'Angle'):
+            continue
+        result[beam.Name] = get_wedged_MU(beam)
+    return result
+
+
 def reorder_beamset(beamset):
     """Reorder the beams in the beamset, first by gantry angle (180.1 clockwise to 180.0) for couch = 0 beams, and then by gantry angle for increasing couch angle.
     For beams at the same angle, beams will be ordered from largest to smallest segment size. If there are multiple segments the first segment will be used for the determination."""
@@ -221,19 +557,156 @@ def reorder_beamset(beamset):
             1))  # Sort by segment size if couch and gantry angle are the same. May be useful prior to merging SnS beams.
 
     print([each.Name for each in beamli])
-    oldbeamnums = [each.Number for each in beamli]
-    tempadd = beamset.Beams.Count
+    renumber_beams(beamset, [each.Name for each in beamli])
+    return True
+
+
+def plan_renumbering(current, target):
+    """Plan the beam number writes that change the numbers current into target (lists of unique numbers, one entry per beam) with the
+       fewest writes. Beams whose target number is free are moved first, each freeing its old number for the next. The remaining cycles
+       each take one write more than their length, passing through a single temporary number above all used numbers.
+       Returns a list of (beam index, new number) writes in order."""
+    assert len(current) == len(target) and len(set(target)) == len(target), 'Target beam numbers must be unique.'
+    number = list(current)
+    holder = {n: i for i, n in enumerate(current)}
+    pending = {i for i in range(len(current)) if current[i] != target[i]}
+    wanted = {target[i]: i for i in pending}
+    writes = []
+
+    def move(i, new, free):
+        writes.append((i, new))
+        old = number[i]
+        del holder[old]
+        number[i], holder[new] = new, i
+        if number[i] == target[i]:
+            pending.discard(i)
+        if old in wanted and wanted[old] in pending:
+            free.append(old)
+
+    free = [n for n in wanted if n not in holder]
+    temporary = max(list(current) + list(target)) + 1
     while True:
-        tempbeamnums = [each + tempadd for each in oldbeamnums]
-        if len(set(oldbeamnums).intersection(set(tempbeamnums))) > 0:
-            tempadd += 1
-        else:
+        while free:
+            n = free.pop()
+            move(wanted[n], n, free)
+        if not pending:
             break
-    for each in beamli:
-        each.Number = each.Number + tempadd
-    for i, each in enumerate(beamli):
-        each.Number = i + 1
-    return True
+        move(min(pending), temporary, free)  # Break a cycle through the temporary number.
+    return writes
+
+
+def renumber_beams(beam_set, order, dry_run=False):
+    """Renumber the beams of a beam set 1, 2, ... in the order of the supplied beam names, using the minimal writes of plan_renumbering()
+       in a single undo step. With dry_run the beam set is not changed. Returns the planned writes as [(beam name, new number), ...]."""
+    beams = {each.Name: each for each in beam_set.Beams}
+    assert sorted(order) == sorted(beams), 'The order must list every beam of the beam set once.'
+    names = list(order)
+    writes = [(names[i], number) for i, number in plan_renumbering([beams[each].Number for each in names],
+                                                                      list(range(1, len(names) + 1)))]
+    if not dry_run and writes:
+        with CompositeAction('Renumber beams'):
+            for name, number in writes:
+                beams[name].Number = number
+    return writes
+
+
+def transition_times(beams, limits=None):
+    """(B, B) matrix of the machine time (s) to go from the end of beam i to the start of beam j for a list of BeamSegments. Gantry,
+       collimator, couch and leaves move simultaneously, so each transition takes as long as its slowest axis."""
+    limits = dict(DELIVERY_LIMITS, **(limits or {}))
+    stop = np.array([each.stop_angle for each in beams])
+    start = np.array([each.gantry_angle for each in beams])
+    coll_stop = np.array([each.collimator_angles[-1] if len(each) else 0. for each in beams])
+    coll_start = np.array([each.collimator_angles[0] if len(each) else 0. for each in beams])
+    couch = np.array([each.couch_angle for each in beams])
+    times = [gantry_travel(stop[:, None], start[None, :]) / limits['gantry_speed'],
+             gantry_travel(coll_stop[:, None], coll_start[None, :]) / limits['collimator_speed'],
+             np.abs((couch[:, None] - couch[None, :] + 180) % 360 - 180) / limits['couch_speed']]
+    leaves = [each.leaves[0] if len(each) else None for each in beams]
+    last = [each.leaves[-1] if len(each) else None for each in beams]
+    leaf = np.zeros((len(beams), len(beams)))
+    for i, a in enumerate(last):
+        for j, b in enumerate(leaves):
+            if a is not None and b is not None and a.shape == b.shape:
+                leaf[i, j] = np.abs(b - a).max() / limits['leaf_speed']
+    result = np.max(times + [leaf], axis=0)
+    np.fill_diagonal(result, 0)
+    return result
+
+
+def _order_time(order, costs):
+    return float(sum(costs[a, b] for a, b in zip(order[:-1], order[1:])))
+
+
+def _exact_order(costs):
+    """Shortest open path through all beams (Held-Karp dynamic programming over subsets)."""
+    n = len(costs)
+    best = {(1 << i, i): (0., [i]) for i in range(n)}
+    for size in range(2, n + 1):
+        layer = {}
+        for (subset, last), (cost, path) in best.items():
+            for j in range(n):
+                if subset & (1 << j):
+                    continue
+                key = (subset | (1 << j), j)
+                value = cost + costs[last, j]
+                if key not in layer or value < layer[key][0]:
+                    layer[key] = (value, path + [j])
+        best = layer
+    return min(best.values(), key=lambda x: x[0])[1]
+
+
+def _two_opt_order(costs):
+    """Nearest neighbour path from every starting beam, improved by 2-opt segment reversals, keeping the best. Transition times are
+       not symmetric, so reversing beams i..k changes the two edges at its ends and the direction of the edges inside it; the change
+       is computed from prefix sums of the forward and reversed edge times along the path, which are updated after each reversal."""
+    n = len(costs)
+    result, result_time = None, None
+    for first in range(n):
+        order, remaining = [first], set(range(n)) - {first}
+        while remaining:
+            order.append(min(remaining, key=lambda j: costs[order[-1], j]))
+            remaining.discard(order[-1])
+        improved = True
+        while improved:
+            improved = False
+            path = np.array(order)
+            forward = np.concatenate(([0.], np.cumsum(costs[path[:-1], path[1:]])))
+            backward = np.concatenate(([0.], np.cumsum(costs[path[1:], path[:-1]])))
+            for i in range(0, n - 1):
+                for k in range(i + 1, n):
+                    gain = forward[k] - forward[i] - backward[k] + backward[i]
+                    if i > 0:
+                        gain += costs[order[i - 1], order[i]] - costs[order[i - 1], order[k]]
+                    if k < n - 1:
+                        gain += costs[order[k], order[k + 1]] - costs[order[i], order[k + 1]]
+                    if gain > 1e-9:
+                        order, improved = order[:i] + order[i:k + 1][::-1] + order[k + 1:], True
+                        break
+                if improved:
+                    break
+        total = _order_time(order, costs)
+        if result is None or total < result_time:
+            result, result_time = order, total
+    return result
+
+
+def optimize_beam_order(beam_set, limits=None, exact_limit=9, beams=None):
+    """Find a beam order minimizing the machine time between beams (see transition_times()). Beam sets of up to exact_limit beams are
+       solved exactly, larger ones with a 2-opt heuristic. Nothing is changed in the beam set; see renumber_beams() to apply the order.
+
+       Returns {'order': [beam names], 'current': seconds, 'optimized': seconds, 'saved': seconds}, where the times are the total time
+       between beams for the current (beam number) and the optimized order."""
+    beams = sorted(beam_set_segments(beam_set) if beams is None else beams, key=lambda x: x.number)
+    if len(beams) < 2:
+        return {'order': [each.name for each in beams], 'current': 0., 'optimized': 0., 'saved': 0.}
+    costs = transition_times(beams, limits)
+    order = _exact_order(costs) if len(beams) <= exact_limit else _two_opt_order(costs)
+    current = _order_time(list(range(len(beams))), costs)
+    optimized = min(_order_time(order, costs), current)
+    if optimized == current:
+        order = list(range(len(beams)))
+    return {'order': [beams[i].name for i in order], 'current': current, 'optimized': optimized, 'saved': current - optimized}
 
 
 ###########################
@@ -243,120 +716,149 @@ def reorder_beamset(beamset):
 ###########################
 
 
+PATIENT_ORIENTATIONS = ['HeadFirstSupine', 'FeetFirstSupine', 'HeadFirstProne', 'FeetFirstProne', 'HeadFirstDecubitusRight',
+                        'FeetFirstDecubitusRight', 'HeadFirstDecubitusLeft', 'FeetFirstDecubitusLeft']
+
+# Letters 'APRLSI' of a HFS name become these letters for each patient orientation.
+ORIENTATION_LETTERS = {'HeadFirstSupine': 'APRLSI', 'FeetFirstSupine': 'APLRIS', 'HeadFirstProne': 'PALRSI',
+                       'FeetFirstProne': 'PARLIS', 'HeadFirstDecubitusRight': 'LRAPSI', 'FeetFirstDecubitusRight': 'LRPAIS',
+                       'HeadFirstDecubitusLeft': 'RLPASI', 'FeetFirstDecubitusLeft': 'RLAPIS'}
+ORIENTATION_TABLES = {key: str.maketrans('APRLSI', value) for key, value in ORIENTATION_LETTERS.items()}
+
+# Beams along the patient axes are named from a lookup per orientation rather than by swapping letters.
+AXIS_BEAM_NAMES = ['AP', 'L_Lat', 'PA', 'R_Lat', 'Inf', 'Vertex']
+ORIENTATION_AXIS_NAMES = {
+    'FeetFirstSupine': {'AP': 'AP', 'L_Lat': 'R_Lat', 'PA': 'PA', 'R_Lat': 'L_Lat', 'Inf': 'Vertex', 'Vertex': 'Inf'},
+    'HeadFirstProne': {'AP': 'PA', 'L_Lat': 'R_Lat', 'PA': 'AP', 'R_Lat': 'L_Lat', 'Inf': 'Inf', 'Vertex': 'Vertex'},
+    'FeetFirstProne': {'AP': 'PA', 'L_Lat': 'L_Lat', 'PA': 'AP', 'R_Lat': 'R_Lat', 'Inf': 'Vertex', 'Vertex': 'Inf'},
+    'HeadFirstDecubitusRight': {'AP': 'L_Lat', 'L_Lat': 'PA', 'PA': 'R_Lat', 'R_Lat': 'AP', 'Inf': 'Inf', 'Vertex': 'Vertex'},
+    'FeetFirstDecubitusRight': {'AP': 'L_Lat', 'L_Lat': 'AP', 'PA': 'R_Lat', 'R_Lat': 'PA', 'Inf': 'Vertex', 'Vertex': 'Inf'},
+    'HeadFirstDecubitusLeft': {'AP': 'R_Lat', 'L_Lat': 'AP', 'PA': 'L_Lat', 'R_Lat': 'PA', 'Inf': 'Inf', 'Vertex': 'Vertex'},
+    'FeetFirstDecubitusLeft': {'AP': 'R_Lat', 'L_Lat': 'PA', 'PA': 'L_Lat', 'R_Lat': 'AP', 'Inf': 'Vertex', 'Vertex': 'Inf'}}
+
+# UW naming pattern by gantry group (rows) and couch group (columns), see _standard_name().
+BEAM_NAME_PATTERNS = [['ALS', 'ASL', 'ASR', 'AIR', 'AIL', 'ALI'],
+                      ['LAS', 'SAL', 'SAR', 'IAR', 'IAL', 'LAI'],
+                      ['LPS', 'SPL', 'SPR', 'IPR', 'IPL', 'LPI'],
+                      ['PLS', 'PSL', 'PSR', 'PIR', 'PIL', 'PLI'],
+                      ['PRI', 'PIR', 'PIL', 'PLS', 'PSR', 'PRS'],
+                      ['RPI', 'IPR', 'IPL', 'LPS', 'SPR', 'RPS'],
+                      ['RAI', 'IAR', 'IAL', 'LAS', 'SAR', 'RAS'],
+                      ['ARI', 'AIR', 'AIL', 'ALS', 'ASR', 'ARS']]
+
+
 def name_beam(gantry, couch, orientation):
     """Returns the base name for a beam given the gantry and couch angle, and the patient orientation. The function name_beam_standard is used to generate the name for a HFS patient,
        and this function accounts for patient orientation either using a lookup table for special cases (i.e. along patient axes) or by simply swapping R-L, S-I, A-P as appropriate for
-       the patient orientation."""
-    name = name_beam_standard(gantry, couch)
-    if name in ['AP', 'L_Lat', 'PA', 'R_Lat', 'Inf', 'Vertex']:
-        if orientation == 'FeetFirstSupine':
-            name = {'AP': 'AP', 'L_Lat': 'R_Lat', 'PA': 'PA', 'R_Lat': 'L_Lat', 'Inf': 'Vertex',
-                    'Vertex': 'Inf'}[name]
-        if orientation == 'HeadFirstProne':
-            name = {'AP': 'PA', 'L_Lat': 'R_Lat', 'PA': 'AP', 'R_Lat': 'L_Lat', 'Inf': 'Inf',
-                    'Vertex': 'Vertex'}[name]
-        if orientation == 'FeetFirstProne':
-            name = {'AP': 'PA', 'L_Lat': 'L_Lat', 'PA': 'AP', 'R_Lat': 'R_Lat', 'Inf': 'Vertex',
-                    'Vertex': 'Inf'}[name]
-        if orientation == 'HeadFirstDecubitusRight':
-            name = {'AP': 'L_Lat', 'L_Lat': 'PA', 'PA': 'R_Lat', 'R_Lat': 'AP', 'Inf': 'Inf',
-                    'Vertex': 'Vertex'}[name]
-        if orientation == 'FeetFirstDecubitusRight':
-            name = {'AP': 'L_Lat', 'L_Lat': 'AP', 'PA': 'R_Lat', 'R_Lat': 'PA', 'Inf': 'Vertex',
-                    'Vertex': 'Inf'}[name]
-        if orientation == 'HeadFirstDecubitusLeft':
-            name = {'AP': 'R_Lat', 'L_Lat': 'AP', 'PA': 'L_Lat', 'R_Lat': 'PA', 'Inf': 'Inf',
-                    'Vertex': 'Vertex'}[name]
-        if orientation == 'FeetFirstDecubitusRight':
-            name = {'AP': 'R_Lat', 'L_Lat': 'PA', 'PA': 'L_Lat', 'R_Lat': 'AP', 'Inf': 'Vertex',
-                    'Vertex': 'Inf'}[name]
-    else:
-        name = translate_position(name, orientation)
-    return name
+       the patient orientation. Whole degree angles are looked up in beam_name_table(), use name_beams() to name many beams at once."""
+    if gantry == int(gantry) and couch == int(couch) and 0 <= gantry <= 360 and 0 <= couch <= 360:
+        name = beam_name_table(orientation)[int(gantry), int(couch)]
+        if name is not None:
+            return name
+    return _orient_name(name_beam_standard(gantry, couch), orientation)
 
 
-def name_beam_standard(gantry, couch):
-    """Returns the base name for a beam for a head first supine patient given the gantry and couch angle according to the UW naming schema."""
+def _orient_name(name, orientation):
+    """Translate a HFS beam name to the patient orientation."""
+    if name in AXIS_BEAM_NAMES:
+        return ORIENTATION_AXIS_NAMES.get(orientation, {}).get(name, name)
+    return translate_position(name, orientation)
+
+
+def _standard_name(gantry, couch):
+    """Returns the HFS beam name for the gantry and couch angle, or None if the couch angle is outside the naming schema (110 to 250 degrees)."""
     # Special Cases
-    if couch % 90 == 0 and gantry % 90 == 0:
-        if couch == 0:
-            result = {0: 'AP', 90: 'L_Lat', 180: 'PA', 270: 'R_Lat', 360: 'AP'}[gantry]
-        if couch == 270:
-            result = {0: 'AP', 90: 'Vertex', 180: 'PA', 270: 'Inf', 360: 'AP'}[gantry]
-        if couch == 90:
-            result = {0: 'AP', 90: 'Inf', 180: 'PA', 270: 'Vertex', 360: 'AP'}[gantry]
-        print('name_beam_standard result: ', result)
-        return result
+    if couch % 90 == 0 and gantry % 90 == 0 and couch != 180:
+        return {0: {0: 'AP', 90: 'L_Lat', 180: 'PA', 270: 'R_Lat', 360: 'AP'},
+                270: {0: 'AP', 90: 'Vertex', 180: 'PA', 270: 'Inf', 360: 'AP'},
+                90: {0: 'AP', 90: 'Inf', 180: 'PA', 270: 'Vertex', 360: 'AP'},
+                360: {}}[couch].get(gantry)
     # Determine gantry and couch grouping for naming pattern lookup.
     gantrygroup = [0 <= gantry <= 45, 45 < gantry <= 90, 90 < gantry < 135, 135 <= gantry < 180,
                    180 <= gantry <= 225, 225 < gantry <= 270, 270 < gantry < 315,
                    315 <= gantry <= 360]
-    assert gantrygroup.count(True) == 1
-    gantrygroup = gantrygroup.index(True)
-
     couchgroup = [315 < couch <= 360, 270 <= couch <= 315, 250 < couch < 270, 90 < couch < 110,
                   45 < couch <= 90, 0 <= couch <= 45]
-    assert couchgroup.count(True) == 1
-    couchgroup = couchgroup.index(True)
-
-    patternlookup = [['ALS', 'ASL', 'ASR', 'AIR', 'AIL', 'ALI'],
-                     ['LAS', 'SAL', 'SAR', 'IAR', 'IAL', 'LAI'],
-                     ['LPS', 'SPL', 'SPR', 'IPR', 'IPL', 'LPI'],
-                     ['PLS', 'PSL', 'PSR', 'PIR', 'PIL', 'PLI'],
-                     ['PRI', 'PIR', 'PIL', 'PLS', 'PSR', 'PRS'],
-                     ['RPI', 'IPR', 'IPL', 'LPS', 'SPR', 'RPS'],
-                     ['RAI', 'IAR', 'IAL', 'LAS', 'SAR', 'RAS'],
-                     ['ARI', 'AIR', 'AIL', 'ALS', 'ASR', 'ARS']]
-    # Usage: patternlookup[gantrygoup][couchgroup]
-
-    pattern = patternlookup[gantrygroup][couchgroup]
+    if gantrygroup.count(True) != 1 or couchgroup.count(True) != 1:
+        return None
+    pattern = BEAM_NAME_PATTERNS[gantrygroup.index(True)][couchgroup.index(True)]
     gantrynum = abs(
         min(gantry % 90, 90 - gantry % 90))  # Deviation from nearest cardinal angle for gantry...
     couchnum = abs(min(couch % 90, 90 - couch % 90))  # and couch.
 
     result = pattern[0]
     if gantrynum != 0:
-        result += str(gantrynum) + pattern[1]
+        result += '%g' % gantrynum + pattern[1]
     if couchnum != 0:
-        result += str(couchnum) + pattern[2]
+        result += '%g' % couchnum + pattern[2]
     return result
 
 
-def translate_position(name, orientation):
-    """Helper function to translate string from one patient orientation to another."""
+def name_beam_standard(gantry, couch):
+    """Returns the base name for a beam for a head first supine patient given the gantry and couch angle according to the UW naming schema."""
+    result = _standard_name(gantry, couch)
+    assert result is not None, 'Gantry %s / couch %s is outside the beam naming schema.' % (gantry, couch)
+    return result
+
+
+@lru_cache(maxsize=None)
+def beam_name_table(orientation):
+    """Return a (361, 361) object array of beam names indexed by [gantry, couch] in whole degrees for the patient orientation.
+       Couch angles outside the naming schema are None. Tables are built once per orientation."""
     if orientation == 'HeadFirstSupine':
-        pass
-    elif orientation == 'FeetFirstSupine':
-        intab = 'APRLSI'
-        outtab = 'APLRIS'
-        name = name.replace(intab, outtab)
-    elif orientation == 'HeadFirstProne':
-        intab = 'APRLSI'
-        outtab = 'PALRSI'
-        name = name.replace(intab, outtab)
-    elif orientation == 'FeetFirstProne':
-        intab = 'APRLSI'
-        outtab = 'PARLIS'
-        name = name.replace(intab, outtab)
-    elif orientation == 'HeadFirstDecubitusRight':
-        intab = 'APRLSI'
-        outtab = 'LRAPSI'
-        name = name.replace(intab, outtab)
-    elif orientation == 'FeetFirstDecubitusRight':
-        intab = 'APRLSI'
-        outtab = 'LRPAIS'
-        name = name.replace(intab, outtab)
-    elif orientation == 'HeadFirstDecubitusLeft':
-        intab = 'APRLSI'
-        outtab = 'RLPASI'
-        name = name.replace(intab, outtab)
-    elif orientation == 'FeetFirstDecubitusLeft':
-        intab = 'APRLSI'
-        outtab = 'RLAPIS'
-        name = name.replace(intab, outtab)
+        table = np.empty((361, 361), dtype=object)
+        for gantry in range(361):
+            for couch in range(361):
+                table[gantry, couch] = _standard_name(gantry, couch)
     else:
+        standard = beam_name_table('HeadFirstSupine')
+        names = {name: _orient_name(name, orientation) for name in set(standard.ravel().tolist()) if name is not None}
+        names[None] = None
+        table = np.array([names[each] for each in standard.ravel().tolist()], dtype=object).reshape(standard.shape)
+    table.setflags(write=False)
+    return table
+
+
+def name_beams(gantries, couches, orientation):
+    """Return the base names of many beams in one table lookup, see name_beam(). Angles that are not whole degrees are named individually."""
+    gantries = np.asarray(gantries, dtype=float)
+    couches = np.asarray(couches, dtype=float)
+    names = np.full(gantries.shape, None, dtype=object)
+    lookup = (gantries == np.round(gantries)) & (couches == np.round(couches)) & (gantries >= 0) & (gantries <= 360) & \
+             (couches >= 0) & (couches <= 360)
+    names[lookup] = beam_name_table(orientation)[gantries[lookup].astype(int), couches[lookup].astype(int)]
+    for i in np.flatnonzero(names == None):
+        names[i] = name_beam(gantries[i], couches[i], orientation)
+    return names.tolist()
+
+
+def unique_beam_names(names):
+    """Make beam names unique within a beam set by numbering repeats, e.g. ['AP', 'AP', 'PA'] -> ['AP', 'AP_2', 'PA']."""
+    result = []
+    used = set()
+    for name in names:
+        candidate, count = name, 1
+        while candidate in used:
+            count += 1
+            candidate = '%s_%i' % (name, count)
+        used.add(candidate)
+        result.append(candidate)
+    return result
+
+
+def name_beam_set(beam_set):
+    """Return the unique UW names of all beams in a beam set, in beam order, from one batched lookup."""
+    beams = list(beam_set.Beams)
+    names = name_beams([each.GantryAngle for each in beams], [each.CouchAngle for each in beams], beam_set.PatientPosition)
+    return unique_beam_names(names)
+
+
+def translate_position(name, orientation):
+    """Helper function to translate string from one patient orientation to another."""
+    if orientation not in ORIENTATION_TABLES:
         print("Unknown patient orientation, result will likely be incorrect.")
-    return name
+        return name
+    return name.translate(ORIENTATION_TABLES[orientation])
 
 
 def get_wedge_orientation(coll_rot, gantry_rot, couch_rot, pat_orientation):
@@ -397,17 +899,198 @@ def get_wedge_orientation(coll_rot, gantry_rot, couch_rot, pat_orientation):
 
     # Translate for actual patient orientation.
     result = translate_position(result, pat_orientation)
-    print('Get Wedge Orientation Result: ', result)
 
     return result
 
 
+WEDGE_HEEL_NAMES = np.array([['HL', 'HR'], ['HS', 'HI'], ['HA', 'HP']])
+
+
+def _rotate_batch(vectors, axis, theta):
+    """Rotate (N, 3) vectors about axis by an (N,) array of angles in degrees, rounding like rot_vect()."""
+    t = np.radians(theta)
+    c, s = np.cos(t), np.sin(t)
+    x, y, z = vectors[:, 0], vectors[:, 1], vectors[:, 2]
+    if axis == 'y':
+        result = np.stack([c * x + s * z, y, -1 * s * x + c * z], axis=1)
+    else:
+        result = np.stack([c * x - s * y, s * x + c * y, z], axis=1)
+    return np.round(result, 4)
+
+
+def get_wedge_orientations(coll_rot, gantry_rot, couch_rot, pat_orientation):
+    """Batched get_wedge_orientation(): determine the wedge heel orientation of many beams at once. Angles are arrays (or scalars) in degrees,
+       pat_orientation is a single orientation or one per beam. Returns a list of heel labels ('HL', 'HS', ...)."""
+    coll_rot, gantry_rot, couch_rot = np.broadcast_arrays(*[np.atleast_1d(np.asarray(each, dtype=float)) for each in
+                                                            (coll_rot, gantry_rot, couch_rot)])
+    n = len(coll_rot)
+    wedge = [np.tile([0., 0., -1.], (n, 1)), np.tile([1., 0., 0.], (n, 1))]
+    wedge = [_rotate_batch(_rotate_batch(each, 'z', coll_rot), 'y', gantry_rot) for each in wedge]
+    wedge = np.cross(wedge[0], wedge[1])
+    patient = [_rotate_batch(np.tile(each, (n, 1)), 'z', couch_rot) for each in np.eye(3)]
+    result = np.stack([np.einsum('ij,ij->i', wedge, each) for each in patient], axis=1)
+
+    # Largest overlap, taking the last axis on ties as the sorted() in get_wedge_orientation() does.
+    axis = 2 - np.argmax(np.abs(result)[:, ::-1], axis=1)
+    names = WEDGE_HEEL_NAMES[axis, (result[np.arange(n), axis] < 0).astype(int)]
+
+    orientations = [pat_orientation] * n if isinstance(pat_orientation, str) else list(pat_orientation)
+    return [translate_position(name, orientation) for name, orientation in zip(names.tolist(), orientations)]
+
+
 ##########################
 #                        #
 # Mathematical Utilities #
 #                        #
 ##########################
 
+# Cartesian to DICOM coordinate transform for each patient orientation: dicom = DICOM_TRANSFORMS[orientation] @ cartesian.
+DICOM_TRANSFORMS = {
+    'HeadFirstSupine': np.array([[1, 0, 0], [0, 0, -1], [0, 1, 0]], dtype=float),
+    'FeetFirstSupine': np.array([[-1, 0, 0], [0, 0, -1], [0, -1, 0]], dtype=float),
+    'HeadFirstProne': np.array([[-1, 0, 0], [0, 0, 1], [0, 1, 0]], dtype=float),
+    'FeetFirstProne': np.array([[1, 0, 0], [0, 0, 1], [0, -1, 0]], dtype=float),
+    'HeadFirstDecubitusRight': np.array([[0, 0, -1], [-1, 0, 0], [0, 1, 0]], dtype=float),
+    'FeetFirstDecubitusRight': np.array([[0, 0, 1], [-1, 0, 0], [0, -1, 0]], dtype=float),
+    'HeadFirstDecubitusLeft': np.array([[0, 0, 1], [1, 0, 0], [0, 1, 0]], dtype=float),
+    'FeetFirstDecubitusLeft': np.array([[0, 0, -1], [1, 0, 0], [0, -1, 0]], dtype=float)}
+
+
+@lru_cache(maxsize=1024)
+def rotation_matrix(axis, theta):
+    """Return the (read-only) 3x3 matrix rotating by theta degrees about the Cartesian axis ('x', 'y', 'z' or None for no rotation).
+       Matrices are cached by (axis, theta) as the same machine angles are used repeatedly."""
+    t = pi / 180 * theta
+    if axis is None:
+        r = np.eye(3)
+    elif axis == 'x':
+        r = np.array([[1, 0, 0], [0, cos(t), -1 * sin(t)], [0, sin(t), cos(t)]])
+    elif axis == 'y':
+        r = np.array([[cos(t), 0, sin(t)], [0, 1, 0], [-1 * sin(t), 0, cos(t)]])
+    elif axis == 'z':
+        r = np.array([[cos(t), -1 * sin(t), 0], [sin(t), cos(t), 0], [0, 0, 1]])
+    else:
+        raise ValueError("Unknown rotation axis '%s'." % axis)
+    r.setflags(write=False)
+    return r
+
+
+def rot_vects(vectors, axis, theta):
+    """Rotate an (N, 3) array of vectors about the specified axis by theta degrees, see rot_vect(). Returns an (N, 3) array."""
+    return np.asarray(vectors, dtype=float).reshape(-1, 3) @ rotation_matrix(axis, float(theta)).T
+
+
+def cps(v1, v2):
+    """Returns the row-wise cross products of two (N, 3) arrays (or a (3,) vector broadcast against an (N, 3) array)."""
+    return np.cross(np.asarray(v1, dtype=float), np.asarray(v2, dtype=float))
+
+
+def dps(v1, v2):
+    """Returns the row-wise dot products of two (N, 3) arrays (or a (3,) vector broadcast against an (N, 3) array)."""
+    return np.einsum('...i,...i->...', np.asarray(v1, dtype=float), np.asarray(v2, dtype=float))
+
+
+def cartesian_to_dicom_array(points, pat_orientation):
+    """Translate an (N, 3) array of points in Cartesian (Raystation internal) coordinates to DICOM coordinates for the specified patient
+       orientation, see cartesian_to_dicom(). Returns an (N, 3) array. Points are returned unchanged for an unknown orientation."""
+    points = np.asarray(points, dtype=float).reshape(-1, 3)
+    transform = DICOM_TRANSFORMS.get(pat_orientation)
+    if transform is None:
+        return points.copy()
+    return points @ transform.T
+
+
+class Transform(object):
+    """Homogeneous 4x4 transform of Cartesian (Raystation internal) coordinates in cm. Transforms are chained with then() (or @, where
+       (a @ b) applies b first), applied locally to point clouds and contours with apply(), and passed to Raystation with to_dict(),
+       e.g. Transform.translation(0, dy, 0).then(Transform.rotation('y', couch_angle)).to_dict()."""
+
+    def __init__(self, matrix=None):
+        self.matrix = np.eye(4) if matrix is None else np.array(matrix, dtype=float).reshape(4, 4)
+
+    @classmethod
+    def translation(cls, x=0, y=0, z=0):
+        t = cls()
+        t.matrix[:3, 3] = x, y, z
+        return t
+
+    @classmethod
+    def rotation(cls, axis, theta, center=(0, 0, 0)):
+        """Rotation by theta degrees about an axis ('x', 'y', 'z') through center, see rot_vect()."""
+        t = cls()
+        t.matrix[:3, :3] = rotation_matrix(axis, float(theta))
+        return cls.translation(*center) @ t @ cls.translation(*[-1 * each for each in center])
+
+    @classmethod
+    def orientation(cls, pat_orientation):
+        """Cartesian to DICOM transform for the patient orientation, see cartesian_to_dicom()."""
+        t = cls()
+        t.matrix[:3, :3] = DICOM_TRANSFORMS[pat_orientation]
+        return t
+
+    @classmethod
+    def from_dict(cls, matrix):
+        """Build a transform from a Raystation {'M11': ..., 'M44': ...} transformation matrix dict."""
+        return cls([[matrix['M%i%i' % (i, j)] for j in range(1, 5)] for i in range(1, 5)])
+
+    def __matmul__(self, other):
+        return Transform(self.matrix @ other.matrix)
+
+    def then(self, other):
+        """Return the transform applying self followed by other."""
+        return other @ self
+
+    def inverse(self):
+        return Transform(np.linalg.inv(self.matrix))
+
+    def is_rigid(self, tolerance=1e-6):
+        """True if the transform is a rotation plus translation, as required by TransformROI3D."""
+        r = self.matrix[:3, :3]
+        return bool(np.allclose(r @ r.T, np.eye(3), atol=tolerance) and abs(np.linalg.det(r) - 1) < tolerance and
+                    np.allclose(self.matrix[3], [0, 0, 0, 1], atol=tolerance))
+
+    def apply(self, points):
+        """Transform an (N, 3) array (or list of [x, y, z]) of points. Returns an (N, 3) array."""
+        points = np.asarray(points, dtype=float).reshape(-1, 3)
+        return points @ self.matrix[:3, :3].T + self.matrix[:3, 3]
+
+    def apply_contours(self, contours):
+        """Transform a list of contours (e.g. RoiGeometry.PrimaryShape.Contours as (N, 3) arrays or lists of {'x','y','z'} points).
+           Returns a list of (N, 3) arrays."""
+        result = []
+        for contour in contours:
+            if len(contour) and not hasattr(contour[0], '__len__'):
+                contour = [[point.x, point.y, point.z] for point in contour]
+            result.append(self.apply(contour))
+        return result
+
+    def to_dict(self):
+        """Return the {'M11': ..., 'M44': ...} dict used by TransformationMatrix arguments."""
+        return {'M%i%i' % (i + 1, j + 1): float(self.matrix[i, j]) for i in range(4) for j in range(4)}
+
+    def __repr__(self):
+        return 'Transform(%s)' % np.array2string(self.matrix, precision=4, suppress_small=True)
+
+
+def transform_rois(case, examination, roi_names, transform):
+    """Apply one rigid Transform to several ROIs on an examination as a single undo step. The transform is checked before any
+       ROI is moved, and the transformed bounding box corners of each ROI are returned ({roi name: (8, 3) array}) so the move can
+       be verified against e.g. the image stack bounding box."""
+    if not transform.is_rigid():
+        raise ValueError('Only rigid transforms can be applied to ROIs: %s' % transform)
+    matrix = transform.to_dict()
+    structure_set = case.PatientModel.StructureSets[examination.Name]
+    moved = {}
+    for roi in roi_names:
+        box = np.array([[each.x, each.y, each.z] for each in structure_set.RoiGeometries[roi].GetBoundingBox()])
+        corners = np.array([[x, y, z] for x in box[:, 0] for y in box[:, 1] for z in box[:, 2]])
+        moved[roi] = transform.apply(corners)
+    with CompositeAction('Transform ROIs (%s)' % ', '.join(roi_names)):
+        for roi in roi_names:
+            case.PatientModel.RegionsOfInterest[roi].TransformROI3D(Examination=examination, TransformationMatrix=matrix)
+    return moved
+
+
 def cp(v1, v2):
     """Returns the cross product of two vectors supplied as lists."""
     return [v1[1] * v2[2] - v1[2] * v2[1],
@@ -424,57 +1107,28 @@ def rot_vect(v1, axis, theta):
     """Rotate a vector along the specified axis ('x','y','z') by an amount theta (in degrees). The vector is supplied as a list. Rotation direction is
        based on standard 3D Cartesian space (https://en.wikipedia.org/wiki/Cartesian_coordinate_system) and the right hand rule. For clarity, for a head first
        supine patient Cartesian x, y, and z correspond to patient right to left, inf to sup, and post to ant respectively.
+       Use rot_vects() to rotate many vectors at once.
 
        v1: A list of specifying the vector to be rotated. [x,y,z]
        axis: A string specifing the axis to rotate about. 'x'/'y'/'z'
        theta: The magnitude of rotation in degrees."""
-    theta = pi / 180 * theta
     if axis == None:
         return v1
-    if axis == 'x':
-        r = [[1, 0, 0], [0, cos(theta), -1 * sin(theta)], [0, sin(theta), cos(theta)]]
-    if axis == 'y':
-        r = [[cos(theta), 0, sin(theta)], [0, 1, 0], [-1 * sin(theta), 0, cos(theta)]]
-    if axis == 'z':
-        r = [[cos(theta), -1 * sin(theta), 0], [sin(theta), cos(theta), 0], [0, 0, 1]]
-    result = []
-    for a, b in zip([v1, v1, v1], r):
-        result.append(dp(a, b))
-    return [round(each, 4) for each in result]
+    r = rotation_matrix(axis, float(theta))
+    return [round(dp(v1, each), 4) for each in r.tolist()]
 
 
 def cartesian_to_dicom(pt_li, pat_orientation):
     """Take a list of points in standard Cartesian space (equivalent to Raystation internal coordinates, where x is positive towards patient left for a HFS patient,
        y is towards patient superior, and z is towards patient anterior), and translate them to DICOM coordinates for the specified patient orientation.
-       The points should be supplied as a list of lists, with each sublist having 3 entries corresponding to x,y,z.
+       The points should be supplied as a list of lists, with each sublist having 3 entries corresponding to x,y,z. Use cartesian_to_dicom_array()
+       for large point sets.
 
        pt-li: A list of 3-entry x,y,z lists. E.g. [[x0,y0,z0],[x1,y1,z1],...[xn,yn,zn]]
        pat_orientation: A string specifying the patient orientation. {HeadFirst/FeetFirst}{Supine/Prone/DecubitusRight/DecubitusLeft}"""
-    result = []
-    if type(pt_li[0]) == type(float()) or type(pt_li[0]) == type(int()) and len(pt_li) == 3:
-        pt_li = list(pt_li)
     for each in pt_li:
         assert len(each) == 3
-    for each in pt_li:
-        x, y, z = each[0], each[1], each[2]
-        if pat_orientation == 'HeadFirstSupine':
-            x, y, z = x, -1 * z, y
-        if pat_orientation == 'FeetFirstSupine':
-            x, y, z = -1 * x, -1 * z, -1 * y
-        if pat_orientation == 'HeadFirstProne':
-            x, y, z = -1 * x, z, y
-        if pat_orientation == 'FeetFirstProne':
-            x, y, z = x, z, -1 * y
-        if pat_orientation == 'HeadFirstDecubitusRight':
-            x, y, z = -1 * z, -1 * x, y
-        if pat_orientation == 'FeetFirstDecubitusRight':
-            x, y, z = z, -1 * x, -1 * y
-        if pat_orientation == 'HeadFirstDecubitusLeft':
-            x, y, z = z, x, y
-        if pat_orientation == 'FeetFirstDecubitusRight':
-            x, y, z = -1 * z, x, -1 * y
-        result.append([x, y, z])
-    return result
+    return cartesian_to_dicom_array(pt_li, pat_orientation).tolist()
 
 
 #################################
@@ -608,11 +1262,96 @@ def add_section_with_image(document, image_files, square, first, description=[],
     sec.Add(imgtable)
 
 
+def render_dose_images(case, examination, dosearray, dose_grid, points, reference_dose=None, image_size=800,
+                       style='colorwash', orientations=None, fov=None, output_directory=None):
+    """Offline replacement for BeamSet.GetDoseImages for transversal images. Renders the supplied dose (e.g. the plan total dose,
+       so no dummy plan is needed for composite reports) on the examination CT with the case dose colour map and ROI contours.
+       Returns a list of image file names in the same order as points.
+
+       dosearray: DoseValues.DoseData of the dose to render.
+       dose_grid: The dose grid of dosearray, e.g. plan.GetTotalDoseGrid().
+       points: List of {'x','y','z'} dicts as used by GetDoseImages.
+       orientations: Orientation of each point as used by GetDoseImages. Defaults to all 'Transversal'.
+       fov: Field of view in cm, or a list with the field of view of each point. Defaults to the whole CT.
+       reference_dose: 100% level of the colour map. Defaults to the DoseColorMap ReferenceValue.
+       style: 'colorwash', 'isodose', 'both', or 'lines' for vector isodose lines over a 2x downsampled CT.
+       output_directory: Directory for the images, a new temporary directory by default. The caller removes it.
+       The CT is read through the xUWVolumeCache, so the pixel data is only transferred the first time an examination is rendered.
+       Only the visible ROIs' contours on the imaged slices are read."""
+    ct, ct_geometry = vc.get_ct_volume(examination, level=1 if style == 'lines' else 0)
+    dose_geometry = dr.dose_grid_geometry(dose_grid)
+    dose = dr.dose_volume(dosearray, dose_geometry)
+    levels = dr.colormap_levels(case.CaseSettings.DoseColorMap, reference_dose)
+    if orientations is None:
+        orientations = ['Transversal'] * len(points)
+    if not isinstance(fov, (list, tuple)):
+        fov = [fov] * len(points)
+    rois = dr.roi_contours(case, examination, z_ranges=dr.image_z_ranges(points, orientations, fov, ct_geometry))
+    if style == 'lines':
+        return dr.render_slices(ct, ct_geometry, dose, dose_geometry, levels, points, output_directory, size=image_size, style=style,
+                                rois=rois, orientations=orientations, fov=fov, ct_downsample=2,
+                                isodose_cache_directory=dr.user_cache_directory(dr.ISODOSE_CACHE_NAME))
+    return dr.render_slices(ct, ct_geometry, dose, dose_geometry, levels, points, output_directory, size=image_size, style=style,
+                            rois=rois, orientations=orientations, fov=fov)
+
+
+def hotspot_summary(dosearray, dose_grid, point, offsets=(-2, -1, -0.5, 0, 0.5, 1, 2)):
+    """Return (fov, description, data) for the max dose page: a tight field of view (cm) around the hotspot, and the dose profile through
+       point along each axis formatted for add_section_with_image()."""
+    geometry = dr.dose_grid_geometry(dose_grid)
+    dose = dr.dose_volume(dosearray, geometry)
+    centre, fov = dr.hotspot_fov(dose, geometry)
+    profile = dr.dose_profile(dose, geometry, (point['x'], point['y'], point['z']), offsets)
+    description = ['Hotspot (x, y, z)', 'Profile offsets (cm)', 'Dose along x (cGy)', 'Dose along y (cGy)', 'Dose along z (cGy)']
+    data = ['(%.1f, %.1f, %.1f) cm' % (point['x'], point['y'], point['z']), '  '.join('%g' % each for each in offsets)]
+    data += ['  '.join('%i' % round(each) for each in row) for row in profile]
+    return fov, description, data
+
+
+# Slice report orientations, in report order, and the point coordinate each one sweeps along.
+SWEEP_ORIENTATIONS = {'Transversal': 'z', 'Sagittal': 'x', 'Coronal': 'y'}
+
+
+def sweep_points(orientation, startstopfocus, slice_positions, spacing=0.5):
+    """Return the GetDoseImages points for one orientation of a slice report.
+
+       orientation: 'Transversal', 'Sagittal' or 'Coronal'.
+       startstopfocus: List of [start, stop, focus_1, focus_2] ranges along the sweep axis (z, x or y respectively). The focus values
+                       are the in-plane image centre: (x, y) for transversal, (y, z) for sagittal and (x, z) for coronal images.
+       slice_positions: CT slice z positions. Transversal images are taken on every slice inside a range.
+       spacing: Distance in cm between sagittal or coronal images."""
+    ranges = np.array(startstopfocus, dtype=float).reshape(-1, 4)
+    if orientation == 'Transversal':
+        positions = np.asarray(slice_positions, dtype=float)
+    else:
+        positions = np.unique(np.concatenate([np.arange(start, stop + 1e-6, spacing) for start, stop in ranges[:, :2]] + [[]]))
+    inside = (positions[:, None] >= ranges[:, 0]) & (positions[:, None] <= ranges[:, 1])
+    found = inside.any(axis=1)
+    index = inside.argmax(axis=1)[found]
+    result = []
+    for position, (f1, f2) in zip(positions[found].tolist(), ranges[index, 2:].tolist()):
+        if orientation == 'Transversal':
+            result.append({'x': f1, 'y': f2, 'z': position})
+        elif orientation == 'Sagittal':
+            result.append({'x': position, 'y': f1, 'z': f2})
+        else:
+            result.append({'x': f1, 'y': position, 'z': f2})
+    return result
+
+
 def find_closest_z(z_value, points):
     """Find the closest z value in points to the given z_value."""
     return min(points, key=lambda point: abs(point['z'] - z_value))
 
-def generate_slice_report(numcol = 1, printevery = 2, printreverse = True, startstopfocus = None, maxdose = None):
+def generate_slice_report(numcol = 1, printevery = 2, printreverse = True, startstopfocus = None, maxdose = None, offline_dose = None,
+                          offline_style = 'colorwash', sweep_spacing = 0.5, hotspot_dose = None):
+    """Generate and display a pdf slice report of the current beam set dose.
+       startstopfocus is a list of [start, stop, focus, focus] z ranges for a transversal report, or a dict with such a list for each
+       of the orientations in SWEEP_ORIENTATIONS (see sweep_points()). Sagittal and coronal images are spaced sweep_spacing cm apart.
+       If offline_dose = (dosearray, dose_grid) is supplied the images are rendered locally with render_dose_images() rather than
+       with BeamSet.GetDoseImages, using offline_style ('colorwash', 'isodose', 'both' or 'lines').
+       maxdose = [dose, x, y, z] adds a max dose page centred on the hotspot. If the dose is available (hotspot_dose = (dosearray, dose_grid),
+       or offline_dose) the page lists the dose profile through the hotspot, and offline images are zoomed in on the hotspot."""
     for each in dir(IO):
         print(each)
     print(help(IO))
@@ -632,14 +1371,11 @@ def generate_slice_report(numcol = 1, printevery = 2, printreverse = True, start
     examination = get_current("Examination")
     bs = get_current("BeamSet")
     
-    version = int(ui.GetApplicationVersion()[0])
-    
-    relative_slice_positions = examination.Series[0].ImageStack.SlicePositions
-    absolute_start_slice_position = examination.Series[0].ImageStack.Corner.z
+    reads = interop.prefetch({'version': lambda: ui.GetApplicationVersion(),
+                              'geometry': lambda: dr.image_stack_geometry(examination.Series[0].ImageStack)})
+    version = int(reads['version'][0])
     
-    absolute_slice_positions = []
-    for relative_slice_position in relative_slice_positions:
-        absolute_slice_positions.append(absolute_start_slice_position + relative_slice_position)
+    absolute_slice_positions = reads['geometry'].z.tolist()
     
     # establish start and stop z coordinates from POIs
     # alternatively start_z and stop_z could be taken from the isocenter.z plus minus some distance
@@ -696,85 +1432,106 @@ def generate_slice_report(numcol = 1, printevery = 2, printreverse = True, start
                     orientations.append("Transversal")
                     focus.append(True)
         print('CT Slices used for Report: ',len(points))
-   
+        sweeps = {'Transversal': points}
+
     else:
-        orientations = []
-        points = []
-        focus = []
+        if not isinstance(startstopfocus, dict):
+            startstopfocus = {'Transversal': startstopfocus}
         print('CT Slices: ',len(absolute_slice_positions))
-        for absolute_slice_position in absolute_slice_positions:
-            if True in [(absolute_slice_position >= each[0]) and (absolute_slice_position <= each[1]) for each in startstopfocus]:
-                index = [absolute_slice_position >= each[0] and absolute_slice_position <= each[1] for each in startstopfocus].index(True)
-                points.append({'x': startstopfocus[index][2], 'y': startstopfocus[index][3], 'z':absolute_slice_position})
-                orientations.append("Transversal")
-                focus.append(True)
-        print('CT Slices used for Report: ',len(points))
-            
-    
+        sweeps = {}
+        for orientation in SWEEP_ORIENTATIONS:
+            if orientation in startstopfocus:
+                sweeps[orientation] = sweep_points(orientation, startstopfocus[orientation], absolute_slice_positions,
+                                                   sweep_spacing)
+                print('%s images used for Report: ' % orientation, len(sweeps[orientation]))
+
+    # Only the printed images (every print_every-th position in print order) are requested.
+    for orientation, points in sweeps.items():
+        key = SWEEP_ORIENTATIONS[orientation]
+        unique = {point[key]: point for point in points}
+        sweeps[orientation] = [unique[each] for each in sorted(unique, reverse=printReversed)][::print_every]
+
+    # Max dose page. The hotspot image is centred on the maximum dose voxel and, when the dose is available, zoomed to a tight
+    # field of view around it with the surrounding dose profile listed above the image.
+    if maxdose is not None:
+        maxdose_point = {'x':maxdose[1],'y':maxdose[2],'z':maxdose[3]}
+        maxdose_fov, description, data = None, [], []
+        if hotspot_dose is None:
+            hotspot_dose = offline_dose
+        if hotspot_dose is not None:
+            maxdose_fov, description, data = hotspot_summary(hotspot_dose[0], hotspot_dose[1], maxdose_point)
+
+    # One image request per orientation (a single request for all images when rendering offline).
     print("Creating images")
-    GDIParams = {
-        "Orientations":orientations,
-        "Points":points,
-        "FocusOnIsocenter":focus,
-        "ImageSize":{'x': 800, 'y': 800},
-        "FocusOnRoi":None
-    }
-    #if version > 5:
-     #   GDIParams["FocusOnRoi"] = None
-    # images = dict( bs.GetDoseImages(**GDIParams) )
-    images = bs.GetDoseImages(**GDIParams) 
+    images = {}
+    if offline_dose is None:
+        for orientation, points in sweeps.items():
+            GDIParams = {
+                "Orientations":[orientation] * len(points),
+                "Points":points,
+                "FocusOnIsocenter":[True] * len(points),
+                "ImageSize":{'x': 800, 'y': 800},
+                "FocusOnRoi":None
+            }
+            #if version > 5:
+             #   GDIParams["FocusOnRoi"] = None
+            images[orientation] = list(bs.GetDoseImages(**GDIParams))
+        if maxdose is not None:
+            GDIParams = {
+                "Orientations":['Transversal'],
+                "Points":[maxdose_point],
+                "FocusOnIsocenter":[True],
+                "ImageSize":{'x':800,'y':800},
+                "FocusOnRoi":None}
+            images['MaxDose'] = list(bs.GetDoseImages(**GDIParams))
+    else:
+        requests = [(orientation, point, None) for orientation, points in sweeps.items() for point in points]
+        if maxdose is not None:
+            requests.append(('Transversal', maxdose_point, maxdose_fov))
+        render_directory = tempfile.mkdtemp(prefix='dose_slices_')
+        rendered = render_dose_images(get_current('Case'), examination, offline_dose[0], offline_dose[1],
+                                      [each[1] for each in requests], style=offline_style,
+                                      orientations=[each[0] for each in requests], fov=[each[2] for each in requests],
+                                      output_directory=render_directory)
+        index = 0
+        for orientation, points in sweeps.items():
+            images[orientation] = rendered[index:index + len(points)]
+            index += len(points)
+        if maxdose is not None:
+            images['MaxDose'] = rendered[index:]
     
     doc = create_doc()
-    # sorted_positions = []
-    # for image in images:
-    #     sorted_positions.append(image['z'])
-    # sorted_positions = sorted(sorted_positions, key=lambda i: i, reverse=printReversed)
-    
-    # Map z positions to image paths
-    z_to_image_path = {point['z']: img_path for point, img_path in zip(points, images)}
-
-    # Sort positions
-    
-    sorted_positions = [point['z'] for point in points]
-    sorted_positions = sorted(sorted_positions, reverse=printReversed)
-    
-    if maxdose is not None:
-        GDIParams = {
-            "Orientations":['Transversal'],
-            "Points":[{'x':maxdose[1],'y':maxdose[2],'z':maxdose[3]}],
-            "FocusOnIsocenter":[True],
-            "ImageSize":{'x':800,'y':800},
-            "FocusOnRoi":None}
-        maxdoseimage = bs.GetDoseImages(**GDIParams)
-        
-   
         
     print("Building report")
-    imagegroup = []
-    igindex = 0
-    totindex = 0
     first = True
     # Add images to the report
         
     if maxdose is not None:
-        closest_z = find_closest_z(maxdose[3], points)
-        closest_image_path = z_to_image_path[closest_z['z']]
-        add_section_with_image(doc, [closest_image_path], 1, True, title='Max Dose: %i cGy' % maxdose[0])
+        add_section_with_image(doc, images['MaxDose'], 1, True, description, data, title='Max Dose: %i cGy' % maxdose[0])
     
-    for position in sorted_positions:
-        image_path = z_to_image_path[position]
-        if totindex % print_every == 0:
+    for orientation, points in sweeps.items():
+        # Map sweep positions to image paths and sort positions
+        key = SWEEP_ORIENTATIONS[orientation]
+        position_to_image_path = {point[key]: img_path for point, img_path in zip(points, images[orientation])}
+        sorted_positions = sorted(position_to_image_path.keys(), reverse=printReversed)
+        title = None if list(sweeps.keys()) == ['Transversal'] else '%s images' % orientation
+
+        imagegroup = []
+        igindex = 0
+        for position in sorted_positions:
+            image_path = position_to_image_path[position]
             imagegroup.append(image_path)
             igindex += 1
             if igindex == numcol**2:
-                add_section_with_image(doc, imagegroup, numcol, first)
+                add_section_with_image(doc, imagegroup, numcol, first, title=title)
                 first = False
+                title = None
                 igindex = 0
                 imagegroup[:] = []
-        totindex += 1
-    
-    if imagegroup:
-        add_section_with_image(doc, imagegroup, numcol, first)
+
+        if imagegroup:
+            add_section_with_image(doc, imagegroup, numcol, first, title=title)
+            first = False
     
     print("Showing report")
     # note \\viptier1\radonc is mapped on most PCs as P:
@@ -825,13 +1582,13 @@ def generate_slice_report(numcol = 1, printevery = 2, printreverse = True, start
         print('Filename:', output_directory + '\\' + output_filename)
             
     print("Removing images")
-    for filename in images:
+    for filename in [each for image_list in images.values() for each in image_list]:
         try:
             IO.File.Delete(filename)
         except Exception as e:
             print(f'Could not delete image file {filename}. Error: {e}')
-
-
+    if offline_dose is not None:
+        shutil.rmtree(render_directory, ignore_errors=True)
 
 
 #####################
@@ -977,47 +1734,82 @@ def set_opt_parameters(plan=None, beam_set=None, MaxNumberOfIterations=80, Compu
         return None
 
 
-# def get_field_border_at_SAD(beam):
-#    """Not functioning yet."""
-#    orientation = beam.PatientPosition
-#    gantry_rot = beam.GantryAngle
-#    couch_rot = beam.CouchAngle
-#    coll_rot = beam.InitialCollimatorAngle
-#    segment = beam.Segments[0]
-#    top = segment.JawPositions[3]
-#    bottom = segment.JawPositions[2]
-#    leftbank = segment.LeafPositions[0]
-#    rightbank = segment.LeafPositions[1]
-#
-#    numleaves = leftbank.Count
-#    if numleaves == 80:
-#        start = -19.75
-#        step = 0.5
-#    else:
-#        start = -19.5
-#        step = 1
-#
-#    left_result,right_result = [],[]
-#    for i in range(numleaves):
-#        pos = start+step*i
-#        if bottom < pos < top:
-#            leftleaf = [leftbank[i],pos,0]
-#            rightleaf = [rightbank[i],pos,0]
-#            left_result.append(get_leaf_projection_at_iso(leftleaf,coll_rot,gantry_rot,couch_rot))
-#            right_result.append(get_leaf_projection_at_iso(rightleaf,coll_rot,gantry_rot,couch_rot))
-#            left_result = [cartesian_to_dicom(each,orientation) for each in left_result]
-#            right_result = [cartesian_to_dicom(each,orientation) for each in right_result]
-#    return left_result+right_result
-
-# def get_leaf_projection_at_iso(leaf_pos,coll_rot,gantry_rot,couch_rot):
-#    """NOT WORKING CORRECTLY YET.
-#       Find the projection of the leaf position, supplied as a two-entry list (x,y), in DICOM coordinates for the supplied machine parameters for a HFS patient.
-#       x and y are defined in Cartesian coordinates at SAD assuming no gantry/collimator/couch rotations. For IEC61217 this is equivalent to the x and y values reported by
-#       the machine for each leaf."""
-#    leaf_pos = rot_vect(leaf_pos,'z',coll_rot)
-#    leaf_pos = rot_vect(leaf_pos,'y',gantry_rot)
-#    leaf_pos = rot_vect(leaf_pos,'z',-1*couch_rot)
-#    return leaf_pos
+# Leaf widths (cm, at isocenter) by number of leaves per bank, listed from the Y1 (negative) side. 60 is a 120 leaf Millennium MLC.
+MLC_LEAF_WIDTHS = {40: [1.0] * 40, 60: [1.0] * 10 + [0.5] * 40 + [1.0] * 10, 80: [0.5] * 80}
+
+
+def leaf_centres(numleaves):
+    """Return the y positions (cm, at isocenter) of the leaf centres of an MLC bank with numleaves leaves, see MLC_LEAF_WIDTHS."""
+    widths = np.array(MLC_LEAF_WIDTHS[numleaves])
+    edges = np.concatenate(([0], np.cumsum(widths))) - widths.sum() / 2.
+    return (edges[:-1] + edges[1:]) / 2.
+
+
+def segment_gantry_angles(beam):
+    """Return the gantry angle of each segment of a beam. Arc segments use the accumulated DeltaGantryAngle of the preceding segments."""
+    segments = list(beam.Segments)
+    start = float(beam.GantryAngle)
+    try:
+        deltas = np.array([float(each.DeltaGantryAngle) for each in segments])
+    except Exception:
+        return np.full(len(segments), start)
+    direction = -1 if getattr(beam, 'ArcRotationDirection', 'Clockwise') == 'CounterClockwise' else 1
+    return (start + direction * np.concatenate(([0], np.cumsum(deltas)[:-1]))) % 360
+
+
+def project_field_borders(left, right, jaws, centres, coll_rot, gantry_rot, couch_rot, pat_orientation, isocenter=(0, 0, 0)):
+    """Project leaf tips and jaw corners at SAD into patient DICOM coordinates for any number of segments at once.
+
+       left, right: (S, L) arrays of bank positions for S segments of L leaves.
+       jaws: (S, 4) array of [x1, x2, y1, y2] jaw positions.
+       centres: (L,) leaf centre positions, see leaf_centres().
+       coll_rot, gantry_rot: Angles in degrees, scalars or (S,) arrays. couch_rot: Scalar in degrees.
+       Returns a dict of 'left' and 'right' (S, L, 3) leaf tips clipped to the jaws, 'jaws' (S, 4, 3) jaw corners, and 'open' (S, L) True for
+       leaves inside the jaws with a gap between the banks."""
+    left, right, jaws = [np.asarray(each, dtype=float) for each in (left, right, jaws)]
+    n, numleaves = left.shape
+    coll_rot, gantry_rot = [np.broadcast_to(np.asarray(each, dtype=float), (n,)) for each in (coll_rot, gantry_rot)]
+    y1, y2 = np.minimum(jaws[:, 2], jaws[:, 3]), np.maximum(jaws[:, 2], jaws[:, 3])
+    x1, x2 = np.minimum(jaws[:, 0], jaws[:, 1]), np.maximum(jaws[:, 0], jaws[:, 1])
+    inside = (centres > y1[:, None]) & (centres < y2[:, None])
+    left = np.clip(left, x1[:, None], x2[:, None])
+    right = np.clip(right, x1[:, None], x2[:, None])
+    y = np.broadcast_to(centres, (n, numleaves))
+
+    # Beam limiting device coordinates at SAD (z = 0), then collimator, gantry and couch rotations for each segment.
+    points = np.concatenate([np.stack([left, y, np.zeros_like(y)], axis=2), np.stack([right, y, np.zeros_like(y)], axis=2),
+                             np.stack([np.stack([x1, x2, x2, x1], axis=1), np.stack([y1, y1, y2, y2], axis=1), np.zeros((n, 4))],
+                                      axis=2)], axis=1)
+    c, s = np.cos(np.radians(coll_rot)), np.sin(np.radians(coll_rot))
+    g, h = np.cos(np.radians(gantry_rot)), np.sin(np.radians(gantry_rot))
+    zeros, ones = np.zeros(n), np.ones(n)
+    collimator = np.stack([np.stack([c, -1 * s, zeros], 1), np.stack([s, c, zeros], 1), np.stack([zeros, zeros, ones], 1)], 1)
+    gantry = np.stack([np.stack([g, zeros, h], 1), np.stack([zeros, ones, zeros], 1), np.stack([-1 * h, zeros, g], 1)], 1)
+    rotation = rotation_matrix('z', -1 * float(couch_rot)) @ gantry @ collimator
+    rotation = DICOM_TRANSFORMS.get(pat_orientation, np.eye(3)) @ rotation
+    points = np.einsum('sij,spj->spi', rotation, points) + np.asarray(isocenter, dtype=float)
+    return {'left': points[:, :numleaves], 'right': points[:, numleaves:2 * numleaves], 'jaws': points[:, 2 * numleaves:],
+            'open': inside & (right > left)}
+
+
+def get_field_border_at_SAD(beam, pat_orientation=None, centres=None):
+    """Project the leaf tips and jaw corners of every segment of a beam at SAD into patient DICOM coordinates, see project_field_borders().
+       The patient orientation defaults to beam.PatientPosition, and leaf centres to leaf_centres() for the number of leaves."""
+    segments = list(beam.Segments)
+    left = np.array([list(each.LeafPositions[0]) for each in segments], dtype=float)
+    right = np.array([list(each.LeafPositions[1]) for each in segments], dtype=float)
+    jaws = np.array([list(each.JawPositions) for each in segments], dtype=float)
+    coll_rot = np.array([float(getattr(each, 'CollimatorAngle', beam.InitialCollimatorAngle)) for each in segments])
+    position = beam.Isocenter.Position
+    return project_field_borders(left, right, jaws, leaf_centres(left.shape[1]) if centres is None else centres, coll_rot,
+                                 segment_gantry_angles(beam), beam.CouchAngle,
+                                 beam.PatientPosition if pat_orientation is None else pat_orientation,
+                                 (position.x, position.y, position.z))
+
+
+def get_field_borders(beam_set):
+    """Return {beam name: get_field_border_at_SAD(beam)} for all beams in a beam set."""
+    return {beam.Name: get_field_border_at_SAD(beam, beam_set.PatientPosition) for beam in beam_set.Beams}
 
 
 def external_contoured(case, exam):
@@ -1071,6 +1863,75 @@ def rename_exams(exams, popup=False, rename=True):
 # Plan Setup Scripts #
 ######################
 
+class CaseIndex(object):
+    """Approval and dose dependencies of a case, read once: approved ROI names per examination and over all examinations, and beam sets
+       with dose per examination. The index is not kept between calls, as the case can change (e.g. by approval) in between; build a new
+       one (or refresh() the CaseSnapshot holding it) after changing the case."""
+
+    def __init__(self, case):
+        self.approved_roi_names_by_exam = {}
+        for structure_set in case.PatientModel.StructureSets:
+            self.approved_roi_names_by_exam[structure_set.OnExamination.Name] = {
+                roi.OfRoi.Name for approved in structure_set.ApprovedStructureSets for roi in approved.ApprovedRoiStructures}
+        self.approved_roi_names = set().union(*self.approved_roi_names_by_exam.values())
+
+        self.beam_sets_with_dose_by_exam = {}
+        for plan in case.TreatmentPlans:
+            try:
+                exam_name = plan.TreatmentCourse.TotalDose.OnDensity.FromExamination.Name
+            except Exception:
+                continue  # No dose calculated for the plan.
+            for beam_set in plan.BeamSets:
+                if beam_set.FractionDose.DoseValues is not None:
+                    self.beam_sets_with_dose_by_exam.setdefault(exam_name, []).append(beam_set.DicomPlanLabel)
+
+    def approved_roi_names_on(self, exam_name):
+        return self.approved_roi_names_by_exam.get(exam_name, set())
+
+    def beam_sets_with_dose(self, exam_name):
+        return self.beam_sets_with_dose_by_exam.get(exam_name, [])
+
+
+RoiRecord = namedtuple('RoiRecord', ['name', 'type', 'organ_type', 'has_material', 'contoured', 'approved', 'approved_on_exam'])
+
+
+class CaseSnapshot(object):
+    """Read-only snapshot of the ROIs of a case for one examination, read in a single traversal. Records (RoiRecord) hold the ROI name, type,
+       organ type, whether it has a material override, whether it has contours on the examination, and whether it is approved on any
+       examination / on this examination (from the CaseIndex, kept in index). The Raystation ROI objects are kept in rois for writing. Call refresh() after changing the case."""
+
+    def __init__(self, case, examination):
+        self.case = case
+        self.examination = examination
+        self.refresh()
+
+    def refresh(self):
+        case, exam_name = self.case, self.examination.Name
+        self.index = CaseIndex(case)
+        self.approved_roi_names = self.index.approved_roi_names
+        self.approved_roi_names_on_exam = self.index.approved_roi_names_on(exam_name)
+        self.geometries = {each.OfRoi.Name: each for each in case.PatientModel.StructureSets[exam_name].RoiGeometries}
+        self.rois = {}
+        self.records = {}
+        for roi in case.PatientModel.RegionsOfInterest:
+            name = roi.Name
+            geometry = self.geometries.get(name)
+            self.rois[name] = roi
+            self.records[name] = RoiRecord(name, roi.Type, roi.OrganData.OrganType, roi.RoiMaterial is not None,
+                                           geometry is not None and geometry.HasContours(), name in self.approved_roi_names,
+                                           name in self.approved_roi_names_on_exam)
+        return self
+
+    def __iter__(self):
+        return iter(self.records.values())
+
+    def __contains__(self, name):
+        return name in self.records
+
+    def __getitem__(self, name):
+        return self.records[name]
+
+
 def import_couch_model(COCUH):
     """Imports selected couch model and moves it to the correct location.  Model is pruned to fit exam. Created by WL, March 2018 """
     patient = get_current("Patient")
@@ -1085,18 +1946,11 @@ def import_couch_model(COCUH):
                            'Varian IGRT': ["Varian IGRT Couch Exterior", "Varian IGRT Couch Interior"]}
 
     approved_plan = False
-    approved_roi_names = []
-    approved_plans = []
+    snapshot = CaseSnapshot(case, examination)
 
     # Create a list of approved ROIs on the current exam
-    try:
-        if case.PatientModel.StructureSets[examination.Name].ApprovedStructureSets.Count != 0:
-            for each in case.PatientModel.StructureSets[examination.Name].ApprovedStructureSets:
-                for approved_roi in each.ApprovedRoiStructures:
-                    approved_roi_names.append(approved_roi.OfRoi.Name)
-            print('Approved ROIS on this exam are: ' + approved_roi_names)
-    except:
-        print('Could not store approved ROI names')
+    approved_roi_names = sorted(snapshot.approved_roi_names_on_exam)
+    print('Approved ROIS on this exam are: ' + ', '.join(approved_roi_names))
 
     # If the couch model pieces on current exam are approved, set approved_plan to True
     if 'iBEAM evo Couch Core' in approved_roi_names:
@@ -1110,27 +1964,20 @@ def import_couch_model(COCUH):
     if 'Varian IGRT Couch Interior' in approved_roi_names:
         approved_plan = True
 
-    # If an approved plan exists on current exam, set approved_plan to True
-    for each in case.TreatmentPlans:
-        if each.Review == 'Approved':
-            approved_plans.append(each.Name)
-    if len(approved_plans) > 0:
-        approved_plan = True
-
-        # Create a list of Beam Sets with Dose calculated on the current exam
-    beamsets_with_dose = []
-    try:
-        for each in case.TreatmentPlans:
-            if each.TreatmentCourse.TotalDose.OnDensity.FromExamination.Name == examination.Name:
-                for each_set in each.BeamSets:
-                    if each_set.FractionDose.DoseValues != None:
-                        beamsets_with_dose.append(each_set.DicomPlanLabel)
-    except:
-        print('Could Not Determine Number of Beamsets with Dose')
+    # Beam Sets with Dose calculated on the current exam
+    beamsets_with_dose = snapshot.index.beam_sets_with_dose(examination.Name)
 
     # If an approved plan does not exist on the current exam and dose has not been calculated
     if not approved_plan and len(beamsets_with_dose) == 0:
 
+        # Independent examination reads, fetched while the existing couch geometry is deleted below
+        image_stack = examination.Series[0].ImageStack
+        reads = interop.prefetch({
+            'table_height': lambda: examination.GetStoredDicomTagValueForVerification(Group=0x0018, Element=0x1130),
+            'patient_position': (examination, 'PatientPosition'),
+            'bounding_box': lambda: [(each.x, each.y, each.z) for each in image_stack.GetBoundingBox()],
+            'corner': lambda: (image_stack.Corner.x, image_stack.Corner.y, image_stack.Corner.z)})
+
         # ---Initialize Couch Model ROI's by deleting them if present---#
         try:
             # Change View to Patient Modeling, Structure Definition
@@ -1139,46 +1986,14 @@ def import_couch_model(COCUH):
         except:
             print('Unable to change UI')
 
-        # If Couch Shell Geometry exists, delete it
-
-        try:
-            if patient.Cases[case.CaseName].PatientModel.StructureSets[examination.Name].RoiGeometries[
-                'iBEAM evo Couch Shell'].PrimaryShape != None:
-                case.PatientModel.StructureSets[examination.Name].RoiGeometries['iBEAM evo Couch Shell'].DeleteGeometry()
-        except:
-            print("Couch Shell Geometry Not Present or is Locked")
-
-        # If Couch Core Geometry exists, delete it
-        try:
-            if patient.Cases[case.CaseName].PatientModel.StructureSets[examination.Name].RoiGeometries[
-                'iBEAM evo Couch Core'].PrimaryShape != None:
-                case.PatientModel.StructureSets[examination.Name].RoiGeometries['iBEAM evo Couch Core'].DeleteGeometry()
-        except:
-            print("Couch Core Geometry Not Present or is Locked")
-
-        # If Qfix kVue Couch Geometry exists, delete it
-        try:
-            if patient.Cases[case.CaseName].PatientModel.StructureSets[examination.Name].RoiGeometries[
-                'Qfix kVue Couch'].PrimaryShape != None:
-                case.PatientModel.StructureSets[examination.Name].RoiGeometries['Qfix kVue Couch'].DeleteGeometry()
-        except:
-            print("Qfix kVue Couch Geometry Not Present or is Locked")
-            
-        # If Varian IGRT Couch Exterior Geometry exists, delete it
-        try:
-            if patient.Cases[case.CaseName].PatientModel.StructureSets[examination.Name].RoiGeometries[
-                    'Varian IGRT Couch Exterior'].PrimaryShape != None:
-                case.PatientModel.StructureSets[examination.Name].RoiGeometries['Varian IGRT Couch Exterior'].DeleteGeometry()
-        except:
-            print("Varian IGRT Couch Exterior Geometry Not Present or is Locked")
-
-         # If Varian IGRT Couch Exterior Geometry exists, delete it
-        try:
-            if patient.Cases[case.CaseName].PatientModel.StructureSets[examination.Name].RoiGeometries[
-                     'Varian IGRT Couch Interior'].PrimaryShape != None:
-                case.PatientModel.StructureSets[examination.Name].RoiGeometries['Varian IGRT Couch Interior'].DeleteGeometry()
-        except:
-            print("Varian IGRT Couch Interior Geometry Not Present or is Locked")
+        # If any couch model geometry exists, delete it
+        for roi in ['iBEAM evo Couch Shell', 'iBEAM evo Couch Core', 'Qfix kVue Couch', 'Varian IGRT Couch Exterior',
+                    'Varian IGRT Couch Interior']:
+            try:
+                if snapshot.geometries[roi].PrimaryShape != None:
+                    snapshot.geometries[roi].DeleteGeometry()
+            except:
+                print(roi + " Geometry Not Present or is Locked")
             
         # initialize table height
         th = None
@@ -1189,8 +2004,7 @@ def import_couch_model(COCUH):
 
         # Get Table Height from Dicom Header
         try:
-            th = case.Examinations[examination.Name].GetStoredDicomTagValueForVerification(Group=0x0018, Element=0x1130)
-            th = float(th.get('Table Height'))
+            th = float(reads['table_height'].get('Table Height'))
             print("Table Height is:", th)
         except:
             print("Could Not Get Table Height")
@@ -1203,8 +2017,7 @@ def import_couch_model(COCUH):
         if th is not None:
             # iBEAM evo was selected
             if COCUH == 'iBEAM evo':
-                if patient.Cases[case.CaseName].Examinations[examination.Name].PatientPosition == "HFS" or \
-                        patient.Cases[case.CaseName].Examinations[examination.Name].PatientPosition == "FFS":
+                if reads['patient_position'] in ("HFS", "FFS"):
                     template = patient_db.LoadTemplatePatientModel(templateName=couch_templates[COCUH], lockMode='Read')
                     case.PatientModel.CreateStructuresFromTemplate(SourceTemplate=template,
                                                                    SourceExaminationName="CT 1",
@@ -1243,8 +2056,7 @@ def import_couch_model(COCUH):
 
 
             elif COCUH == 'Varian IGRT':
-                if patient.Cases[case.CaseName].Examinations[examination.Name].PatientPosition == "HFS" or \
-                        patient.Cases[case.CaseName].Examinations[examination.Name].PatientPosition == "FFS":
+                if reads['patient_position'] in ("HFS", "FFS"):
                     template = patient_db.LoadTemplatePatientModel(templateName=couch_templates[COCUH], lockMode='Read')
                     case.PatientModel.CreateStructuresFromTemplate(SourceTemplate=template,
                                                                    SourceExaminationName="CT 1",
@@ -1281,8 +2093,7 @@ def import_couch_model(COCUH):
                         
             #Qfix kVue was selected
             else:
-                if patient.Cases[case.CaseName].Examinations[examination.Name].PatientPosition == "HFS" or \
-                        patient.Cases[case.CaseName].Examinations[examination.Name].PatientPosition == "FFS":
+                if reads['patient_position'] in ("HFS", "FFS"):
                     template = patient_db.LoadTemplatePatientModel(templateName="Qfix kVue", lockMode='Read')
                     case.PatientModel.CreateStructuresFromTemplate(SourceTemplate=template,
                                                                    SourceExaminationName="CT 1",
@@ -1317,46 +2128,39 @@ def import_couch_model(COCUH):
             print(y)
        
             # Define the transformation in x,y,z space to be performed
-            transform_matrix = {'M11': 1, 'M12': 0, 'M13': 0, 'M14': x,
-                                'M21': 0, 'M22': 1, 'M23': 0, 'M24': y,
-                                'M31': 0, 'M32': 0, 'M33': 1, 'M34': z,
-                                'M41': 0, 'M42': 0, 'M43': 0, 'M44': 1}
+            transform = Transform.translation(x, y, z)
 
             # Apply the transformation to AD couch model
             try:
-                for roi in couch_template_rois[COCUH]:
-                    patient.Cases[case.CaseName].PatientModel.RegionsOfInterest[roi].TransformROI3D(
-                        Examination=examination, TransformationMatrix=transform_matrix)
-
-            except:
-                print('Could not move the model')
+                transform_rois(case, examination, couch_template_rois[COCUH], transform)
+            except Exception as e:
+                print(f'Could not move the model. Error: {e}')
 
             # ---End Import---#
 
             # ---Prune the Couch Model so that it does not extend off examination---#
 
             # Create Bounding Box so CouchModel can be Pruned to Fit Dataset
-            ct_image_bounding_box = examination.Series[0].ImageStack.GetBoundingBox()
-            ct_sup = max([each.z for each in ct_image_bounding_box])
-            ct_inf = min([each.z for each in ct_image_bounding_box])
-            ct_left = max([each.x for each in ct_image_bounding_box])
-            ct_right = min([each.x for each in ct_image_bounding_box])
-            ct_ant = max([each.y for each in ct_image_bounding_box])
-            ct_post = min([each.y for each in ct_image_bounding_box])
+            ct_image_bounding_box = reads['bounding_box']
+            ct_sup = max([each[2] for each in ct_image_bounding_box])
+            ct_inf = min([each[2] for each in ct_image_bounding_box])
+            ct_left = max([each[0] for each in ct_image_bounding_box])
+            ct_right = min([each[0] for each in ct_image_bounding_box])
+            ct_ant = max([each[1] for each in ct_image_bounding_box])
+            ct_post = min([each[1] for each in ct_image_bounding_box])
             # Determine Size of Box
             control_box_size_x = abs(ct_left - ct_right)
             control_box_size_y = abs(ct_ant - ct_post)
             control_box_size_z = abs(ct_sup - ct_inf)
             control_box_size_xyz = {"x": control_box_size_x, "y": control_box_size_y, "z": control_box_size_z}
-            if patient.Cases[case.CaseName].Examinations[examination.Name].PatientPosition == "HFS" or \
-                    patient.Cases[case.CaseName].Examinations[examination.Name].PatientPosition == "FFS":
-                center_control_box = {"x": (control_box_size_x / 2) + examination.Series[0].ImageStack.Corner.x,
-                                      "y": (control_box_size_y / 2) + examination.Series[0].ImageStack.Corner.y, "z":
-                                          (control_box_size_z / 2) + examination.Series[0].ImageStack.Corner.z}
+            if reads['patient_position'] in ("HFS", "FFS"):
+                center_control_box = {"x": (control_box_size_x / 2) + reads['corner'][0],
+                                      "y": (control_box_size_y / 2) + reads['corner'][1], "z":
+                                          (control_box_size_z / 2) + reads['corner'][2]}
             else:
-                center_control_box = {"x": (control_box_size_x / 2) - examination.Series[0].ImageStack.Corner.x,
-                                      "y": (control_box_size_y / 2) - examination.Series[0].ImageStack.Corner.y, "z":
-                                          (control_box_size_z / 2) + examination.Series[0].ImageStack.Corner.z}
+                center_control_box = {"x": (control_box_size_x / 2) - reads['corner'][0],
+                                      "y": (control_box_size_y / 2) - reads['corner'][1], "z":
+                                          (control_box_size_z / 2) + reads['corner'][2]}
 
             # Create Control Box around Dataset
             with CompositeAction('Create Box ROI (control_box)'):
@@ -1444,108 +2248,64 @@ def ROI_setup():
     case = get_current("Case")
     examination = get_current("Examination")
 
-    name_check_gtv = ['GTV', 'gtv', 'Gtv', 'ITV', 'itv', 'Itv', 'iTV', 'GTV_ITV']
-    name_check_ctv = ['CTV', 'ctv', 'Ctv']
-    name_check_ptv = ['PTV', 'ptv', 'Ptv']
+    snapshot = CaseSnapshot(case, examination)
+    approved_roi_names = snapshot.approved_roi_names | {
+        'Liver-GTV'}  # Liver-GTV is assumed to be approved even if it is not.  Forces it to be an OAR
+    print(sorted(approved_roi_names))
+
+    writer = RoiWriter(case, patient)
+    for record in snapshot:
+        roi_type, organ_type = roi_setup_types(record.name, record.type, record.organ_type, record.has_material,
+                                               record.name in approved_roi_names)
+        writer.set(snapshot.rois[record.name], 'Type', roi_type, record.type)
+        writer.set(snapshot.rois[record.name], 'OrganData.OrganType', organ_type, record.organ_type)
+
+        # Turn visibility on if ROI has contours, or off if it does not.  This helps prevent a known bug in RS with ROI with empty geometry.  It's also just helpful to see which are empty.
+        if not record.contoured:
+            print(record.name + " Is EMPTY, turning visibility off")
+        else:
+            print(record.name + " is NOT empty, turning visibility on.")
+        writer.set(snapshot.rois[record.name], RoiWriter.VISIBILITY, record.contoured)
+
+    written, skipped = writer.apply('ROI setup')
+    print('ROI setup: %i writes, %i unchanged skipped, %i failed' % (written, skipped, len(writer.failed)))
+    for name, path, error in writer.failed:
+        if path == RoiWriter.VISIBILITY:
+            print('Could not change visibility of %s, ROI may have been a donut with a line' % name)
+        else:
+            print("Could not Set ROI Type for " + name)
 
-    approved_roi_names = [
-        'Liver-GTV']  # Liver-GTV is assumed to be approved even if it is not.  Forces it to be an OAR
 
-    # Create a list of all ROIs on all Exams that have been approved (regardless of whether it has contours)
-    try:
-        for each in case.PatientModel.StructureSets:
-            if each.ApprovedStructureSets.Count != 0:
-                for approved_ss in each.ApprovedStructureSets:
-                    for approved_roi in approved_ss.ApprovedRoiStructures:
-                        approved_roi_names.append(approved_roi.OfRoi.Name)
-            print(approved_roi_names)
-    except:
-        print('Could not store approved ROI names')
+ROI_SETUP_TYPES = {'Ptv': ('Ptv', 'Target'), 'Ctv': ('Ctv', 'Target'), 'Gtv': ('Gtv', 'Target')}
 
-    for each in case.PatientModel.RegionsOfInterest:
 
-        if each.Name == 'Liver-GTV':
-            try:
-                case.PatientModel.RegionsOfInterest[each.Name].OrganData.OrganType = "OrganAtRisk"
-                case.PatientModel.RegionsOfInterest[each.Name].Type = "Organ"
-            except:
-                print("Could not Set ROI Type for Liver-GTV")
-
-        for each_namecheck in name_check_gtv:
-            if each_namecheck in each.Name:
-                print(each.Name + " Is a GTV or ITV")
-                if each.Name not in approved_roi_names:  # check to see if ROI is not approved
-                    try:
-                        case.PatientModel.RegionsOfInterest[each.Name].Type = "Gtv"
-                        case.PatientModel.RegionsOfInterest[
-                            each.Name].OrganData.OrganType = "Target"
-                    except:
-                        print("Could not Set ROI Type for " + each.Name)
-        for each_namecheck in name_check_ctv:
-            if each_namecheck in each.Name:
-                print(each.Name + " Is a CTV")
-                if each.Name not in approved_roi_names:
-                    try:
-                        case.PatientModel.RegionsOfInterest[each.Name].Type = "Ctv"
-                        case.PatientModel.RegionsOfInterest[
-                            each.Name].OrganData.OrganType = "Target"
-                    except:
-                        print("Could not Set ROI Type for " + each.Name)
-        for each_namecheck in name_check_ptv:
-            if each_namecheck in each.Name:
-                print(each.Name + " Is a PTV")
-                if each.Name not in approved_roi_names:
-                    try:
-                        case.PatientModel.RegionsOfInterest[each.Name].Type = "Ptv"
-                        case.PatientModel.RegionsOfInterest[
-                            each.Name].OrganData.OrganType = "Target"
-                    except:
-                        print("Could not Set ROI Type for " + each.Name)
-
-        if case.PatientModel.RegionsOfInterest[
-            each.Name].Type == 'Support':  # If an ROI is a Support, set its type to Other
-            print(each.Name + " Is a Support, Organ Type set to Other")
-            if each.Name not in approved_roi_names:
-                case.PatientModel.RegionsOfInterest[each.Name].OrganData.OrganType = "Other"
-
-        elif case.PatientModel.RegionsOfInterest[
-            each.Name].OrganData.OrganType == "Target":  # If an ROI is already labelled as a Target, leave it alone
-            print(each.Name + " Is already a Target, nothing changed")
-
-        elif case.PatientModel.RegionsOfInterest[
-            each.Name].RoiMaterial is not None:  # If an ROI is overriden, set its type to Other
-            print(each.Name + " Has a denisty override, Organ Type set to Other")
-            if each.Name not in approved_roi_names:
-                try:
-                    case.PatientModel.RegionsOfInterest[each.Name].OrganData.OrganType = "Other"
-                except:
-                    print("Could not Set ROI Type for " + each.Name)
-
-        else:  # Set remaining Organ Types as OAR.  Note: External ROI type will remain External
-            if case.PatientModel.RegionsOfInterest[each.Name].Type != 'External':
-                print(each.Name + " Is an OAR")
-                if each.Name not in approved_roi_names:
-                    try:
-                        case.PatientModel.RegionsOfInterest[
-                            each.Name].OrganData.OrganType = "OrganAtRisk"
-                        case.PatientModel.RegionsOfInterest[each.Name].Type = "Organ"
-                    except:
-                        print("Could not Set ROI Type for " + each.Name)
-
-    for each in case.PatientModel.RegionsOfInterest:  # Turn visibility on if ROI has contours, or off if it does not.  This helps prevent a known bug in RS with ROI with empty geometry.  It's also just helpful to see which are empty.
-        if not case.PatientModel.StructureSets[examination.Name].RoiGeometries[
-            each.Name].HasContours():
-            print(each.Name + " Is EMPTY, turning visibility off")
-            try:
-                patient.SetRoiVisibility(RoiName=each.Name, IsVisible=False)
-            except:
-                print('Could not change visibility, ROI may have been a donut with a line')
-        else:
-            print(each.Name + " is NOT empty, turning visibility on.")
-            try:
-                patient.SetRoiVisibility(RoiName=each.Name, IsVisible=True)
-            except:
-                print('Could not change visibility, ROI may have been a donut with a line')
+def roi_setup_types(name, roi_type, organ_type, has_material, approved):
+    """Return the (Type, OrganType) ROI_setup() assigns to an ROI given its name, current Type and OrganType, whether it has a material override
+       and whether it is approved. PTV, CTV and GTV/ITV names (roi_classifier().name_class()) become targets, supports and overridden ROIs
+       organ type Other, and everything else except the External an OAR. Approved ROIs are not changed, except Liver-GTV which is always
+       an OAR."""
+    if name == 'Liver-GTV':
+        roi_type, organ_type = 'Organ', 'OrganAtRisk'
+    if approved:
+        return roi_type, organ_type
+
+    target = roi_classifier().name_class(name)
+    if target is not None:
+        print(name + ' Is a ' + {'Gtv': 'GTV or ITV'}.get(target, target.upper()))
+        roi_type, organ_type = ROI_SETUP_TYPES[target]
+
+    if roi_type == 'Support':  # If an ROI is a Support, set its type to Other
+        print(name + " Is a Support, Organ Type set to Other")
+        organ_type = 'Other'
+    elif organ_type == 'Target':  # If an ROI is already labelled as a Target, leave it alone
+        print(name + " Is already a Target, nothing changed")
+    elif has_material:  # If an ROI is overriden, set its type to Other
+        print(name + " Has a denisty override, Organ Type set to Other")
+        organ_type = 'Other'
+    elif roi_type != 'External':  # Set remaining Organ Types as OAR.  Note: External ROI type will remain External
+        print(name + " Is an OAR")
+        roi_type, organ_type = 'Organ', 'OrganAtRisk'
+    return roi_type, organ_type
 
 
 def create_external():
@@ -1554,41 +2314,14 @@ def create_external():
     case = get_current("Case")
     examination = get_current("Examination")
 
-    # Create a list of all ROIs on all Exams that have been approved (regardless of whether it has contours)
-    approved_roi_names = []
-
-    # Create a list of approved ROIs on the current exam
-    try:
-        if case.PatientModel.StructureSets[examination.Name].ApprovedStructureSets.Count != 0:
-            for each in case.PatientModel.StructureSets[examination.Name].ApprovedStructureSets:
-                for approved_roi in each.ApprovedRoiStructures:
-                    approved_roi_names.append(approved_roi.OfRoi.Name)
-            print('Approved ROIS on this exam are: ' + approved_roi_names)
-    except:
-        print('Could not store approved ROI names')
+    snapshot = CaseSnapshot(case, examination)
 
-    # Create a list of approved ROIs on the all exams
-    approved_roi_names_all_exams = []
-    try:
-        for each in case.PatientModel.StructureSets:
-            if each.ApprovedStructureSets.Count != 0:
-                for approved_ss in each.ApprovedStructureSets:
-                    for approved_roi in approved_ss.ApprovedRoiStructures:
-                        approved_roi_names_all_exams.append(approved_roi.OfRoi.Name)
-            print(approved_roi_names_all_exams)
-    except:
-        print('Could not store approved ROI names')
+    # Approved ROIs on the current exam, and on all exams (regardless of whether they have contours)
+    approved_roi_names = snapshot.approved_roi_names_on_exam
+    approved_roi_names_all_exams = snapshot.approved_roi_names
 
-    # Create a list of Beam Sets with Dose calculated on the current exam
-    beamsets_with_dose = []
-    try:
-        for each in case.TreatmentPlans:
-            if each.TreatmentCourse.TotalDose.OnDensity.FromExamination.Name == examination.Name:
-                for each_set in each.BeamSets:
-                    if each_set.FractionDose.DoseValues is not None:
-                        beamsets_with_dose.append(each_set.DicomPlanLabel)
-    except:
-        print('Could Not Determine Number of Beamsets with Dose')
+    # Beam Sets with Dose calculated on the current exam
+    beamsets_with_dose = snapshot.index.beam_sets_with_dose(examination.Name)
 
     # Create New External Geometry if External ROI is not locked and dose is not calculated on the current exam
     if 'External' not in approved_roi_names and len(beamsets_with_dose) == 0:
@@ -1597,17 +2330,16 @@ def create_external():
             patient.Cases[case.CaseName].PatientModel.StructureSets[examination.Name].RoiGeometries[
                 'External'].DeleteGeometry()
             print('External Geometry Was Deleted')
+            snapshot.refresh()
         except:
             print('Unable to delete External Geometry')
 
-    for each in case.PatientModel.RegionsOfInterest:
+    for each in snapshot:
         try:
-            if each.Name == 'External' and not \
-            case.PatientModel.StructureSets[examination.Name].RoiGeometries[
-                each.Name].HasContours():  # If the name External exists but there are no contours:
+            if each.name == 'External' and not each.contoured:  # If the name External exists but there are no contours:
                 print(
                     'ROI named External already exists but has no contours on current exam, create new External Geometry')
-                external = patient.Cases[case.CaseName].PatientModel.RegionsOfInterest['External']
+                external = snapshot.rois['External']
                 external.CreateExternalGeometry(Examination=examination,
                                                 ThresholdLevel=-250)  # Create New Geometry
                 case.PatientModel.StructureSets[examination.Name].SimplifyContours(
@@ -1619,10 +2351,8 @@ def create_external():
                     case.PatientModel.RegionsOfInterest['External'].Color = "Olive"
                 return
 
-            elif each.Type == 'External' and not \
-            case.PatientModel.StructureSets[examination.Name].RoiGeometries[
-                each.Name].HasContours():  # If the type External exists but there are no contours:
-                external = patient.Cases[case.CaseName].PatientModel.RegionsOfInterest[each.Name]
+            elif each.type == 'External' and not each.contoured:  # If the type External exists but there are no contours:
+                external = snapshot.rois[each.name]
                 external.CreateExternalGeometry(Examination=examination,
                                                 ThresholdLevel=-250)  # Create New Geometry
                 case.PatientModel.StructureSets[examination.Name].SimplifyContours(
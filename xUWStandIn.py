@@ -0,0 +1,918 @@
+# -------------------------------------------------------------------------------
+# Name:        StandIn (v1.00)
+#
+# Written for RS Version: 2023B
+#
+# Purpose:     Offline stand-in for the RayStation scripting interface, so the scripts can be run and benchmarked outside RayStation
+#              (e.g. on Linux). install() registers a 'connect' module whose get_current() returns synthetic Patient, Case, Examination,
+#              Plan, BeamSet, MachineDB, PatientDB and ui objects, with a configurable delay per scripting call.
+#
+# Note:        The synthetic patient is an elliptical water phantom CT with lungs and spine, contoured ROIs (ellipses on every slice),
+#              a Gaussian dose distribution around the PTV and a beam set with segmented (SMLC) or arc (DynamicArc) beams on a
+#              60 leaf pair MLC. The objects implement the attributes and methods used by these scripts; an attribute that is not
+#              implemented raises AttributeError as it would in RayStation. Methods that create geometry (CreateExternalGeometry,
+#              CreateBoxGeometry, CreateStructuresFromTemplate, CreateAlgebraGeometry) produce simple approximations, and algebra
+#              intersections are clipped to the bounding box of the second expression. GetDoseImages and SaveScreenShot write
+#              placeholder png files.
+#
+#              The objects returned by get_current() are wrapped in xUWInterop proxies, which call Latency.record() once per attribute
+#              read, attribute write, item access, iteration step and method call. The latency can be set per attribute or method name.
+#
+#              The .NET modules used by the scripts (clr, System, System.Windows.Forms, MigraDoc, PdfSharp) are replaced by placeholders
+#              that accept any attribute access and call and do nothing, except System.IO which uses the local file system. Drive letter
+#              paths (e.g. R:/) are not available.
+#
+#              python xUWStandIn.py "X - Dose Slice Report.py" --latency 0.002   runs a script against the stand-in and prints the timing.
+#              python xUWStandIn.py roi_setup                                   runs one of the BENCHMARKS.
+#              python xUWStandIn.py prefetch --latency 0.005                    compares serial and prefetched reads.
+#
+# Created:     19 October 2026 (v1.00)
+# -------------------------------------------------------------------------------
+
+import argparse
+import collections
+import contextlib
+import os
+import re
+import runpy
+import sys
+import tempfile
+import threading
+import time
+import types
+
+import numpy as np
+
+OUTPUT_DIRECTORY = os.path.join(tempfile.gettempdir(), 'xUW_standin')
+
+
+#########################
+#                       #
+#  Latency              #
+#                       #
+#########################
+
+
+class Latency(object):
+    """Delay and count of the stand-in scripting calls. default is the delay in seconds of every call; per_name overrides it by the last
+       part of the API path, e.g. {'GetDoseImages()': 0.5, 'PixelData': 0.2}. Used as the xUWInterop proxy tracer."""
+
+    def __init__(self, default=0.0, per_name=None):
+        self.default = default
+        self.per_name = dict(per_name or {})
+        self.calls = collections.Counter()
+        self.delay = 0.0
+        self.lock = threading.Lock()  # benchmark_prefetch() records from several threads
+
+    def record(self, path, seconds):
+        name = path.rsplit('.', 1)[-1]
+        wait = self.per_name.get(name, self.default)
+        with self.lock:
+            self.calls[name] += 1
+            self.delay += wait
+        if wait:
+            time.sleep(wait)
+
+    def total_calls(self):
+        return sum(self.calls.values())
+
+    def reset(self):
+        self.calls.clear()
+        self.delay = 0.0
+
+
+#########################
+#                       #
+#  Object Model         #
+#                       #
+#########################
+
+
+class Record(object):
+    """Plain stand-in object with the given attributes."""
+
+    def __init__(self, **attributes):
+        self.__dict__.update(attributes)
+
+    def __repr__(self):
+        return '%s(%s)' % (type(self).__name__, ', '.join('%s=%r' % each for each in sorted(self.__dict__.items())
+                                                         if not isinstance(each[1], (list, dict, Collection))))
+
+
+class Vector(Record):
+    def __init__(self, x=0., y=0., z=0.):
+        Record.__init__(self, x=float(x), y=float(y), z=float(z))
+
+
+class Color(Record):
+    NAMED = {'Red': (255, 0, 0), 'Green': (0, 128, 0), 'Blue': (0, 0, 255), 'Yellow': (255, 255, 0), 'Orange': (255, 165, 0),
+             'Olive': (128, 128, 0), 'Gray': (128, 128, 128), 'Magenta': (255, 0, 255), 'Cyan': (0, 255, 255)}
+
+    def __init__(self, r=255, g=255, b=255):
+        Record.__init__(self, R=r, G=g, B=b)
+
+    @classmethod
+    def named(cls, name):
+        if isinstance(name, Color):
+            return name
+        return cls(*cls.NAMED.get(str(name), (255, 255, 255)))
+
+
+class Collection(object):
+    """.NET collection stand-in: iterable, indexable by position or by name (the key attribute of its items), with Count."""
+
+    def __init__(self, items, key='Name'):
+        self._items = list(items)
+        self._key = key
+
+    def _name(self, item):
+        value = item
+        for each in self._key.split('.'):
+            value = getattr(value, each)
+        return value
+
+    def __getitem__(self, index):
+        if isinstance(index, str):
+            for item in self._items:
+                if self._name(item) == index:
+                    return item
+            raise KeyError(index)
+        return self._items[index]
+
+    def __iter__(self):
+        return iter(self._items)
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, item):
+        return item in self._items
+
+    @property
+    def Count(self):
+        return len(self._items)
+
+
+def ellipse(cx, cy, rx, ry, z, points=24):
+    """Closed contour of points Vectors of an ellipse on the slice at z."""
+    angles = np.linspace(0, 2 * np.pi, points, endpoint=False)
+    return [Vector(cx + rx * np.cos(a), cy + ry * np.sin(a), z) for a in angles]
+
+
+def rectangle(x1, x2, y1, y2, z):
+    return [Vector(x1, y1, z), Vector(x2, y1, z), Vector(x2, y2, z), Vector(x1, y2, z)]
+
+
+class Roi(Record):
+    def __init__(self, model, name, roi_type='Organ', organ_type='OrganAtRisk', color='Red'):
+        Record.__init__(self, Name=name, Type=roi_type, OrganData=Record(OrganType=organ_type), RoiMaterial=None,
+                        Color=Color.named(color), RoiVisualizationSettings=Record(IsVisible=True, ShowDRRContours=True,
+                                                                                 VisualizationMode2D='Contour',
+                                                                                 VisualizationMode3D='Shaded'))
+        self._model = model
+
+    def _geometry(self, examination):
+        return self._model.StructureSets[examination.Name]._geometries[self.Name]
+
+    def DeleteRoi(self):
+        self._model._delete_roi(self)
+
+    def CreateExternalGeometry(self, Examination, ThresholdLevel=-250):
+        self._geometry(Examination).contours = Examination._phantom.body_contours()
+
+    def CreateBoxGeometry(self, Size, Examination, Center, VoxelSize=None, Representation=None):
+        size, centre = Size, Center
+        z = [each for each in Examination._phantom.z if abs(each - centre['z']) <= size['z'] / 2.]
+        self._geometry(Examination).contours = [rectangle(centre['x'] - size['x'] / 2., centre['x'] + size['x'] / 2.,
+                                                          centre['y'] - size['y'] / 2., centre['y'] + size['y'] / 2., each)
+                                                for each in z]
+
+    def CreateAlgebraGeometry(self, Examination, ExpressionA, ExpressionB=None, ResultOperation='None', Algorithm='Auto',
+                              ResultMarginSettings=None):
+        structure_set = self._model.StructureSets[Examination.Name]
+        contours = [contour for name in ExpressionA['SourceRoiNames'] for contour in structure_set._geometries[name].contours]
+        b = [contour for name in (ExpressionB or {}).get('SourceRoiNames', []) for contour in structure_set._geometries[name].contours]
+        if ResultOperation == 'Intersection':
+            contours = clip_contours(contours, b)
+        elif ResultOperation == 'Union':
+            contours = contours + b
+        self._geometry(Examination).contours = [[Vector(p.x, p.y, p.z) for p in contour] for contour in contours]
+
+    def TransformROI3D(self, Examination, TransformationMatrix):
+        matrix = np.array([[TransformationMatrix['M%i%i' % (i + 1, j + 1)] for j in range(4)] for i in range(4)])
+        geometry = self._geometry(Examination)
+        moved = []
+        for contour in geometry.contours:
+            points = np.array([[p.x, p.y, p.z, 1.] for p in contour]) @ matrix.T
+            moved.append([Vector(*each[:3]) for each in points])
+        geometry.contours = moved
+
+
+def clip_contours(contours, bounds):
+    """Approximate intersection: the contours clipped to the bounding box of the contours in bounds."""
+    if not bounds:
+        return []
+    points = np.array([[p.x, p.y, p.z] for contour in bounds for p in contour])
+    low, high = points.min(axis=0), points.max(axis=0)
+    clipped = []
+    for contour in contours:
+        if not contour or not low[2] - 1e-6 <= contour[0].z <= high[2] + 1e-6:
+            continue
+        clipped.append([Vector(min(max(p.x, low[0]), high[0]), min(max(p.y, low[1]), high[1]), p.z) for p in contour])
+    return clipped
+
+
+class RoiGeometry(Record):
+    def __init__(self, roi, contours=None):
+        Record.__init__(self, OfRoi=roi)
+        self.contours = contours or []
+
+    @property
+    def PrimaryShape(self):
+        return Record(Contours=self.contours) if self.contours else None
+
+    def HasContours(self):
+        return len(self.contours) > 0
+
+    def DeleteGeometry(self):
+        self.contours = []
+
+    def _points(self):
+        if not self.contours:
+            raise ValueError('ROI %s has no geometry' % self.OfRoi.Name)
+        return np.array([[p.x, p.y, p.z] for contour in self.contours for p in contour])
+
+    def GetCenterOfRoi(self):
+        return Vector(*self._points().mean(axis=0))
+
+    def GetBoundingBox(self):
+        points = self._points()
+        return [Vector(*points.min(axis=0)), Vector(*points.max(axis=0))]
+
+    def GetRoiVolume(self):
+        areas = [0.5 * abs(sum(a.x * b.y - b.x * a.y for a, b in zip(contour, contour[1:] + contour[:1]))) for contour in self.contours]
+        z = sorted({contour[0].z for contour in self.contours})
+        thickness = np.median(np.diff(z)) if len(z) > 1 else 0.3
+        return sum(areas) * thickness
+
+
+class StructureSet(Record):
+    def __init__(self, model, examination):
+        Record.__init__(self, OnExamination=examination, ApprovedStructureSets=[], PoiGeometries=Collection([], 'OfPoi.Name'))
+        self._model = model
+        self._geometries = collections.OrderedDict()
+
+    @property
+    def RoiGeometries(self):
+        return Collection(self._geometries.values(), 'OfRoi.Name')
+
+    def SimplifyContours(self, RoiNames, **options):
+        pass
+
+    def approve(self, roi_names):
+        self.ApprovedStructureSets.append(Record(ApprovedRoiStructures=[Record(OfRoi=self._model.RegionsOfInterest[name])
+                                                                        for name in roi_names]))
+
+
+class PatientModel(Record):
+    def __init__(self):
+        Record.__init__(self)
+        self._rois = []
+        self._structure_sets = []
+
+    @property
+    def RegionsOfInterest(self):
+        return Collection(self._rois)
+
+    @property
+    def StructureSets(self):
+        return Collection(self._structure_sets, 'OnExamination.Name')
+
+    def add_examination(self, examination):
+        structure_set = StructureSet(self, examination)
+        for roi in self._rois:
+            structure_set._geometries[roi.Name] = RoiGeometry(roi)
+        self._structure_sets.append(structure_set)
+        return structure_set
+
+    def CreateRoi(self, Name, Color='Red', Type='Organ', TissueName=None, RbeCellTypeName=None, RoiMaterial=None):
+        if any(each.Name == Name for each in self._rois):
+            raise ValueError('An ROI named %s already exists' % Name)
+        organ_type = {'External': 'Other', 'Support': 'Other', 'Control': 'Other', 'Ptv': 'Target', 'Ctv': 'Target',
+                      'Gtv': 'Target'}.get(Type, 'OrganAtRisk')
+        roi = Roi(self, Name, Type, organ_type, Color)
+        self._rois.append(roi)
+        for structure_set in self._structure_sets:
+            structure_set._geometries[Name] = RoiGeometry(roi)
+        return roi
+
+    def _delete_roi(self, roi):
+        self._rois.remove(roi)
+        for structure_set in self._structure_sets:
+            structure_set._geometries.pop(roi.Name, None)
+
+    def CreateStructuresFromTemplate(self, SourceTemplate, SourceExaminationName, SourceRoiNames, SourcePoiNames=(),
+                                     AssociateStructuresByName=True, TargetExamination=None, InitializationOption=None):
+        """Couch templates: each ROI is a 50 cm wide slab over the whole examination, 3 cm thick, stacked below the image centre."""
+        phantom = TargetExamination._phantom
+        for index, name in enumerate(SourceRoiNames):
+            if not any(each.Name == name for each in self._rois):
+                self.CreateRoi(Name=name, Color='Gray', Type='Support')
+            y = index * 3.
+            self.StructureSets[TargetExamination.Name]._geometries[name].contours = [rectangle(-25., 25., y, y + 3., z)
+                                                                                     for z in phantom.z]
+
+
+class Phantom(object):
+    """Elliptical water phantom: body (HU 0), two lungs (-800), spine (800). Coordinates in cm, centred on x = y = 0."""
+
+    def __init__(self, size=128, slices=80, pixel=0.4, thickness=0.3):
+        self.size, self.pixel = size, pixel
+        self.corner = Vector(-size * pixel / 2., -size * pixel / 2., -slices * thickness / 2.)
+        self.z = (self.corner.z + thickness * np.arange(slices)).tolist()
+        self.body = (0., 0., 18., 12.)
+        self.lungs = [(-7., -2., 5., 6.), (7., -2., 5., 6.)]
+        self.spine = (0., 8., 1.5, 1.5)
+
+    def hu(self):
+        x = self.corner.x + self.pixel * np.arange(self.size)
+        yy, xx = np.meshgrid(x, x, indexing='ij')
+        inside = lambda cx, cy, rx, ry: ((xx - cx) / rx) ** 2 + ((yy - cy) / ry) ** 2 <= 1
+        plane = np.full((self.size, self.size), -1000, dtype=np.int16)
+        plane[inside(*self.body)] = 0
+        for lung in self.lungs:
+            plane[inside(*lung)] = -800
+        plane[inside(*self.spine)] = 800
+        return np.repeat(plane[None], len(self.z), axis=0)
+
+    def body_contours(self):
+        return [ellipse(*self.body, z=z, points=48) for z in self.z]
+
+
+class ImageStack(Record):
+    def __init__(self, phantom):
+        Record.__init__(self, Corner=phantom.corner, PixelSize=Vector(phantom.pixel, phantom.pixel, 0),
+                        NrPixels=Vector(phantom.size, phantom.size, 0), SlicePositions=[z - phantom.z[0] for z in phantom.z],
+                        ConversionParameters=Record(RescaleSlope=1., RescaleIntercept=-1024.))
+        self._phantom = phantom
+        self._pixel_data = None
+
+    @property
+    def PixelData(self):
+        if self._pixel_data is None:
+            self._pixel_data = (self._phantom.hu().astype(np.int32) + 1024).astype('<u2').tobytes()
+        return self._pixel_data
+
+    def GetBoundingBox(self):
+        extent = self._phantom.size * self._phantom.pixel
+        return [Vector(self.Corner.x, self.Corner.y, self._phantom.z[0]),
+                Vector(self.Corner.x + extent, self.Corner.y + extent, self._phantom.z[-1])]
+
+
+class Examination(Record):
+    def __init__(self, name, phantom, patient_position='HFS', table_height=150.):
+        Record.__init__(self, Name=name, PatientPosition=patient_position, Series=[Record(ImageStack=ImageStack(phantom))],
+                        EquipmentInfo=Record(Modality='CT'))
+        self._phantom = phantom
+        self._table_height = table_height
+
+    def GetAcquisitionDataFromDicom(self):
+        return {'SeriesModule': {'SeriesInstanceUID': '1.2.826.0.1.3680043.2.1125.%i' % abs(hash(self.Name) % 10 ** 8)}}
+
+    def GetStoredDicomTagValueForVerification(self, Group, Element):
+        if (Group, Element) == (0x0018, 0x1130):
+            return {'Table Height': '%g' % self._table_height}
+        return {}
+
+
+class DoseGrid(Record):
+    def __init__(self, corner, voxel_size, voxels):
+        Record.__init__(self, Corner=Vector(*corner), VoxelSize=Vector(*voxel_size), NrVoxels=Vector(*voxels))
+        for axis in 'xyz':
+            setattr(self.NrVoxels, axis, int(getattr(self.NrVoxels, axis)))
+
+
+def gaussian_dose(grid, centre, prescription=6000., sigma=2.5):
+    """Flat [z, y, x] dose array of a Gaussian distribution at centre, the maximum at 107% of the prescription."""
+    axes = [grid.Corner.__dict__[axis] + grid.VoxelSize.__dict__[axis] * (np.arange(grid.NrVoxels.__dict__[axis]) + 0.5)
+            for axis in 'zyx']
+    zz, yy, xx = np.meshgrid(*axes, indexing='ij')
+    r2 = (xx - centre[0]) ** 2 + (yy - centre[1]) ** 2 + (zz - centre[2]) ** 2
+    return (1.07 * prescription * np.exp(-r2 / (2 * sigma ** 2))).ravel()
+
+
+class Dose(Record):
+    def __init__(self, grid, data, examination, label):
+        Record.__init__(self, InDoseGrid=grid, DoseValues=None if data is None else Record(DoseData=data),
+                        OnDensity=Record(FromExamination=examination), OnStructureSet=Record(DicomPlanLabel=label))
+
+    def SetDoseValues(self, Dose, CalculationInfo=None):
+        self.DoseValues = Record(DoseData=np.asarray(Dose, dtype=float))
+
+
+def segments(numleaves, technique, count, field=4., seed=0):
+    """Synthetic MLC segments: a field x field cm aperture with random leaf offsets."""
+    random = np.random.RandomState(seed)
+    result = []
+    for index in range(count):
+        bank0 = np.full(numleaves, -field / 2.) + random.uniform(-1, 1, numleaves)
+        bank1 = np.full(numleaves, field / 2.) + random.uniform(-1, 1, numleaves)
+        bank0[:numleaves // 2 - 6], bank1[:numleaves // 2 - 6] = -0.1, 0.1
+        bank0[numleaves // 2 + 6:], bank1[numleaves // 2 + 6:] = -0.1, 0.1
+        result.append(Record(LeafPositions=[bank0.tolist(), np.maximum(bank1, bank0 + 0.1).tolist()],
+                             JawPositions=[-field / 2. - 1, field / 2. + 1, -field / 2. - 1, field / 2. + 1],
+                             RelativeWeight=1. / count, DoseRate=600. if technique == 'DynamicArc' else 1.,
+                             DeltaGantryAngle=4. if technique == 'DynamicArc' else 0., CollimatorAngle=0.))
+    return result
+
+
+class Beam(Record):
+    pass
+
+
+class BeamSet(Record):
+    def __init__(self, plan, label, examination, beams, dose, machine='Synthetic Linac', technique='SMLC'):
+        Record.__init__(self, DicomPlanLabel=label, Beams=Collection(beams), FractionDose=dose, Modality='Photons',
+                        MachineReference=Record(MachineName=machine), PatientPosition='HeadFirstSupine', DeliveryTechnique=technique,
+                        PlanGenerationTechnique='Imrt', Review=None, NumberOfFractions=30,
+                        PatientSetup=Record(OfTreatmentSetup=Record(GetPlanningExamination=lambda: examination)))
+        self._plan = plan
+
+    def GetTreatmentTechniqueType(self):
+        return 'VMAT' if self.DeliveryTechnique == 'DynamicArc' else 'SMLC'
+
+    def EditShowBeamVisualization(self, **options):
+        pass
+
+    def UpdateDoseGrid(self, Corner, VoxelSize, NumberOfVoxels):
+        self.FractionDose.InDoseGrid = DoseGrid([Corner[a] for a in 'xyz'], [VoxelSize[a] for a in 'xyz'],
+                                                [NumberOfVoxels[a] for a in 'xyz'])
+
+    def GetDoseImages(self, Orientations, Points, FocusOnIsocenter=None, ImageSize=None, FocusOnRoi=None):
+        """Placeholder images: one small grey png per point."""
+        import xUWDoseRendering as dr
+        if not os.path.exists(OUTPUT_DIRECTORY):
+            os.makedirs(OUTPUT_DIRECTORY)
+        image = np.full((8, 8, 3), 128, dtype=np.uint8)
+        names = []
+        for index, (orientation, point) in enumerate(zip(Orientations, Points)):
+            names.append(os.path.join(OUTPUT_DIRECTORY, '%s_%s_%i.png' % (self.DicomPlanLabel, orientation, index)))
+            dr.write_png(names[-1], image)
+        return names
+
+
+class Plan(Record):
+    def __init__(self, case, name, examination):
+        Record.__init__(self, Name=name, Review=None, PlannedBy='', PlanOptimizations=[],
+                        TreatmentCourse=Record(TotalDose=None))
+        self._case = case
+        self._examination = examination
+        self._beam_sets = []
+
+    @property
+    def BeamSets(self):
+        return Collection(self._beam_sets, 'DicomPlanLabel')
+
+    def GetTotalDoseGrid(self):
+        return self.TreatmentCourse.TotalDose.InDoseGrid
+
+    def SetCurrent(self):
+        self._case._session.current['Plan'] = self
+        if self._beam_sets:
+            self._case._session.current['BeamSet'] = self._beam_sets[0]
+
+    def AddNewBeamSet(self, Name, ExaminationName, MachineName, Modality='Photons', TreatmentTechnique='SMLC',
+                      PatientPosition='HeadFirstSupine', NumberOfFractions=1, CreateSetupBeams=False,
+                      UseLocalizationPointAsSetupIsocenter=False, Comment=''):
+        examination = self._case.Examinations[ExaminationName]
+        beam_set = BeamSet(self, Name, examination, [], Dose(None, None, examination, Name), MachineName,
+                           'DynamicArc' if TreatmentTechnique == 'VMAT' else TreatmentTechnique)
+        beam_set.NumberOfFractions = NumberOfFractions
+        self._beam_sets.append(beam_set)
+        return beam_set
+
+
+class Case(Record):
+    def __init__(self, session, name):
+        Record.__init__(self, CaseName=name, PatientModel=PatientModel(), CaseSettings=Record(DoseColorMap=Record(
+            ReferenceValue=6000., ColorMapReferenceType='ReferenceValue',
+            ColorTable={30: Color(0, 0, 255), 50: Color(0, 255, 255), 80: Color(0, 255, 0), 95: Color(255, 255, 0),
+                        100: Color(255, 165, 0), 105: Color(255, 0, 0)})))
+        self._session = session
+        self._examinations = []
+        self._plans = []
+        self.visibility = {}
+
+    @property
+    def Examinations(self):
+        return Collection(self._examinations)
+
+    @property
+    def TreatmentPlans(self):
+        return Collection(self._plans)
+
+    def SetRoiVisibility(self, RoiName, View=None, Visible=True):
+        self.visibility[(RoiName, View)] = Visible
+
+    def SetDoseVisibility(self, DoseName, View=None, Visible=True):
+        self.visibility[('dose:' + DoseName, View)] = Visible
+
+    def AddNewPlan(self, PlanName, PlannedBy='', Comment='', ExaminationName=None, AllowDuplicateNames=False):
+        if not AllowDuplicateNames and any(each.Name == PlanName for each in self._plans):
+            raise ValueError('A plan named %s already exists' % PlanName)
+        plan = Plan(self, PlanName, self.Examinations[ExaminationName])
+        plan.PlannedBy = PlannedBy
+        self._plans.append(plan)
+        return plan
+
+
+class Patient(Record):
+    def __init__(self, name='Stand-in^Patient', patient_id='STANDIN001'):
+        Record.__init__(self, Name=name, PatientName=name, PatientID=patient_id)
+        self._cases = []
+        self.saves = 0
+
+    @property
+    def Cases(self):
+        return Collection(self._cases, 'CaseName')
+
+    def Save(self):
+        self.saves += 1
+
+    def SetRoiVisibility(self, RoiName, IsVisible):
+        for case in self._cases:
+            for roi in case.PatientModel._rois:
+                if roi.Name == RoiName:
+                    roi.RoiVisualizationSettings.IsVisible = IsVisible
+
+
+class MachineDB(Record):
+    def __init__(self, numleaves=60):
+        widths = [1.0] * 10 + [0.5] * 40 + [1.0] * 10 if numleaves == 60 else [0.5] * numleaves
+        wedge = Record(WedgeModulationParametersX=[0., 0.01], WedgeModulationParametersY=[0., 0.015])
+        self._machine = Record(
+            Name='Synthetic Linac',
+            PhotonBeamQualities=[Record(NominalEnergy=energy, DoseRates=[100., 300., 600.],
+                                        BeamModels=[Record(BeamModel=Record(MotorizedWedgeParameters=wedge))]) for energy in (6, 10)],
+            Physics=Record(MlcPhysics=Record(UpperLayer=Record(LeafWidths=widths), MaxLeafSpeed=2.5),
+                           GantryPhysics=Record(MaxGantryAngleSpeed=6.), CollimatorPhysics=Record(MaxCollimatorAngleSpeed=15.)))
+        Record.__init__(self)
+
+    def QueryCommissionedMachineInfo(self, Filter=None):
+        return [{'Name': self._machine.Name, 'CommissionTime': '2026-01-01 00:00:00'}]
+
+    def GetTreatmentMachine(self, machineName, lockMode=None):
+        if machineName != self._machine.Name:
+            raise ValueError('Unknown machine %s' % machineName)
+        return self._machine
+
+
+class PatientDB(Record):
+    def LoadTemplatePatientModel(self, templateName, lockMode=None):
+        return Record(Name=templateName)
+
+
+class UiElement(object):
+    """Stand-in for the ui tree: any attribute or item is another UiElement, calls are recorded in the session ui_calls list.
+       SaveScreenShot / SaveScreenshot write a placeholder png to FilePath."""
+
+    def __init__(self, session, path='ui'):
+        self._session, self._path = session, path
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return UiElement(self._session, '%s.%s' % (self._path, name))
+
+    def __getitem__(self, key):
+        return UiElement(self._session, '%s[%r]' % (self._path, key))
+
+    def __call__(self, *args, **kwargs):
+        self._session.ui_calls.append(self._path)
+        name = self._path.rsplit('.', 1)[-1]
+        if name == 'GetApplicationVersion':
+            return '14.0.0.0'
+        if name in ('SaveScreenShot', 'SaveScreenshot'):
+            import xUWDoseRendering as dr
+            dr.write_png(kwargs.get('FilePath', args[0] if args else os.path.join(OUTPUT_DIRECTORY, 'screenshot.png')),
+                         np.full((8, 8, 3), 128, dtype=np.uint8))
+        return None
+
+
+#########################
+#                       #
+#  Synthetic Session    #
+#                       #
+#########################
+
+
+DEFAULT_ROIS = [('External', 'External', 'Other', 'Olive', None),
+                ('PTV_60', 'Ptv', 'Target', 'Red', (0., 0., 0., 3., 3.)),
+                ('CTV_60', 'Ctv', 'Target', 'Magenta', (0., 0., 0., 2.2, 2.2)),
+                ('GTV', 'Gtv', 'Target', 'Yellow', (0., 0., 0., 1.5, 1.5)),
+                ('Lung_L', 'Organ', 'OrganAtRisk', 'Cyan', (7., -2., 0., 5., 6.)),
+                ('Lung_R', 'Organ', 'OrganAtRisk', 'Cyan', (-7., -2., 0., 5., 6.)),
+                ('SpinalCord', 'Organ', 'OrganAtRisk', 'Yellow', (0., 8., 0., 1., 1.)),
+                ('Heart', 'Organ', 'OrganAtRisk', 'Red', (3., -5., 2., 4., 3.5))]
+
+
+class Session(object):
+    """A synthetic patient and the current objects returned by get_current(). rois ROIs (the DEFAULT_ROIS, then small spherical OARs),
+       beams beams of technique ('SMLC' or 'DynamicArc') and a plan dose on the examination unless dose is False."""
+
+    def __init__(self, rois=40, beams=5, technique='SMLC', segments_per_beam=10, ct_size=128, slices=80, numleaves=60,
+                 approved_rois=(), patient_position='HFS', dose=True, seed=0):
+        self.ui_calls = []
+        self.phantom = Phantom(ct_size, slices)
+        self.patient = Patient()
+        case = Case(self, 'Case 1')
+        self.patient._cases.append(case)
+        examination = Examination('CT 1', self.phantom, patient_position)
+        case._examinations.append(examination)
+        model = case.PatientModel
+        for name, roi_type, organ_type, color, shape in DEFAULT_ROIS[:rois]:
+            model.CreateRoi(Name=name, Color=color, Type=roi_type).OrganData.OrganType = organ_type
+        random = np.random.RandomState(seed)
+        for index in range(max(0, rois - len(DEFAULT_ROIS))):
+            model.CreateRoi(Name='OAR_%03i' % index, Color='Green', Type='Organ')
+        structure_set = model.add_examination(examination)
+        for name, geometry in structure_set._geometries.items():
+            shape = dict((each[0], each[4]) for each in DEFAULT_ROIS).get(name)
+            if name == 'External':
+                geometry.contours = self.phantom.body_contours()
+                continue
+            if shape is None:
+                shape = tuple(random.uniform(-8, 8, 3)) + tuple(random.uniform(0.5, 2, 2))
+            cx, cy, cz, rx, ry = shape
+            geometry.contours = [ellipse(cx, cy, rx * np.sqrt(1 - ((z - cz) / max(rx, ry)) ** 2),
+                                         ry * np.sqrt(1 - ((z - cz) / max(rx, ry)) ** 2), z)
+                                 for z in self.phantom.z if abs(z - cz) < max(rx, ry)]
+        if approved_rois:
+            structure_set.approve(approved_rois)
+
+        plan = Plan(case, 'Plan 1', examination)
+        case._plans.append(plan)
+        grid = DoseGrid((-12., -10., self.phantom.z[0]), (0.3, 0.3, 0.3), (80, 70, len(self.phantom.z)))
+        dose = gaussian_dose(grid, (0., 0., 0.)) if dose else None
+        plan.TreatmentCourse.TotalDose = Dose(grid, dose, examination, 'BS1')
+        beam_list = []
+        for number in range(beams):
+            gantry = (181. + 358. / max(beams, 1) * number) % 360 if technique == 'DynamicArc' else (360. / beams * number) % 360
+            count = 90 if technique == 'DynamicArc' else segments_per_beam
+            beam_list.append(Beam(Name=str(number + 1), Number=number + 1, GantryAngle=gantry,
+                                  ArcStopGantryAngle=(gantry + 358.) % 360 if technique == 'DynamicArc' else None,
+                                  ArcRotationDirection='Clockwise' if technique == 'DynamicArc' else 'None',
+                                  CouchAngle=0., CouchRotationAngle=0., InitialCollimatorAngle=0., BeamMU=150. + 10 * number,
+                                  DeliveryTechnique=technique, Description='',
+                                  MachineReference=Record(MachineName='Synthetic Linac', Energy=6),
+                                  Isocenter=Record(Position=Vector(0., 0., 0.), Annotation=Record(Name='Iso')),
+                                  Wedge=None, PatientPosition='HeadFirstSupine',
+                                  Segments=segments(numleaves, technique, count, seed=seed + number)))
+        beam_set = BeamSet(plan, 'BS1', examination, beam_list, Dose(grid, None if dose is None else dose / 30., examination, 'BS1'),
+                           technique=technique)
+        plan._beam_sets.append(beam_set)
+
+        self.current = {'Patient': self.patient, 'Case': case, 'Examination': examination, 'Plan': plan, 'BeamSet': beam_set,
+                        'MachineDB': MachineDB(numleaves), 'PatientDB': PatientDB(), 'ui': UiElement(self)}
+
+    def get(self, name):
+        try:
+            return self.current[name]
+        except KeyError:
+            raise LookupError('No %s is loaded in the stand-in' % name)
+
+
+#########################
+#                       #
+#  Installation         #
+#                       #
+#########################
+
+
+class DotNetObject(object):
+    """Placeholder for .NET types and objects: accepts any attribute access, call, item access and event subscription."""
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return DotNetObject()
+
+    def __call__(self, *args, **kwargs):
+        return DotNetObject()
+
+    def __getitem__(self, key):
+        return DotNetObject()
+
+    def __iadd__(self, handler):
+        return self
+
+    def __iter__(self):
+        return iter([])
+
+
+class DotNetType(type):
+    """Metaclass of the placeholder .NET types, so static members (e.g. MessageBox.Show) are placeholders too."""
+
+    def __getattr__(cls, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return DotNetObject()
+
+
+class DotNetModule(types.ModuleType):
+    """Placeholder .NET namespace. Every attribute is a subclassable DotNetObject type."""
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        value = DotNetType(name, (DotNetObject,), {})
+        setattr(self, name, value)
+        return value
+
+
+def _local_path(filename):
+    filename = str(filename)
+    if re.match(r'^[A-Za-z]:', filename):
+        raise IOError('Drive paths are not available in the stand-in: ' + filename)
+    return filename.replace('\\', os.sep)
+
+
+def _system_io():
+    """System.IO on the local file system."""
+    io = types.SimpleNamespace()
+    io.Path = types.SimpleNamespace(GetDirectoryName=lambda x: os.path.dirname(os.path.abspath(str(x))),
+                                    Combine=lambda *x: os.path.join(*[str(each) for each in x]))
+    io.Directory = types.SimpleNamespace(Exists=lambda x: os.path.isdir(_local_path(x)),
+                                         CreateDirectory=lambda x: os.makedirs(_local_path(x), exist_ok=True))
+    io.File = types.SimpleNamespace(Exists=lambda x: os.path.isfile(_local_path(x)),
+                                    Delete=lambda x: os.remove(_local_path(x)) if os.path.isfile(_local_path(x)) else None)
+    return io
+
+
+DOTNET_MODULES = ['clr', 'System', 'System.Windows', 'System.Windows.Forms', 'System.Drawing', 'MigraDoc',
+                  'MigraDoc.DocumentObjectModel', 'MigraDoc.DocumentObjectModel.Tables', 'MigraDoc.DocumentObjectModel.Shapes',
+                  'MigraDoc.Rendering', 'PdfSharp']
+
+_session = None
+_latency = None
+
+
+def get_current(name):
+    """connect.get_current of the stand-in: the named object of the installed Session, behind a latency proxy."""
+    import xUWInterop
+    return xUWInterop.wrap(_session.get(name), name, _latency)
+
+
+@contextlib.contextmanager
+def CompositeAction(description=''):
+    _latency.record('CompositeAction()', 0.)
+    yield
+
+
+def install(session=None, latency=0.0, per_name=None, dotnet=True):
+    """Register the stand-in 'connect' module (and the .NET placeholders if dotnet is True, and not running under .NET). Must be
+       called before the scripts are imported. Returns (session, latency)."""
+    global _session, _latency
+    _session = session or Session()
+    _latency = Latency(latency, per_name)
+    connect = types.ModuleType('connect')
+    connect.get_current, connect.CompositeAction = get_current, CompositeAction
+    connect.__all__ = ['get_current', 'CompositeAction']
+    sys.modules['connect'] = connect
+    if dotnet:
+        install_dotnet()
+    return _session, _latency
+
+
+def install_dotnet():
+    """Register the .NET placeholder modules, unless running under .NET."""
+    if 'clr' in sys.modules:
+        return
+    for name in DOTNET_MODULES:
+        sys.modules[name] = DotNetModule(name)
+    sys.modules['clr'].AddReference = lambda *x: None
+    sys.modules['System'].IO = _system_io()
+    for name in DOTNET_MODULES:
+        if '.' in name:
+            parent, child = name.rsplit('.', 1)
+            setattr(sys.modules[parent], child, sys.modules[name])
+
+
+#########################
+#                       #
+#  Benchmarks           #
+#                       #
+#########################
+
+
+def _script(filename):
+    return lambda: runpy.run_path(os.path.join(os.path.dirname(os.path.abspath(__file__)), filename), run_name='__main__')
+
+
+def _utility(function, *args):
+    def run():
+        import xUWScriptingUtilities as su
+        return getattr(su, function)(*args)
+    return run
+
+
+def _dose_report(offline):
+    """X - Dose Slice Report.py with OFFLINE_RENDERING set to offline."""
+    def run():
+        report = runpy.run_path(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'X - Dose Slice Report.py'), run_name='report')
+        report['run_dose_report'].__globals__['OFFLINE_RENDERING'] = offline
+        get_current = sys.modules['connect'].get_current
+        return report['run_dose_report'](get_current('Patient'), get_current('Case'), get_current('Plan'))
+    return run
+
+
+def _roi_visualization(chunk_size=None):
+    """The apply step of A2.py (Change ROI Visualization) without the form: every ROI hidden in outline mode."""
+    def run():
+        a2 = runpy.run_path(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'A2.py'), run_name='A2')
+        get_current = sys.modules['connect'].get_current
+        case, patient = get_current('Case'), get_current('Patient')
+        rois = a2['select_rois'](case.PatientModel.RegionsOfInterest, {'target': True, 'oar': True, 'support': True, 'other': True})
+        settings = a2['visualization_settings'](False, False, 'Outline', 'Wireframe')
+        return a2['update_visualization'](case, patient, rois, settings, chunk_size or a2['CHUNK_SIZE'])
+    return run
+
+
+# Benchmark name: (callable, Session options). Couch import and create_external are refused when the examination has dose.
+BENCHMARKS = {'dose_slice_report': (_script('X - Dose Slice Report.py'), {}),
+              'dose_slice_report_offline': (_dose_report(True), {}),
+              'roi_setup': (_utility('ROI_setup'), {}),
+              'create_external': (_utility('create_external'), {'dose': False}),
+              'couch_import': (_utility('import_couch_model', 'iBEAM evo'), {'dose': False}),
+              'screenshots': (_script('screenshots.py'), {}),
+              'roi_visualization': (_roi_visualization(), {})}
+
+
+def benchmark(run, repeat=1, quiet=True):
+    """Run a callable repeat times against the installed stand-in. Returns (wall times, scripting calls per run, total latency)."""
+    times = []
+    for index in range(repeat):
+        _latency.reset()
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(open(os.devnull, 'w')) if quiet else contextlib.nullcontext():
+            run()
+        times.append(time.perf_counter() - start)
+    return times, _latency.total_calls(), _latency.delay
+
+
+def benchmark_prefetch(workers=4, repeat=3):
+    """Time the independent reads at the start of the couch import and slice report (table height tag, patient position, approved
+       structure sets, plan doses, slice positions and dose grid) serially and through xUWInterop.prefetch(). Returns
+       {workers: best time}. Parallel reads are enabled for the comparison; the stand-in accepts concurrent calls."""
+    import xUWInterop as interop
+    parallel, interop.PARALLEL_READS = interop.PARALLEL_READS, True
+    examination, case, plan = get_current('Examination'), get_current('Case'), get_current('Plan')
+    reads = {'table_height': lambda: examination.GetStoredDicomTagValueForVerification(Group=0x0018, Element=0x1130),
+             'patient_position': (examination, 'PatientPosition'),
+             'approved': lambda: [len(each.ApprovedStructureSets) for each in case.PatientModel.StructureSets],
+             'plan_doses': lambda: [each.TreatmentCourse.TotalDose.DoseValues is not None for each in case.TreatmentPlans],
+             'slice_positions': (examination, 'Series.0.ImageStack.SlicePositions'),
+             'dose_grid': lambda: [(grid.Corner.x, grid.VoxelSize.x, grid.NrVoxels.x) for grid in [plan.GetTotalDoseGrid()]]}
+    results = {}
+    try:
+        for count in (1, workers):
+            times = []
+            for index in range(repeat):
+                start = time.perf_counter()
+                interop.prefetch(reads, count).wait()
+                times.append(time.perf_counter() - start)
+            results[count] = min(times)
+    finally:
+        interop.PARALLEL_READS = parallel
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run a script or benchmark against the offline RayStation stand-in.')
+    parser.add_argument('target', help='Script filename, prefetch, or one of: ' + ', '.join(sorted(BENCHMARKS)))
+    parser.add_argument('--latency', type=float, default=0.0, help='Delay per scripting call in seconds.')
+    parser.add_argument('--rois', type=int, default=40)
+    parser.add_argument('--beams', type=int, default=5)
+    parser.add_argument('--technique', default='SMLC', choices=['SMLC', 'DynamicArc'])
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--verbose', action='store_true', help='Show the script output.')
+    args = parser.parse_args(argv)
+    if args.target == 'prefetch':
+        install(Session(rois=args.rois, beams=args.beams, technique=args.technique), args.latency)
+        for workers, seconds in benchmark_prefetch().items():
+            print('prefetch, %i worker(s): %.3f s' % (workers, seconds))
+        return
+    run, options = BENCHMARKS.get(args.target) or ((lambda: runpy.run_path(args.target, run_name='__main__')), {})
+    install(Session(rois=args.rois, beams=args.beams, technique=args.technique, **options), args.latency)
+    times, calls, delay = benchmark(run, args.repeat, quiet=not args.verbose)
+    print('%s: %s s, %i scripting calls, %.2f s injected latency' % (args.target, ', '.join('%.3f' % each for each in times),
+                                                                       calls, delay))
+    for name, count in _latency.calls.most_common(10):
+        print('%8i  %s' % (count, name))
+
+
+if __name__ == '__main__':
+    main()
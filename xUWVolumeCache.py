@@ -0,0 +1,148 @@
+# -------------------------------------------------------------------------------
+# Name:        VolumeCache (v1.01)
+#
+# Written for RS Version: 2023B
+#
+# Purpose:     Caches CT image volumes on local disk so that the pixel data of an examination is pulled through the scripting
+#              interface once. Each volume is stored at full resolution and as 2x and 4x in-plane downsampled levels, and is
+#              returned as a read-only memory-mapped numpy array.
+#
+# Note:        Entries are keyed by the DICOM series instance UID and the image stack geometry, and the least recently used entries
+#              are removed once the cache exceeds its size limit. The cache holds patient images, so it is kept in a directory only
+#              the current user can write (xUWDoseRendering.user_cache_directory()). Like xUWDoseRendering this module only imports
+#              numpy and the standard library; RayStation objects are only accessed through their attributes.
+#
+#              Downsampling is in-plane only (2x2 / 4x4 block means) as CT slice spacing may be irregular. All levels are
+#              stored as int16 Hounsfield units, and are written into the memory-mapped files one slice at a time.
+#
+# Created:     19 October 2026 (v1.00)
+#
+# Updated:     19 October 2026 (v1.01) - Per-user cache directory. Levels are downsampled slice by slice into the memory-mapped files.
+# -------------------------------------------------------------------------------
+
+import hashlib
+import os
+
+import numpy as np
+
+import xUWDoseRendering as dr
+
+CACHE_NAME = 'ct_volume_cache'  # Subdirectory of the user cache directory, see xUWDoseRendering.user_cache_directory().
+MAX_CACHE_BYTES = 4 * 1024 ** 3
+LEVELS = [1, 2, 4]  # Downsampling factor of each pyramid level.
+
+
+def series_key(examination):
+    """Return the cache key of the image stack of an examination: a hash of the series instance UID (falling back to the
+       examination name) and the image stack geometry, so a re-imported or resampled series gets a new entry."""
+    try:
+        uid = examination.GetAcquisitionDataFromDicom()['SeriesModule']['SeriesInstanceUID']
+    except Exception:
+        uid = examination.Name
+    geometry = dr.image_stack_geometry(examination.Series[0].ImageStack)
+    params = (uid, geometry.x0, geometry.y0, geometry.dx, geometry.dy, geometry.nx, geometry.ny,
+              tuple(np.round(geometry.z, 4).tolist()))
+    return hashlib.sha1(repr(params).encode()).hexdigest()[:20], geometry
+
+
+def downsample(image, factor):
+    """Block mean of a [y, x] image (or [z, y, x] volume) over factor x factor pixels in-plane. Edge pixels that do not fill a block
+       are dropped."""
+    ny, nx = image.shape[-2] // factor * factor, image.shape[-1] // factor * factor
+    blocks = image[..., :ny, :nx].reshape(image.shape[:-2] + (ny // factor, factor, nx // factor, factor))
+    return np.round(blocks.mean(axis=(-3, -1), dtype=np.float32)).astype(np.int16)
+
+
+def level_geometry(geometry, factor):
+    """Return the VolumeGeometry of a volume downsampled in-plane by factor."""
+    return dr.VolumeGeometry(geometry.x0 + (factor - 1) * geometry.dx / 2., geometry.y0 + (factor - 1) * geometry.dy / 2.,
+                             geometry.dx * factor, geometry.dy * factor, geometry.nx // factor, geometry.ny // factor,
+                             geometry.z)
+
+
+class CTVolumeCache(object):
+    """Disk-backed, size-limited LRU cache of CT volume pyramids. Use get() to obtain (volume, geometry) for an examination."""
+
+    def __init__(self, directory=None, max_bytes=MAX_CACHE_BYTES):
+        self.directory = directory or dr.user_cache_directory(CACHE_NAME)
+        self.max_bytes = max_bytes
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+
+    def _filename(self, key, level):
+        return os.path.join(self.directory, '%s_L%i.npy' % (key, level))
+
+    def _entries(self):
+        """Return {key: (last access time, bytes)} for the complete entries on disk."""
+        entries = {}
+        for name in os.listdir(self.directory):
+            if not name.endswith('.npy'):
+                continue
+            key = name.rsplit('_L', 1)[0]
+            stat = os.stat(os.path.join(self.directory, name))
+            access, size = entries.get(key, (0, 0))
+            entries[key] = (max(access, stat.st_mtime), size + stat.st_size)
+        return entries
+
+    def contains(self, key):
+        return all(os.path.exists(self._filename(key, level)) for level in range(len(LEVELS)))
+
+    def _touch(self, key):
+        for level in range(len(LEVELS)):
+            os.utime(self._filename(key, level))
+
+    def put(self, key, volume):
+        """Store a full resolution [z, y, x] HU volume and its downsampled levels under key. Each level is written slice by slice, so
+           only one downsampled slice is held in memory besides the volume."""
+        nz, ny, nx = volume.shape
+        for level, factor in enumerate(LEVELS):
+            temporary = self._filename(key, level) + '.tmp'
+            out = np.lib.format.open_memmap(temporary, mode='w+', dtype=np.int16, shape=(nz, ny // factor, nx // factor))
+            for z in range(nz):
+                out[z] = volume[z] if factor == 1 else downsample(volume[z], factor)
+            out.flush()
+            del out
+            os.replace(temporary, self._filename(key, level))
+        self.evict(keep=key)
+
+    def load(self, key, level=0):
+        """Return the memory-mapped volume of a cached entry."""
+        self._touch(key)
+        return np.load(self._filename(key, level), mmap_mode='r')
+
+    def evict(self, keep=None):
+        """Remove least recently used entries until the cache is below max_bytes. The entry keep is never removed."""
+        entries = self._entries()
+        total = sum(size for access, size in entries.values())
+        for key in sorted(entries, key=lambda x: entries[x][0]):
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            for name in os.listdir(self.directory):
+                if name.startswith(key + '_L'):
+                    try:
+                        os.remove(os.path.join(self.directory, name))
+                    except OSError as e:
+                        print(f'Could not remove cached volume {name}. Error: {e}')
+            total -= entries[key][1]
+
+    def get(self, examination, level=0):
+        """Return (volume, geometry) of the examination CT at the given pyramid level (0: full resolution, 1: 2x, 2: 4x
+           downsampled), pulling the pixel data through the scripting interface only if it is not already cached."""
+        key, geometry = series_key(examination)
+        if not self.contains(key):
+            volume, geometry = dr.read_image_stack(examination.Series[0].ImageStack)
+            self.put(key, volume)
+        return self.load(key, level), level_geometry(geometry, LEVELS[level])
+
+
+_default_cache = None
+
+
+def get_ct_volume(examination, level=0):
+    """Return (volume, geometry) of the examination CT from the default cache, see CTVolumeCache.get()."""
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = CTVolumeCache()
+    return _default_cache.get(examination, level)